@@ -23,12 +23,31 @@ __author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
 __revision__ = "$Rev$"
 __version__ = "@VERSION@"
 
+from itertools import izip
 import logging
 
-from entry import Entry
+from entry import (
+    Entry,
+    InflectionArray,
+    LazyField,
+    MissingAcronymExpansionError,
+    )
 from config import FIELD_SEPARATORS
+from paren_parser import cartesian
+import escaping
 
 class AcronymEntry(Entry):
+    __slots__ = (
+        'reference',
+        'reference_short',
+        '_sort_as_short',
+        '_typeset_in_text_short',
+        '_typeset_in_index_short',
+        '_sort_as_long',
+        '_typeset_in_text_long',
+        '_typeset_in_index_long',
+        )
+    
     _generated_fields = [
         # The values of REFERENCE are how this entry will be
         # referred to in the text (\co{<reference>}).
@@ -50,14 +69,37 @@ class AcronymEntry(Entry):
 
     # Different constants used for output formatting.
     _label_width = len('typeset_in_index_short')
+
+    # The generated fields needed to look up the entry (see
+    # Index.generate_reference_index()) are set up when the entry is
+    # created, while the rest are set up on first access.
+    _reference_field_map = [
+        ('reference', 'reference'),
+        ('reference_short', 'reference_short'),
+        ]
+
+    _lazy_field_map = [
+        ('sort_as_short', 'reference'),
+        ('typeset_in_text_short', 'typeset'),
+        ('typeset_in_index_short', 'typeset'),
+        ('sort_as_long', 'sort_as_long'),
+        ('typeset_in_text_long', 'typeset_long'),
+        ('typeset_in_index_long', 'typeset_long'),
+        ]
+
+    sort_as_short = LazyField('sort_as_short')
+    typeset_in_text_short = LazyField('typeset_in_text_short')
+    typeset_in_index_short = LazyField('typeset_in_index_short')
+    sort_as_long = LazyField('sort_as_long')
+    typeset_in_text_long = LazyField('typeset_in_text_long')
+    typeset_in_index_long = LazyField('typeset_in_index_long')
     
     def __init__(self, index, parent, acronym=None, indent_level=None,
                  full_form=None, meta=None, alias=None, **rest):
         # Set a couple of defining attributes before calling our base
         # constructor.
-        for attribute in self._generated_fields:
-            setattr(self, attribute, dict.fromkeys([Entry.INFLECTION_SINGULAR,
-                                                    Entry.INFLECTION_PLURAL]))
+        for attribute, variable in self._reference_field_map:
+            setattr(self, attribute, InflectionArray())
             
         # Register this entry in the INDEX, set our PARENT and if we
         # do have a parent, add ourselves to that PARENT's set of
@@ -68,10 +110,27 @@ class AcronymEntry(Entry):
         # here.
         self.alias = alias
 
-        self._setup(acronym, full_form, self._meta, indent_level)
+        # The INDEX_INFLECTION value defines how the entry should be
+        # sorted in the index.  The value is determined by the value
+        # of INDEX.DEFAULT_INFLECTION and the given inflection of the
+        # current entry.
+        self.index_inflection, complement_inflection = \
+            self.get_current_and_complement_inflection(self._meta)
+        
+        self._setup(self._reference_field_map, acronym, full_form,
+                    self._meta, indent_level)
+
+        # Remember the definition, for setting up the lazy fields.
+        self._definition = (acronym, full_form, self._meta, indent_level)
 
-        # To enable a ConceptEntry to refer to an AcronymEntry:
-        self.typeset_in_index = self.typeset_in_index_long
+    # Accessors for the 'typeset_in_index' property (_-prefixed to
+    # force access through the property):
+    def _get_typeset_in_index(self):
+        return self.typeset_in_index_long
+
+    # To enable a ConceptEntry to refer to an AcronymEntry:
+    typeset_in_index = property(_get_typeset_in_index, None, None,
+                                'How this entry is typeset in the index.')
 
     def get_index_entry(self, length, inflection):
         sort_as = getattr(self, 'sort_as_' + length)[inflection]
@@ -80,13 +139,13 @@ class AcronymEntry(Entry):
         
         return '%(sort_as)s@%(typeset_in_index)s' % locals()
 
-    def generate_index_entries(self, page, typeset_page_number=''):
+    def compile_index_template(self):
         inflection = self.index_inflection
         
         if self.META_SORT_AS in self._meta:
             sort_as_long = self._meta[self.META_SORT_AS]
-            logging.debug('Explicit sort key given "%s" (on page %s) => "%s".',
-                         self.sort_as_long[inflection], page, sort_as_long)
+            logging.debug('Explicit sort key given "%s" => "%s".',
+                          self.sort_as_long[inflection], sort_as_long)
         else:
             sort_as_long = self.sort_as_long[inflection]
             
@@ -98,39 +157,34 @@ class AcronymEntry(Entry):
         parent = self.parent
 
         if parent:
-            parent_sort_as_long = parent.sort_as_long[inflection]
+            parent_long = parent.get_index_entry('long', inflection)
+            parent_short = parent.get_index_entry('short', inflection)
             parent_typeset_in_index_long \
                 = parent.typeset_in_index_long[inflection]
 
-            parent_sort_as_short = parent.sort_as_short[inflection]
-            parent_typeset_in_index_short \
-                = parent.typeset_in_index_short[inflection]
+            prefix = '\indexentry{%(parent_long)s!' \
+                     '%(sort_as_long)s@%(typeset_in_index_long)s' % locals()
             
-            yield '\indexentry{' \
-                  '%(parent_sort_as_long)s@%(parent_typeset_in_index_long)s!' \
-                  '%(sort_as_long)s@%(typeset_in_index_long)s' \
-                  '%(typeset_page_number)s}{%(page)s}' % locals()
-
-            yield '\indexentry{' \
-                  '%(parent_sort_as_short)s@%(parent_typeset_in_index_short)s' \
-                  '|see{%(parent_typeset_in_index_long)s}}' \
-                  '{0}' % locals()
+            see_parent = '\indexentry{%(parent_short)s' \
+                         '|see{%(parent_typeset_in_index_long)s}}' \
+                         '{0}' % locals()
             
-            yield '\indexentry{' \
-                  '%(parent_sort_as_short)s@%(parent_typeset_in_index_short)s!' \
-                  '%(sort_as_short)s@%(typeset_in_index_short)s' \
-                  '|see{---, %(typeset_in_index_long)s}}' \
-                  '{0}' % locals()
+            see_long = '\indexentry{%(parent_short)s!' \
+                       '%(sort_as_short)s@%(typeset_in_index_short)s' \
+                       '|see{---, %(typeset_in_index_long)s}}' \
+                       '{0}' % locals()
             
+            return ((True, prefix), (False, see_parent), (False, see_long))
         else:
-            yield '\indexentry{' \
-                  '%(sort_as_long)s@%(typeset_in_index_long)s' \
-                  '%(typeset_page_number)s}' \
-                  '{%(page)s}' % locals()
+            prefix = '\indexentry{' \
+                     '%(sort_as_long)s@%(typeset_in_index_long)s' % locals()
             
-            yield '\indexentry{%(sort_as_short)s@' \
-                  '%(typeset_in_index_short)s|see{%(typeset_in_index_long)s}}' \
-                  '{0}' % locals()
+            see_long = '\indexentry{%(sort_as_short)s@' \
+                       '%(typeset_in_index_short)s' \
+                       '|see{%(typeset_in_index_long)s}}' \
+                       '{0}' % locals()
+
+            return ((True, prefix), (False, see_long))
             
     def generate_internal_macros(self, inflection):
         type_name = self.get_entry_type()
@@ -169,28 +223,16 @@ class AcronymEntry(Entry):
                           for attribute in self._generated_fields]) \
                 + alias_line
         
-    def _setup(self, concept, full_form, meta, indent_level):
-        # Trying to figure out the most appropriate features to
-        # represent a concept entry:
-        (current_inflection, complement_inflection) = \
-            self.get_current_and_complement_inflection(meta)
-        
-        # The INDEX_INFLECTION value defines how the entry should be
-        # sorted in the index.  The value is determined by the value
-        # of INDEX.DEFAULT_INFLECTION and the given inflection of the
-        # current entry.
-        self.index_inflection = current_inflection
-        
-        field_variable_map = [
-            ('reference', 'reference'),
-            ('reference_short', 'reference_short'),
-            ('sort_as_short', 'reference'),
-            ('typeset_in_text_short', 'typeset'),
-            ('typeset_in_index_short', 'typeset'),
-            ('sort_as_long', 'sort_as_long'),
-            ('typeset_in_text_long', 'typeset_long'),
-            ('typeset_in_index_long', 'typeset_long'),
-            ]
+    def _setup(self, field_variable_map, concept, full_form, meta,
+               indent_level):
+        """Set up the generated fields given by FIELD_VARIABLE_MAP.
+        """
+        current_inflection = self.index_inflection
+        complement_inflection = self._complement_inflection[current_inflection]
+
+        # The full form is only needed by some of the fields.
+        use_full_form = 'typeset_long' in [variable for field, variable
+                                           in field_variable_map]
         
         if indent_level == 0:
             # Main entry.
@@ -200,10 +242,11 @@ class AcronymEntry(Entry):
             reference, typeset = self.format_reference_and_typeset(concept)
             reference_short = [] # Only used for sub-entries.
 
-            sort_as_long, typeset_long \
-                = self.format_reference_and_typeset(full_form) 
-            if self.META_SORT_AS in self._meta:
-                sort_as_long = [self._meta[self.META_SORT_AS]]
+            if use_full_form:
+                sort_as_long, typeset_long \
+                    = self.format_reference_and_typeset(full_form) 
+                if self.META_SORT_AS in self._meta:
+                    sort_as_long = [self._meta[self.META_SORT_AS]]
 
             for field, variable in field_variable_map:
                 value = ' '.join(locals()[variable])
@@ -217,9 +260,11 @@ class AcronymEntry(Entry):
                 reference, typeset = \
                     self.get_complement_inflections(reference, typeset,
                                                     current_inflection)
-                sort_as_long, typeset_long = \
-                    self.get_complement_inflections(sort_as_long, typeset_long,
-                                                    current_inflection)
+                if use_full_form:
+                    sort_as_long, typeset_long = \
+                        self.get_complement_inflections(sort_as_long,
+                                                        typeset_long,
+                                                        current_inflection)
 
             for field, variable in field_variable_map:
                 value = ' '.join(locals()[variable])
@@ -227,16 +272,22 @@ class AcronymEntry(Entry):
                 
         else:
             # Sub-entry.
-            if full_form is None:
+            if not use_full_form:
+                full_form = None
+            elif full_form is None:
                 full_form = concept
                 
             for inflection in (current_inflection, complement_inflection):
-                for field, value \
-                    in self.expand_sub_entry(concept, inflection,
-                                             current_inflection,
-                                             field_variable_map,
-                                             full_form).items():
-                    value = self.unescape(value.strip(), FIELD_SEPARATORS + '-')
+                fields, values = zip(*self.expand_sub_entry(
+                    concept, inflection, current_inflection,
+                    field_variable_map, full_form).items())
+                
+                # Unescape all the fields at once.
+                values = escaping.unescape_all([value.strip()
+                                                for value in values],
+                                               FIELD_SEPARATORS + '-')
+                
+                for field, value in izip(fields, values):
                     getattr(self, field)[inflection] = value
                     
         if current_inflection == Entry.INFLECTION_NONE:
@@ -245,3 +296,5 @@ class AcronymEntry(Entry):
                 [field for field, variable in field_variable_map]):
                 getattr(self, attribute)[inflection] = \
                     getattr(self, attribute)[Entry.INFLECTION_NONE]
+
+        self.intern_fields(field_variable_map)
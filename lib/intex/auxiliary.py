@@ -0,0 +1,525 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+from array import array
+from collections import deque
+from itertools import izip
+import errno
+import fcntl
+import logging
+import mmap
+import multiprocessing
+import os
+import re
+import stat
+import time
+
+from config import INTEX_DEFAULT_INDEX
+import escaping
+
+# The beginnings of the lines of .aux files that InTeX handles: the
+# index entries written to the InTeX index, and the inclusion of other
+# .aux files (by \include).
+RECORD_MARKER = '\\@writefile{%s}{\\indexentry{' % (INTEX_DEFAULT_INDEX)
+INPUT_MARKER = '\\@input{'
+
+# A record at the start of a line (after the first line).  The key,
+# page-number hint, and page of most records are found by the first
+# alternative.  For the rest (with braces or escapes in their keys),
+# the rest of the line is parsed by parse_record().
+_line_re = re.compile(r'\n%s(?:([^{}\\\n|]*)(\|[^{}\\\n|]*)?\}\{(\w+)\}\}'
+                      r'|([^\n]*))' % (re.escape(RECORD_MARKER)))
+
+# The rest of a record, after the key.
+_page_re = re.compile(r'\{(\w+)\}\}')
+
+# A whole record, for keys with unbalanced braces (the key extends to
+# the last page that follows it).
+_record_re = re.compile(r'(?P<key>.*)\}\{(?P<page>\w+)\}\}')
+
+# A key with braces nested at most two levels deep, and the braces
+# (and escaped characters) of keys with more deeply nested braces.
+_key_re = re.compile(r'(?:[^{}\\]+|\\.|\{(?:[^{}\\]+|\\.'
+                     r'|\{(?:[^{}\\]+|\\.)*\})*\})*')
+_brace_re = re.compile(r'\\.|[{}]')
+
+_input_re = re.compile(r'\\@input\{(?P<filename>.*\.aux)\}')
+
+# The number of seconds between the checks for more output, when .aux
+# files are followed as they are written (see follow_auxiliary()).
+FOLLOW_INTERVAL = 0.1
+
+# The number of bytes read at a time from followed files.
+_CHUNK_SIZE = 2 ** 16
+
+def _find_line_start(data, marker, start):
+    """Return the position of the first occurrence of MARKER at the
+    start of a line in DATA, at or after START, or -1 if there is none.
+    """
+    position = data.find(marker, start)
+    
+    while (position > 0) and (data[position - 1] != '\n'):
+        position = data.find(marker, (position + 1))
+
+    return position
+
+def _get_key_end(line):
+    """Return the position of the brace that closes the key at the start
+    of LINE (the brace matching the one in front of LINE), or -1.
+    """
+    end = _key_re.match(line).end()
+    if line[end:(end + 1)] == '}':
+        return end
+
+    depth = 0
+    
+    for match in _brace_re.finditer(line):
+        token = match.group()
+        if token == '{':
+            depth += 1
+        elif token == '}':
+            if not depth:
+                return match.start()
+            depth -= 1
+
+    return -1
+
+def parse_record(line):
+    """Return the (KEY, PAGE, TYPESET_PAGE_NUMBER) record of LINE, the
+    rest of a line of an .aux file after RECORD_MARKER, or None if LINE
+    is not a valid record.  TYPESET_PAGE_NUMBER is the page-number
+    formatting hint of the key (as in |textbf), or ''.
+    """
+    end = _get_key_end(line)
+
+    match = (end >= 0) and _page_re.match(line, (end + 1))
+    if match:
+        key, page = line[:end], match.group(1)
+    else:
+        match = _record_re.match(line)
+        if not match:
+            return None
+        key, page = match.groups()
+
+    # Keep track of any page-number typesetting hints.
+    if '|' in key:
+        if '\\|' in key:
+            parts = escaping.rsplit(key, '|', 1)
+        else:
+            parts = key.rsplit('|', 1)
+            
+        if len(parts) > 1:
+            return parts[0], page, '|' + parts[1]
+            
+    # Do _not_ try to convert page into an integer, it may occurr as
+    # roman numerals.
+    return key, page, ''
+
+def _get_line(data, start):
+    """Return the rest of the line in DATA from START.
+    """
+    stop = data.find('\n', start)
+    if stop < 0:
+        stop = len(data)
+
+    return data[start:stop]
+
+def _scan(data, recursive):
+    """Generate the records (see parse_record()) in DATA, the contents
+    of an .aux file, and in the .aux files it includes (or, unless
+    RECURSIVE is true, the names of those files), in order.
+    """
+    # The (few) lines that include other files are found first, and
+    # handled when the records are passed.
+    includes = []
+    
+    include = _find_line_start(data, INPUT_MARKER, 0)
+    while include >= 0:
+        includes.append(include)
+        include = _find_line_start(data, INPUT_MARKER, (include + 1))
+
+    includes.append(len(data))
+    includes.reverse()
+
+    if data[:len(RECORD_MARKER)] == RECORD_MARKER:
+        result = parse_record(_get_line(data, len(RECORD_MARKER)))
+        if result is not None:
+            yield result
+    
+    for match in _line_re.finditer(data):
+        # Handle recursive \@input-statements within .aux files.
+        while includes[-1] < match.start():
+            for result in _scan_input(_get_line(data, includes.pop()),
+                                      recursive):
+                yield result
+                
+        key, typeset_page_number, page, rest = match.groups()
+        
+        if rest is None:
+            yield key, page, (typeset_page_number or '')
+        else:
+            result = parse_record(rest)
+            if result is not None:
+                yield result
+
+    for include in reversed(includes[1:]):
+        for result in _scan_input(_get_line(data, include), recursive):
+            yield result
+
+def _scan_input(line, recursive):
+    """Generate the records of the file included by LINE, an
+    \\@input-statement (if it includes an .aux file), or, unless
+    RECURSIVE is true, the name of the file.
+    """
+    match = _input_re.match(line)
+    if not match:
+        return
+    
+    if recursive:
+        for result in scan_auxiliary(match.group('filename')):
+            yield result
+    else:
+        yield match.group('filename')
+
+def scan_auxiliary(filename, recursive=True):
+    """Generate the InTeX records of the .aux file FILENAME, and of the
+    .aux files it includes (by \\@input), in document order, as
+    (KEY, PAGE, TYPESET_PAGE_NUMBER) tuples (see parse_record()).  If
+    RECURSIVE is false, the names of the included files are generated
+    (as strings) instead of their records.
+
+    The file is memory-mapped, and only the lines that start with
+    RECORD_MARKER or INPUT_MARKER are looked at.  Like LaTeX, missing
+    included files are skipped.
+    """
+    try:
+        stream = open(filename, 'rb')
+    except IOError, e:
+        logging.warn('Unable to read the LaTeX auxiliary file "%s" (%s).',
+                     filename, e.strerror)
+        return
+
+    logging.info('Reading "%s".', filename)
+
+    try:
+        try:
+            data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError):
+            # Empty files (and files that cannot be mapped, like
+            # pipes) are read instead.
+            data = stream.read()
+
+        try:
+            for result in _scan(data, recursive):
+                yield result
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+    finally:
+        stream.close()
+
+class _Tail(object):
+    """A file that is read as it is being written.  Unless it is a FIFO,
+    the file is not read until it has been modified at or after SINCE
+    (or until it is read for the last time), as LaTeX reads the .aux
+    files of the previous run before it overwrites them.
+    """
+    def __init__(self, filename, since):
+        self.filename = filename
+        self.since = since
+        
+        self._descriptor = None
+        self._fifo = False
+
+        # The complete lines read, but not yet returned, and the
+        # incomplete line that follows them.
+        self._lines = deque()
+        self._rest = ''
+
+        # Whether the writer of the FIFO has closed it.
+        self.finished = False
+
+    def _open(self, final):
+        try:
+            status = os.stat(self.filename)
+        except OSError:
+            return False
+        
+        fifo = stat.S_ISFIFO(status.st_mode)
+        if not (fifo or final or (status.st_mtime >= self.since)):
+            return False
+
+        # Opening a FIFO waits for the writer to open it.
+        self._descriptor = os.open(self.filename, os.O_RDONLY)
+        self._fifo = fifo
+        
+        if fifo:
+            flags = fcntl.fcntl(self._descriptor, fcntl.F_GETFL)
+            fcntl.fcntl(self._descriptor, fcntl.F_SETFL,
+                        (flags | os.O_NONBLOCK))
+
+        return True
+    
+    def read(self, final=False):
+        """Read what has been written to the file since the last time
+        (unless it was not modified since SINCE, and this is not the
+        FINAL read).  Return true if there is anything that has not been
+        returned by get_line().
+        """
+        if (self._descriptor is not None) or self._open(final):
+            while not self.finished:
+                try:
+                    chunk = os.read(self._descriptor, _CHUNK_SIZE)
+                except OSError, e:
+                    if e.errno == errno.EAGAIN:
+                        break
+                    raise
+
+                if not chunk:
+                    self.finished = self._fifo
+                    break
+
+                lines = (self._rest + chunk).split('\n')
+                self._rest = lines.pop()
+                self._lines.extend(lines)
+                
+        return bool(self._lines or self._rest)
+
+    def get_line(self, final=False):
+        """Return the next line read (without its newline), or None if
+        there is none.  If FINAL is true, an incomplete last line is
+        returned as well.
+        """
+        if self._lines:
+            return self._lines.popleft()
+
+        if final and self._rest:
+            line, self._rest = self._rest, ''
+            return line
+
+        return None
+
+    def close(self):
+        if self._descriptor is not None:
+            os.close(self._descriptor)
+            self._descriptor = None
+
+def _follow(tail, is_closed, interval):
+    """Generate the records of TAIL (a _Tail), and of the files it
+    includes, as they are written, until IS_CLOSED() returns true,
+    checking for more every INTERVAL seconds.
+    """
+    try:
+        while True:
+            # Everything written before the file was closed is read
+            # after it.
+            final = is_closed()
+            tail.read(final)
+            final = final or tail.finished
+
+            line = tail.get_line(final)
+            while line is not None:
+                if line.startswith(RECORD_MARKER):
+                    result = parse_record(line[len(RECORD_MARKER):])
+                    if result is not None:
+                        yield result
+                        
+                elif line.startswith(INPUT_MARKER):
+                    match = _input_re.match(line)
+                    if match:
+                        # LaTeX is done with an included file once it
+                        # writes past the \@input-statement.
+                        included = _Tail(match.group('filename'), tail.since)
+                        is_written = lambda: (tail.read() or tail.finished
+                                              or is_closed())
+                        
+                        for result in _follow(included, is_written,
+                                              interval):
+                            yield result
+                            
+                line = tail.get_line(final)
+
+            if final:
+                return
+
+            time.sleep(interval)
+    finally:
+        tail.close()
+
+def follow_auxiliary(filename, is_done, since=None,
+                     interval=FOLLOW_INTERVAL):
+    """Generate the InTeX records of the .aux file FILENAME, and of the
+    .aux files it includes, in document order (see scan_auxiliary()),
+    as they are written by LaTeX, until IS_DONE() returns true (when
+    LaTeX has exited).  FILENAME may also be a FIFO, which is read until
+    its writer closes it.  Every INTERVAL seconds, the files are checked
+    for more output.
+
+    Files that have not been modified since SINCE (by default, now) are
+    left from an earlier run.  They are only read if LaTeX does not
+    overwrite them: if it is done with them (or has exited) before.
+    """
+    if since is None:
+        since = time.time()
+
+    return _follow(_Tail(filename, since), is_done, interval)
+
+def resolve_records(index, records):
+    """Generate the resolved records of RECORDS (see parse_record())
+    against the reference index of INDEX: (KEY, PAGE,
+    TYPESET_PAGE_NUMBER, PHRASE, POSITION, INFLECTION) tuples, where
+    PHRASE is the reference phrase that KEY refers to (see
+    Index.resolve_reference()), and POSITION and INFLECTION give the
+    entry and inflection of PHRASE.  If KEY is not found, POSITION is
+    -1 (and PHRASE and INFLECTION are empty).
+    """
+    resolve = index.resolve_reference
+    
+    for key, page, typeset_page_number in records:
+        resolved = resolve(key)
+        if resolved is None:
+            yield key, page, typeset_page_number, '', -1, ''
+        else:
+            phrase, (entry, inflection) = resolved
+            yield (key, page, typeset_page_number, phrase, entry.position,
+                   inflection)
+
+# The index that the records of included files are resolved against,
+# in the worker processes of resolve_auxiliary().
+_index = None
+
+def _set_index(index):
+    global _index
+    _index = index
+
+def _encode(records):
+    """Return the resolved RECORDS (see resolve_records()) encoded as
+    columns that are cheap to pass between processes, and to cache: the
+    positions as the bytes of an array, and the other fields joined by
+    newlines (which they cannot contain).
+    """
+    columns = zip(*records)
+    if not columns:
+        return ('', '', '', '', '', '')
+    
+    keys, pages, typeset_page_numbers, phrases, positions, inflections = \
+          columns
+    
+    return ('\n'.join(keys), '\n'.join(pages),
+            '\n'.join(typeset_page_numbers), '\n'.join(phrases),
+            array('i', positions).tostring(), '\n'.join(inflections))
+
+def _resolve_file(filename):
+    return _encode(resolve_records(_index, scan_auxiliary(filename)))
+
+def _decode(columns):
+    """Return an iterator over the resolved records encoded in COLUMNS
+    (see _encode()).
+    """
+    keys, pages, typeset_page_numbers, phrases, positions, inflections = \
+          columns
+    
+    decoded = array('i')
+    decoded.fromstring(positions)
+    
+    return izip(keys.split('\n'), pages.split('\n'),
+                typeset_page_numbers.split('\n'), phrases.split('\n'),
+                decoded, inflections.split('\n'))
+
+def resolve_auxiliary(index, filename, jobs=1, cache=None):
+    """Generate the resolved records (see resolve_records()) of the
+    .aux file FILENAME, and of the files it includes, in document
+    order.  If JOBS is larger than one, the included files (typically,
+    the chapters of a book) are scanned and resolved in (at most) JOBS
+    worker processes.  If CACHE (an IndexCache) is given, the resolved
+    records of each included file are cached, and reused as long as
+    neither the file nor INDEX changes.
+    """
+    if (jobs <= 1) and (cache is None):
+        for result in resolve_records(index, scan_auxiliary(filename)):
+            yield result
+        return
+
+    parts = list(scan_auxiliary(filename, recursive=False))
+    filenames = [part for part in parts if isinstance(part, str)]
+
+    paths = dict()
+    cached = dict()
+    
+    if cache is not None:
+        for name in filenames:
+            path = cache.get_records_path(name, index)
+            if path is not None:
+                paths[name] = path
+                columns = cache.load(path)
+                if columns is not None:
+                    cached[name] = columns
+
+        logging.info('Reused the records of %d of %d included file(s).',
+                     len(cached), len(filenames))
+        
+    pending = [name for name in filenames if name not in cached]
+
+    jobs = min(jobs, len(pending))
+    if jobs > 1:
+        # Set up the lookup of misspelled keys once, instead of in
+        # each worker (see Index.resolve_reference()).
+        index._get_normalized_references()
+
+        # The workers get (a copy of) the index when they are started.
+        pool = multiprocessing.Pool(jobs, _set_index, (index, ))
+        results = pool.imap(_resolve_file, pending)
+    else:
+        pool = None
+        results = (_encode(resolve_records(index, scan_auxiliary(name)))
+                   for name in pending)
+
+    try:
+        for part in parts:
+            if not isinstance(part, str):
+                for result in resolve_records(index, (part, )):
+                    yield result
+                continue
+            
+            columns = cached.get(part)
+            if columns is None:
+                columns = results.next()
+                if part in paths:
+                    cache.store(paths[part], columns)
+                        
+            for result in _decode(columns):
+                yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+def main():
+    """Module mainline (for standalone execution).
+    """
+    pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+import cPickle
+import errno
+import glob
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from auxiliary import INPUT_MARKER
+import config
+from index import Index
+from validation import check_text
+
+CACHE_SUFFIX = '.pickle'
+LATEST_SUFFIX = '.latest'
+PROBLEMS_SUFFIX = '.problems'
+RECORDS_SUFFIX = '.records'
+STATUS_SUFFIX = '.status'
+TEMPORARY_SUFFIX = '.tmp'
+
+# The suffixes of the files that IndexCache.prune() may remove.
+_suffixes = (CACHE_SUFFIX, LATEST_SUFFIX, PROBLEMS_SUFFIX, RECORDS_SUFFIX,
+             STATUS_SUFFIX, TEMPORARY_SUFFIX)
+
+def get_default_cache_directory():
+    """Return the default location of the parse cache.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') \
+           or os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(base, 'intex')
+
+def _get_code_digest():
+    """Return a digest of the configuration tokens and the source code
+    of this package (except its tests).  Any change to either
+    invalidates all cached indices.
+    """
+    digest = hashlib.sha1()
+
+    digest.update(__version__)
+    digest.update(sys.version)
+
+    for name in sorted(dir(config)):
+        if name.isupper():
+            digest.update('%s=%r\n' % (name, getattr(config, name)))
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for filename in sorted(glob.glob(os.path.join(directory, '*.py'))):
+        if not os.path.basename(filename).startswith('test_'):
+            digest.update(open(filename, 'rb').read())
+
+    return digest.hexdigest()
+
+class IndexCache(object):
+    """An on-disk cache of fully built indices, including their
+    reference tables.  Each cached index is keyed by the content of
+    its .itx file, the version of InTeX, and the configuration
+    tokens.
+
+    For each .itx file, the cache also remembers where the latest
+    index built from it was stored.  When the file has been edited,
+    that index is used to re-parse only the changed entries, and is
+    then removed.  Likewise, only the latest problems of each .itx
+    file, and records of each .aux file, are kept.  Entries that are
+    no longer used, such as those of files that have been removed, are
+    removed by prune().
+    """
+    def __init__(self, directory=None):
+        self._directory = directory or get_default_cache_directory()
+        self._code_digest = _get_code_digest()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _get_path(self, text, suffix=CACHE_SUFFIX):
+        digest = hashlib.sha1(self._code_digest)
+        digest.update(text)
+
+        return os.path.join(self._directory, digest.hexdigest() + suffix)
+
+    def _get_latest_path(self, filename, suffix=LATEST_SUFFIX):
+        digest = hashlib.sha1(self._code_digest)
+        digest.update(os.path.abspath(filename))
+
+        return os.path.join(self._directory, digest.hexdigest() + suffix)
+
+    def load(self, path):
+        """Return the object (usually an index) cached in PATH, or None
+        if there is no usable cache entry.
+        """
+        try:
+            stream = open(path, 'rb')
+        except IOError:
+            return None
+
+        try:
+            try:
+                value = cPickle.load(stream)
+            finally:
+                stream.close()
+        except Exception, e:
+            # A corrupt entry is discarded, and will be rebuilt.
+            logging.warn('Discarding corrupt cache entry "%s" (%s).', path, e)
+            self._remove(path)
+            return None
+
+        # The modification time tells prune() when the entry was last
+        # used.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return value
+
+    def store(self, path, index):
+        """Atomically store INDEX (or any other picklable object) in
+        PATH.
+        """
+        try:
+            if not os.path.isdir(self._directory):
+                os.makedirs(self._directory)
+
+            descriptor, temporary = tempfile.mkstemp(dir=self._directory,
+                                                     suffix=TEMPORARY_SUFFIX)
+            stream = os.fdopen(descriptor, 'wb')
+            try:
+                cPickle.dump(index, stream, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                stream.close()
+
+            os.rename(temporary, path)
+        except (IOError, OSError), e:
+            logging.warn('Unable to cache the index in "%s" (%s).', path, e)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def _set_latest(self, latest_path, latest, path):
+        """Remember, in LATEST_PATH, that PATH is the latest cache entry
+        of a file, and remove the entry LATEST that it supersedes.
+        """
+        if latest == path:
+            return
+
+        if latest is not None:
+            self._remove(latest)
+
+        self.store(latest_path, path)
+
+    def prune(self, max_age):
+        """Remove the cache entries that have not been used for MAX_AGE
+        seconds, and return the number of entries removed.
+        """
+        try:
+            names = os.listdir(self._directory)
+        except OSError:
+            return 0
+
+        limit = time.time() - max_age
+        removed = 0
+        
+        for name in names:
+            if os.path.splitext(name)[1] not in _suffixes:
+                continue
+
+            path = os.path.join(self._directory, name)
+            try:
+                if os.path.getmtime(path) > limit:
+                    continue
+                os.remove(path)
+            except OSError:
+                continue
+
+            removed += 1
+
+        return removed
+
+    def get_index(self, filename):
+        """Return the index defined in FILENAME, with its reference
+        index generated, either from the cache or by parsing the file.
+        """
+        stream = open(filename, 'rb')
+        text = stream.read()
+        stream.close()
+
+        path = self._get_path(text)
+        index = self.load(path)
+
+        latest_path = self._get_latest_path(filename)
+        latest = self.load(latest_path)
+        
+        if index is not None:
+            self.hits += 1
+            logging.info('Cache hit for "%s" (%s).', filename, path)
+
+            self._set_latest(latest_path, latest, path)
+            
+            index._filename = filename
+            return index
+
+        self.misses += 1
+        logging.info('Cache miss for "%s".', filename)
+
+        # If an earlier version of the file was cached, only the
+        # changed entries need to be parsed.
+        if latest is not None:
+            previous = self.load(latest)
+        else:
+            previous = None
+
+        index = Index.from_string(text, filename, previous)
+
+        if previous is not None:
+            index.update_reference_index(previous)
+        else:
+            index.generate_reference_index()
+
+        self.store(path, index)
+        self._set_latest(latest_path, latest, path)
+
+        return index
+
+    def _get_content_digest(self, filename):
+        """Return the digest of the contents of FILENAME, and whether it
+        includes other files, or None if it cannot be read.  The digest
+        is remembered together with the size and modification time of
+        the file, and as long as they are unchanged, the file is not
+        read again.
+        """
+        try:
+            status = os.stat(filename)
+        except OSError:
+            return None
+
+        path = self._get_latest_path(filename, STATUS_SUFFIX)
+        known = self.load(path)
+        if (known is not None) \
+               and (known[:2] == (status.st_size, status.st_mtime)):
+            return known[2:]
+
+        try:
+            stream = open(filename, 'rb')
+            try:
+                text = stream.read()
+            finally:
+                stream.close()
+        except IOError:
+            return None
+
+        known = (status.st_size, status.st_mtime,
+                 hashlib.sha1(text).hexdigest(), (INPUT_MARKER in text))
+        self.store(path, known)
+
+        return known[2:]
+        
+    def get_records_path(self, filename, index):
+        """Return the path that the resolved records of the .aux file
+        FILENAME, against INDEX, are cached in (see resolve_auxiliary()),
+        or None if they should not be cached.  The key is the contents of
+        FILENAME and the text of INDEX.  Files that include other files
+        are not cached.
+        """
+        known = self._get_content_digest(filename)
+        if (known is None) or (index.digest is None):
+            return None
+
+        content_digest, includes = known
+        if includes:
+            return None
+        
+        digest = hashlib.sha1(self._code_digest)
+        digest.update(index.digest)
+        digest.update(content_digest)
+
+        path = os.path.join(self._directory,
+                            digest.hexdigest() + RECORDS_SUFFIX)
+
+        latest_path = self._get_latest_path(filename,
+                                            RECORDS_SUFFIX + LATEST_SUFFIX)
+        self._set_latest(latest_path, self.load(latest_path), path)
+        
+        return path
+    
+    def get_problems(self, text, filename):
+        """Return the problems found in TEXT, the contents of the .itx
+        file FILENAME (see check_text()), either from the cache or by
+        checking the text.
+        """
+        path = self._get_path(text, PROBLEMS_SUFFIX)
+        problems = self.load(path)
+
+        if problems is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+            # The problems are cached without the name of the file, as
+            # the key only depends on its contents.
+            problems = [problem[1:] for problem in check_text(text, filename)]
+            self.store(path, problems)
+
+        latest_path = self._get_latest_path(filename,
+                                            PROBLEMS_SUFFIX + LATEST_SUFFIX)
+        self._set_latest(latest_path, self.load(latest_path), path)
+
+        return [((filename, ) + problem) for problem in problems]
+
+def main():
+    """Module mainline (for standalone execution).
+    """
+    pass
+
+if __name__ == "__main__":
+    main()
@@ -23,13 +23,23 @@ __author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
 __revision__ = "$Rev$"
 __version__ = "@VERSION@"
 
+from itertools import izip
 import logging
 
 from config import FIELD_SEPARATORS
 from paren_parser import cartesian
-from entry import Entry
+import escaping
+from entry import Entry, InflectionArray, LazyField
 
 class ConceptEntry(Entry):
+    __slots__ = (
+        'reference',
+        'reference_short',
+        '_typeset_in_text',
+        '_typeset_in_index',
+        '_index_keys',
+        )
+    
     _generated_fields = [
         # The values of REFERENCE are how this entry will be referred
         # to in the text (\co{<reference>}).
@@ -58,17 +68,33 @@ class ConceptEntry(Entry):
         Entry.INFLECTION_SINGULAR_CAPITALIZED,
         Entry.INFLECTION_PLURAL_CAPITALIZED,
         )
+
+    # The generated fields needed to look up the entry (see
+    # Index.generate_reference_index()) are set up when the entry is
+    # created, while the rest are set up on first access.
+    _reference_field_map = [
+        ('reference', 'reference'),
+        ('reference_short', 'reference'),
+        ]
+
+    _lazy_field_map = [
+        ('typeset_in_text', 'typeset'),
+        ('typeset_in_index', 'typeset'),
+        ]
+
+    typeset_in_text = LazyField('typeset_in_text')
+    typeset_in_index = LazyField('typeset_in_index')
+
+    # The generated fields that have capitalized versions.
+    _capitalized_fields = ('reference', 'reference_short', 'typeset_in_text')
     
     def __init__(self, index, parent, concept=None, indent_level=None,
                  plural=None, index_as=None, sort_as=None, meta=None,
                  alias=None, **rest):
         # Set a couple of defining attributes before calling our base
         # constructor.
-        for attribute in self._generated_fields:
-            setattr(self, attribute,
-                    dict.fromkeys([Entry.INFLECTION_SINGULAR,
-                                   Entry.INFLECTION_PLURAL,
-                                   ]))
+        for attribute, variable in self._reference_field_map:
+            setattr(self, attribute, InflectionArray())
         
         # Call the base constructor.
         Entry.__init__(self, index, parent, meta)
@@ -81,37 +107,95 @@ class ConceptEntry(Entry):
             concept = self.unescape(concept.strip())
         else:
             concept = ''
-            
-        self._setup(concept, self._meta, indent_level)
+
+        # The INDEX_INFLECTION value defines how the entry should be
+        # sorted in the index.  The value is determined by the value
+        # of INDEX.DEFAULT_INFLECTION and the given inflection of the
+        # current entry.
+        self.index_inflection, complement_inflection = \
+            self.get_current_and_complement_inflection(self._meta)
+        
+        self._setup(self._reference_field_map, concept, self._meta,
+                    indent_level)
+
+        # Remember the definition, for setting up the lazy fields.
+        self._definition = (concept, self._meta, indent_level)
+        
+    def get_index_key(self, inflection):
+        """Return the SORT_AS@TYPESET_IN_INDEX key of this entry, in the
+        given INFLECTION, prefixed by the keys of its ancestors (the
+        way MakeIndex expects sub-entries).  The keys are computed on
+        first use, and then remembered.
+        """
+        try:
+            keys = self._index_keys
+        except AttributeError:
+            keys = self._index_keys = InflectionArray()
+
+        key = keys[inflection]
+        if key is not None:
+            return key
+        
+        if self.META_SORT_AS in self._meta:
+            sort_as = self._meta[self.META_SORT_AS]
+            logging.info('Explicit parent sort key given "%s" => "%s".',
+                         self.reference[inflection], sort_as)
+        else:
+            sort_as = self.reference[inflection]
+
+        # Avoid erroneous typesetting of explicit hyphenation hints.
+        key = '%s@%s' % (sort_as,
+                         self.unescape(self.typeset_in_index[inflection], '-'))
+
+        parent = self.parent
+        if parent is not None:
+            key = '%s!%s' % (parent.get_index_key(inflection), key)
+
+        keys[inflection] = key
+        
+        return key
         
-    def generate_index_entries(self, page, typeset_page_number=''):
+    def get_see_line(self, target):
         inflection = self.index_inflection
 
         if self.META_SORT_AS in self._meta:
             sort_as = self._meta[self.META_SORT_AS]
-            logging.info('Explicit sort key given "%s" (on page %s) => "%s".',
-                         self.reference[inflection], page, sort_as)
         else:
             sort_as = self.reference[inflection]
             
         typeset_in_index = self.typeset_in_index[inflection]
+        orig_typeset_in_index = target.typeset_in_index[inflection]
+            
+        return '\indexentry{%(sort_as)s@' \
+               '%(typeset_in_index)s|see{%(orig_typeset_in_index)s}}' \
+               '{0}' % locals()
+        
+    def compile_index_template(self):
+        inflection = self.index_inflection
 
         # If this is an alias entry, the index entries are affected.
         # Generate the index entries accordingly.
         if self.alias:
-            concept, _inflection = self.index.references[self.alias]
-            for entry in concept.generate_index_entries(page,
-                                                        typeset_page_number):
-                yield entry
-
-            orig_typeset_in_index = concept.typeset_in_index[inflection]
+            # Aliases that could not be resolved have been reported
+            # by Index.resolve_aliases().
+            if self not in self.index.aliases:
+                return ()
             
-            yield '\indexentry{%(sort_as)s@' \
-                  '%(typeset_in_index)s|see{%(orig_typeset_in_index)s}}' \
-                  '{0}' % locals()
-                
-            return                   # Skip the regular index entries.
+            concept, see_lines = self.index.aliases[self]
+            
+            # Skip the regular index entries.
+            return concept.get_index_template() \
+                   + tuple((False, line) for line in see_lines)
         
+        if self.META_SORT_AS in self._meta:
+            sort_as = self._meta[self.META_SORT_AS]
+            logging.info('Explicit sort key given "%s" => "%s".',
+                         self.reference[inflection], sort_as)
+        else:
+            sort_as = self.reference[inflection]
+            
+        typeset_in_index = self.typeset_in_index[inflection]
+
         if self.META_COMMENT in self._meta:
             comment = ' %s' % (self._meta[self.META_COMMENT], )
         else:
@@ -120,32 +204,20 @@ class ConceptEntry(Entry):
         parent = self.parent
 
         if  not parent is None:
-            if self.META_SORT_AS in parent._meta:
-                parent_sort_as = parent._meta[self.META_SORT_AS]
-                logging.info('Explicit parent sort key given "%s" '
-                             '(on page %s) => "%s".',
-                             parent.reference[inflection], page, parent_sort_as)
-            else:
-                parent_sort_as = parent.reference[inflection]
-
-            # Avoid erroneous typesetting of explicit hyphenation
-            # hints.
-            parent_typeset_in_index = self.unescape(
-                parent.typeset_in_index[inflection], '-')
-            #parent_typeset_in_index = parent.typeset_in_index[inflection]
+            # The keys of all the ancestors, down to the parent.
+            parent_key = parent.get_index_key(inflection)
             
-            yield '\indexentry{' \
-                  '%(parent_sort_as)s@%(parent_typeset_in_index)s!' \
-                  '%(sort_as)s@%(typeset_in_index)s%(comment)s' \
-                  '%(typeset_page_number)s}{%(page)s}' % locals()
+            prefix = '\indexentry{%(parent_key)s!' \
+                     '%(sort_as)s@%(typeset_in_index)s%(comment)s' % locals()
         else:
             # Avoid erroneous typesetting of explicit hyphenation
             # hints.
             typeset_in_index = self.unescape(typeset_in_index, '-')
             
-            yield '\indexentry{%(sort_as)s@%(typeset_in_index)s%(comment)s' \
-                  '%(typeset_page_number)s}{%(page)s}' \
-                  % locals()
+            prefix = '\indexentry{%(sort_as)s@%(typeset_in_index)s' \
+                     '%(comment)s' % locals()
+
+        return ((True, prefix), )
 
     def generate_internal_macros(self, inflection):
         type_name = self.get_entry_type()
@@ -191,23 +263,11 @@ class ConceptEntry(Entry):
                           for fields in line_fields]) \
                 + alias_line
     
-    def _setup(self, concept, meta, indent_level):
-        # Trying to figure out the most appropriate features to
-        # represent a concept entry:
-        (current_inflection, complement_inflection) = \
-            self.get_current_and_complement_inflection(meta)
-            
-        # The INDEX_INFLECTION value defines how the entry should be
-        # sorted in the index.  The value is determined by the value
-        # of INDEX.DEFAULT_INFLECTION and the given inflection of the
-        # current entry.
-        self.index_inflection = current_inflection
-
-        attribute_variable_map = [
-            ('reference', 'reference'),
-            ('reference_short', 'reference'),
-            ('typeset_in_text', 'typeset'),
-            ('typeset_in_index', 'typeset')]
+    def _setup(self, attribute_variable_map, concept, meta, indent_level):
+        """Set up the generated fields given by ATTRIBUTE_VARIABLE_MAP.
+        """
+        current_inflection = self.index_inflection
+        complement_inflection = self._complement_inflection[current_inflection]
         
         if indent_level == 0:
             # If CONCEPT, then the current entry is a main entry.
@@ -240,17 +300,23 @@ class ConceptEntry(Entry):
                                              attribute_variable_map).items():
                     getattr(self, attribute)[inflection] = value
                     
-        for (inflection, attribute) in cartesian(
-            (Entry.INFLECTION_SINGULAR, Entry.INFLECTION_PLURAL, ),
-            [attribute for (attribute, variable) in attribute_variable_map]):
-            
-            concept = getattr(self, attribute)[inflection]
-            getattr(self, attribute)[inflection] \
-                = self.unescape(concept.strip(), FIELD_SEPARATORS + '-')
-
+        attributes = [attribute for (attribute, variable)
+                      in attribute_variable_map]
+        
+        for inflection in (Entry.INFLECTION_SINGULAR, Entry.INFLECTION_PLURAL):
             if current_inflection == Entry.INFLECTION_NONE:
-                getattr(self, attribute)[inflection] = \
-                    getattr(self, attribute)[Entry.INFLECTION_NONE]
+                for attribute in attributes:
+                    getattr(self, attribute)[inflection] = \
+                        getattr(self, attribute)[Entry.INFLECTION_NONE]
+                continue
+
+            # Unescape all the fields at once.
+            values = escaping.unescape_all(
+                [getattr(self, attribute)[inflection].strip()
+                 for attribute in attributes], FIELD_SEPARATORS + '-')
+            
+            for attribute, value in izip(attributes, values):
+                getattr(self, attribute)[inflection] = value
 
         # Create capitalized versions of the different inflections.
         for (inflection, attribute) \
@@ -260,7 +326,8 @@ class ConceptEntry(Entry):
                               ),
                              [attribute
                               for attribute, variable \
-                              in attribute_variable_map[:3]]):
+                              in attribute_variable_map
+                              if attribute in self._capitalized_fields]):
 
             if hasattr(self, attribute) \
                and getattr(self, attribute).has_key(inflection):
@@ -271,4 +338,6 @@ class ConceptEntry(Entry):
                     capitalized_inflection = Entry._capitalized[inflection]
                     getattr(self,
                             attribute)[capitalized_inflection] = capitalized
+
+        self.intern_fields(attribute_variable_map)
         
@@ -23,12 +23,15 @@ __author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
 __revision__ = "$Rev$"
 __version__ = "@VERSION@"
 
+from itertools import izip
 import logging
 import re
 
 from config import FIELD_SEPARATORS, TOKEN_ENTRY_META_INFO, TOKEN_TYPESET_AS
+from inflection import get_rule_pack
 from paren_parser import ParenParser
-from utils import flatten, escape_aware_split, escape_aware_rsplit
+from utils import flatten
+import escaping
 
 ESCAPE_TOKEN = '\\'
 ALIAS_INDICATOR = '-->'
@@ -53,9 +56,64 @@ class MultipleAliasIndicatorsError(EntryError):
     detected.
     """
 
+class LazyField(object):
+    """A generated field of an entry that is not set up until it is
+    first accessed.  Then, all the lazy fields of the entry are set up
+    at once (see Entry.materialize()).  The value of the field NAME is
+    stored in the slot '_NAME'.
+    """
+    def __init__(self, name):
+        self._slot = '_' + name
+
+    def __get__(self, entry, owner):
+        if entry is None:
+            return self
+
+        try:
+            return getattr(entry, self._slot)
+        except AttributeError:
+            entry.materialize()
+            return getattr(entry, self._slot)
+
+    def __set__(self, entry, value):
+        setattr(entry, self._slot, value)
+
+class EntryType(type):
+    """The metaclass of entries.  Formats the _LINE_FORMAT of each
+    entry class once, when the class is created, instead of once per
+    entry.
+    """
+    def __init__(cls, name, bases, namespace):
+        type.__init__(cls, name, bases, namespace)
+
+        # A class that does not define its own _LINE_FORMAT, formats
+        # the one it inherits with its own widths.
+        if '_line_format' in namespace:
+            cls._line_template = namespace['_line_format']
+
+        mapping = dict((key, getattr(cls, key))
+                       for key in ('_bold_on', '_bold_off', '_label_width',
+                                   '_column_width'))
+        cls._line_format = cls._line_template % mapping
+        
 class Entry(object):
-    paren_parser = ParenParser()
+    __metaclass__ = EntryType
     
+    __slots__ = (
+        '_identity',
+        '_index',
+        '_position',
+        '_meta',
+        '_definition',
+        '_language',
+        'alias',
+        'index_inflection',
+        'use_short_reference',
+        '_index_template',
+        )
+    
+    paren_parser = ParenParser()
+
     # Define a number of class constants, each string will be defined
     # as an all-uppercase "constant".  That is 'this_value' is
     # assigned to __class__.THIS_VALUE.
@@ -109,27 +167,6 @@ class Entry(object):
     %s                     # match a TOKEN_ENTRY_META_INFO.
     ''' % (TOKEN_ENTRY_META_INFO), re.VERBOSE)
 
-    # Note that the order is significant (also when the pairs are
-    # reversed below).
-    _plural_to_singular = [
-        ('yses', 'ysis'),
-        ('ices', 'ex'),
-        ('ies', 'y'),
-        ('ses', 's'),
-        ('s', ''),
-        ]
-
-    _singular_to_plural = [(singular, plural)
-                           for plural, singular in _plural_to_singular]
-
-    _none_to_none = []
-    
-    _inflection_pair = {
-        INFLECTION_SINGULAR: _plural_to_singular,
-        INFLECTION_PLURAL: _singular_to_plural,
-        INFLECTION_NONE: _none_to_none,
-        }
-    
     _placeholder_meaning = {
         '-':   PLACEHOLDER_IN_TEXT_AND_INDEX,
         '(-)': PLACEHOLDER_IN_INDEX_ONLY,
@@ -149,27 +186,27 @@ class Entry(object):
     _line_format = '%(_bold_on)s%%%(_label_width)ds%(_bold_off)s ' \
                    '%%-%(_column_width)ds ' \
                    '%%-%(_column_width)ds' 
+
+    # The meta information of all entries defined without any (it is
+    # never modified).
+    _no_meta = dict()
     
     def __init__(self, index, parent, meta):
-        index.append(self)
-
-        self._identity = (len(index) - 1)
+        # Register this entry, and its PARENT (the position of the
+        # parent entry, or -1), in the INDEX, which assigns it an
+        # identity derived from the contents of its definition.
+        self._identity, self._position = index.add_entry(self, parent)
         self._index = index
-        self._parent = parent
-        self._children = set()
 
-        if self.parent:
-            # Include ourselves among our parent's children.
-            self.parent.add_child(self._identity)
+        # The entry is inflected by the rules of the language in effect
+        # where it is defined, also when its lazy fields are set up
+        # later (see materialize()).
+        self._language = index.language
         
         if meta:
             self._meta = self.parse_meta(meta.strip())
         else:
-            self._meta = dict()
-
-        # Define appropriate output formatting.
-        mapping = dict((key, getattr(self, key)) for key in dir(self))
-        self._line_format = self._line_format % mapping
+            self._meta = self._no_meta
         
     def bold_it(self, string):
         return self._bold_on + string + self._bold_off
@@ -180,10 +217,12 @@ class Entry(object):
                                      % (attribute, getattr(self, attribute))
                                      for attribute in self._generated_fields))
 
-    def generate_index_entries(self, page, typeset_page_number=None):
-        raise NotImplementedError('This method must be implemented in '
-                                  'derived classes.')
-
+    def get_see_line(self, target):
+        """Return the index entry that refers from this (alias) entry
+        to TARGET, or None if there should be none.
+        """
+        return None
+        
     def get_entry_type(self):
         return self.__class__.__name__[:- len('Entry')].lower()
 
@@ -206,7 +245,7 @@ class Entry(object):
                 logging.error('Unsuspected data in meta directive.')
                 
             if not part.startswith('#'):
-                key, value = escape_aware_split(part, '=', 1)
+                key, value = escaping.split(part, '=', 1)
                 
                 if key == 'sort_as':
                     info[self.META_SORT_AS] = \
@@ -228,7 +267,7 @@ class Entry(object):
         return info
 
     def get_alias_if_defined(self, string):
-        parts = escape_aware_split(string, ALIAS_INDICATOR)
+        parts = escaping.split(string, ALIAS_INDICATOR)
 
         if len(parts) < 2:
             return string, None
@@ -242,43 +281,20 @@ class Entry(object):
                  escape_token=ESCAPE_TOKEN):
         """Unescapes escaped field separators.
         """
-        # It must shrink or stay the same size.  It cannot grow.
-        new = list(string) 
-        
-        previous_was_escape = False
-        previous_token = None
-        
-        for i, token in reversed(list(enumerate(string))):
-            if (token == escape_token) \
-                   and (previous_token in escaped_tokens) \
-                   and not (previous_token == escape_token):
-                # If CONTIGUOUS_ESCAPES is zero or even.
-                del new[i]
-                
-            previous_token = token
-            
-        return ''.join(new)
+        return escaping.unescape(string, escaped_tokens, escape_token)
 
     def get_complement_inflections(self, reference, typeset,
                                    current_inflection):
-        result = []
-        
-        for words in [reference, typeset]:
-            copy = words[:]        # Make a copy of the list of words.
-            
-            copy[-1] = self.change_inflection(copy[-1], current_inflection)
-            
-            result.append(copy)
-            
-        return result
+        # Inflect the last word of both lists in one go.
+        return get_rule_pack(self._language).inflect_last_words(
+            [reference, typeset],
+            self._complement_inflection[current_inflection])
 
     def get_inflection(self, word, inflection):
-        for suffix, replacement in self._inflection_pair[inflection]:
-            if word.endswith(suffix):
-                offset = (- len(suffix)) or None
-                return word[:offset] + replacement
-            
-        return word
+        """Return WORD in the given INFLECTION, according to the rules
+        of the entry's language.
+        """
+        return get_rule_pack(self._language).inflect(word, inflection)
     
     def change_inflection(self, word, current_inflection):
         return self.get_inflection(
@@ -298,17 +314,8 @@ class Entry(object):
         return current_inflection, complement_inflection
     
     def escape_aware_split(self, string, delimiter=None, maxsplit=None):
-        parts = self.paren_parser.split(string, delimiter, maxsplit)
-
-        #if delimiter is None:
-        #    delimiter = ' '
-            
-        for i, part in reversed(list(enumerate(parts))):
-            if part[-1] == ESCAPE_TOKEN:
-                parts[i] = delimiter.join((parts[i], parts[i + 1]))
-                del parts[i + 1]
-                
-        return parts
+        return self.paren_parser.split(string, delimiter, maxsplit,
+                                       escape_aware=True)
 
     def format_reference_and_typeset(self, string, strip_parens=True):
         parts = self.paren_parser.split(string)
@@ -322,9 +329,6 @@ class Entry(object):
         typeset = []
         
         for part in parts:
-            # FIXME: At the time this was written (2007-07-05)
-            # ParenParser.split did not honor its MAXSPLIT argument (1
-            # below).
             alternatives = self.escape_aware_split(part, TOKEN_TYPESET_AS, 1)
 
             # Perhaps a bad solution to a problem of @-typesetting
@@ -351,104 +355,98 @@ class Entry(object):
         
         return reference, typeset
 
-    def is_escaped(self, string, i):
-        """Returns True if the token in STRING at position I is escaped.
+    def compile_sub_entry_part(self, template):
+        """Return TEMPLATE (one word of a sub-entry definition) as a
+        tuple (PREFIX, PLACEHOLDER, SUFFIX), where PLACEHOLDER is the
+        meaning of the first unescaped placeholder in TEMPLATE, or None
+        if there is none (then PREFIX is all of TEMPLATE).
         """
-        if i > 0:
-           for n, character in enumerate(string[(i - 1)::-1]):
-               if character != ESCAPE_TOKEN:
-                   break
-        else:
-            n = 0                 # The token can't have been escaped.
-
-        return bool(n & 1)       # Is the number of escape tokens odd?
-
-    def expand_sub_entry_part(self, template, is_last_token, inflection,
-                              current_inflection, field):
-        """Note: CURRENT_INFLECTION refers to the inflection given in
-        the source file, while INFLECTION is the target inflection of
-        the entry we are generating.
-        """
-        formatted = ''
-        
-        k = None
-
         for match in self._hint_re.finditer(template):
-            placeholder = match.group('placeholder')
             i, j = match.span('placeholder')
 
             # Check if the PLACEHOLDER token is escaped or not.  If it
             # is, then do nothing.
-            if self.is_escaped(template, i):
+            if escaping.is_escaped(template, i):
                 continue
 
-            # Select the approriate replacement phrase from the
-            # parent, based on the target INFLECTION.
-            if not is_last_token:
-                source = getattr(self.parent, field)['singular']
-            else:
-                source = getattr(self.parent, field)[inflection]
-
-            # Construct the new phrase.
-            #if (self._placeholder_meaning[placeholder] \
-            #    == self.PLACEHOLDER_IN_INDEX_ONLY) \
-            #   and (field.startswith('typeset_in_index')):
-            #    formatted += template[k:i] + '--'
-            #print self._placeholder_meaning
-            #print self._placeholder_meaning[placeholder]
-
-            if field.startswith('typeset_in_index'):
-                formatted += template[k:i] + '--'
-            elif ((field == 'reference_short') \
-                  or field.startswith('typeset_in_text')) \
-                 and (self._placeholder_meaning[placeholder] \
-                      == self.PLACEHOLDER_IN_INDEX_ONLY):
-                formatted += template[k:i]
-            else:
-                formatted += template[k:i] + source
+            return (template[:i],
+                    self._placeholder_meaning[match.group('placeholder')],
+                    template[j:])
+        
+        return (template, None, '')
+
+    def compile_sub_entry(self, template, template_long=None):
+        """Parse the sub-entry definition TEMPLATE (and TEMPLATE_LONG,
+        the full form of an acronym) once, into a dict mapping each
+        variable of a field-variable map to a list of compiled parts
+        (see compile_sub_entry_part()).  The result is shared by all
+        the entries of the index defined by equal templates.
+        """
+        key = (template, template_long)
+        compiled = self.index.compiled_sub_entries
+        
+        try:
+            return compiled[key]
+        except KeyError:
+            pass
+        
+        variables = dict()
+        
+        variables['reference'], variables['typeset'] \
+            = self.format_reference_and_typeset(template, False)
+        
+        if template_long:
+            variables['sort_as_long'], variables['typeset_long'] \
+                = self.format_reference_and_typeset(template_long, False)
 
-            k = j
-            
-            break
-        else:
-            # If nothing really got replaced.
-            if is_last_token:
-                if inflection == current_inflection:
-                    formatted = template
-                else:
-                    formatted = self.get_inflection(template, inflection)
-                    
-                k = len(template)
+        for variable, parts in variables.items():
+            variables[variable] = [self.compile_sub_entry_part(part)
+                                   for part in parts]
 
-        if k < len(template):
-            formatted += template[k:]
+        compiled[key] = variables
+        
+        return variables
             
-        return formatted
-
     def expand_sub_entry(self, template, inflection, current_inflection,
                          field_variable_map, template_long=None):
-        reference, typeset = self.format_reference_and_typeset(template, False)
+        """Note: CURRENT_INFLECTION refers to the inflection given in
+        the source file, while INFLECTION is the target inflection of
+        the entry we are generating.
+        """
+        variables = self.compile_sub_entry(template, template_long)
+        parent = self.parent
         
-        if template_long:
-            sort_as_long, typeset_long \
-                = self.format_reference_and_typeset(template_long, False)
-            
         results = dict()
-        variables = locals()
 
         for field, variable in field_variable_map:
             if not variables.has_key(variable):
                 continue
-            
+
             parts = variables[variable]
-            template_list = [
-                self.expand_sub_entry_part(part, (pos == (len(parts) - 1)),
-                                           inflection, current_inflection,
-                                           field)
-                for pos, part in enumerate(parts)]
+            last = len(parts) - 1
+            template_list = []
             
-            # Remove empty/blank elements.
-            template_list = [part for part in template_list if part]
+            for pos, (prefix, placeholder, suffix) in enumerate(parts):
+                if placeholder is None:
+                    # If nothing really got replaced.
+                    if (pos == last) and (inflection != current_inflection):
+                        prefix = self.get_inflection(prefix, inflection)
+                elif field.startswith('typeset_in_index'):
+                    prefix += '--'
+                elif ((field == 'reference_short') \
+                      or field.startswith('typeset_in_text')) \
+                      and (placeholder == self.PLACEHOLDER_IN_INDEX_ONLY):
+                    pass
+                elif pos == last:
+                    # Select the approriate replacement phrase from
+                    # the parent, based on the target INFLECTION.
+                    prefix += getattr(parent, field)[inflection]
+                else:
+                    prefix += getattr(parent, field)['singular']
+
+                # Remove empty/blank elements.
+                if prefix or suffix:
+                    template_list.append(prefix + suffix)
             
             results[field] = ' '.join(template_list)
         
@@ -468,39 +466,128 @@ class Entry(object):
     # Accessors for the 'parent' property (_-prefixed to force
     # access through the property):
     def _get_parent(self):
-        if self._parent == None:
-            return None
-        return self._index[self._parent]
-        
-    def _set_parent(self, parent):
-        self._parent = parent
+        return self._index.get_parent(self._position)
         
-    parent = property(_get_parent, _set_parent, None,
+    parent = property(_get_parent, None, None,
                       'The parent of this entry.')
 
-    def add_child(self, child_identity):
-        self._children.add(child_identity)
-        
     # Accessors for the 'children' property (_-prefixed to force
     # access through the property):
     def _get_children(self):
-        return [self._index[child_id]
-                for child_id in sorted(self._children)]
+        return self._index.get_children(self._position)
         
     children = property(_get_children, None, None,
                         'The children of this entry.')
 
+    # Accessors for the 'depth' property (_-prefixed to force access
+    # through the property):
+    def _get_depth(self):
+        return self._index.get_depth(self._position)
+        
+    depth = property(_get_depth, None, None,
+                     'The depth of this entry in the tree of entries.')
+
+    # Accessors for the 'position' property (_-prefixed to force
+    # access through the property):
+    def _get_position(self):
+        return self._position
+
+    def _set_position(self, position):
+        self._position = position
+        
+    position = property(_get_position, _set_position, None,
+                        'The position of this entry in its index.')
+
     # Accessors for the 'index' property (_-prefixed to force
     # access through the property):
     def _get_index(self):
         return self._index
 
-    index = property(_get_index, None, None,
+    def _set_index(self, index):
+        self._index = index
+
+        # The index entries are compiled again in the new index.
+        try:
+            del self._index_template
+        except AttributeError:
+            pass
+
+        # The fields that have been set up are shared through the
+        # string table of the new index.  (The lazy fields that have
+        # not, will be when they are.)
+        fields = self._generated_fields
+        if hasattr(self, '_definition'):
+            lazy = set(field for field, variable in self._lazy_field_map)
+            fields = [field for field in fields if field not in lazy]
+
+        self.intern_fields([(field, None) for field in fields])
+
+    index = property(_get_index, _set_index, None,
                      'The index that this entry belongs to.')
     
+    def materialize(self):
+        """Set up the lazily generated fields (see LazyField) of this
+        entry, from the definition recorded when it was created.
+        """
+        try:
+            definition = self._definition
+        except AttributeError:
+            return
+
+        del self._definition
+        
+        for field, variable in self._lazy_field_map:
+            setattr(self, field, InflectionArray())
+
+        self._setup(self._lazy_field_map, *definition)
+
+    def intern_fields(self, field_variable_map):
+        """Replace the values of the generated fields given by
+        FIELD_VARIABLE_MAP with equal strings from the index's string
+        table.
+        """
+        intern = self._index.strings.intern
+        
+        for field, variable in field_variable_map:
+            # The values are replaced in place, position by position.
+            values = getattr(self, field)
+            list.__setitem__(values, slice(None),
+                             [(value if (value is None) else intern(value))
+                              for value in list.__iter__(values)])
+        
     def to_latex(self):
         raise NotImplementedError
 
+    def compile_index_template(self):
+        """Return the index entries of this entry as a tuple of
+        (PAGE_DEPENDENT, TEXT) pairs, one for each line.  If
+        PAGE_DEPENDENT is true, TEXT is the start of the line, up to the
+        page-number formatting hint (see generate_index_entries()).
+        Otherwise, TEXT is the whole line (which refers to page 0).
+        """
+        raise NotImplementedError
+
+    def get_index_template(self):
+        """Return the index entries of this entry, as compiled by
+        compile_index_template() the first time.
+        """
+        try:
+            return self._index_template
+        except AttributeError:
+            self._index_template = self.compile_index_template()
+            return self._index_template
+        
+    def generate_index_entries(self, page, typeset_page_number=''):
+        """Generate the index entries of a reference to this entry on
+        PAGE, with the page-number formatting hint TYPESET_PAGE_NUMBER
+        (such as '|textbf').
+        """
+        for page_dependent, text in self.get_index_template():
+            if page_dependent:
+                yield text + typeset_page_number + '}{' + page + '}'
+            else:
+                yield text
+
     @staticmethod
     def capitalize(string):
         for i, token in enumerate(string):
@@ -509,6 +596,48 @@ class Entry(object):
             
         return string
 
+class InflectionArray(list):
+    """The values of a generated field of an entry, one per
+    inflection.  Replaces a dict keyed by the inflections, but stores
+    the values at fixed positions.  Missing values are None.
+    """
+    __slots__ = ()
+
+    # The order of the inflections is the iteration order of the
+    # dicts these arrays replace, which decides the inflection
+    # recorded for a reference phrase shared by several inflections.
+    _inflections = (
+        Entry.INFLECTION_SINGULAR_CAPITALIZED,
+        Entry.INFLECTION_PLURAL_CAPITALIZED,
+        Entry.INFLECTION_PLURAL,
+        Entry.INFLECTION_SINGULAR,
+        Entry.INFLECTION_NONE,
+        Entry.INFLECTION_NONE_CAPITALIZED,
+        )
+
+    _position = dict((inflection, i)
+                     for i, inflection in enumerate(_inflections))
+
+    def __init__(self):
+        list.__init__(self, [None] * len(self._inflections))
+
+    def __getitem__(self, inflection):
+        return list.__getitem__(self, self._position[inflection])
+
+    def __setitem__(self, inflection, value):
+        list.__setitem__(self, self._position[inflection], value)
+
+    def has_key(self, inflection):
+        return self[inflection] is not None
+
+    def iteritems(self):
+        for inflection, value in izip(self._inflections, list.__iter__(self)):
+            if value is not None:
+                yield inflection, value
+
+    def items(self):
+        return list(self.iteritems())
+    
 def main():
     """Module mainline (for standalone execution).
     """
@@ -0,0 +1,178 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+import re
+from string import whitespace
+
+from config import FIELD_SEPARATORS
+
+ESCAPE_TOKEN = '\\'
+
+# Compiled patterns, keyed by the delimiters (or escaped tokens) and
+# escape tokens they were compiled for.
+_delimiter_res = dict()
+_unescape_res = dict()
+
+def _get_delimiter_re(delimiter, escape_token):
+    """Return a regular expression matching DELIMITER (or any
+    whitespace character, if DELIMITER is None) together with the run
+    of ESCAPE_TOKENs right in front of it.  The look-behind makes every
+    match start at the beginning of such a run, so the number of
+    escape tokens is counted once, in a single forward pass.
+    """
+    key = (delimiter, escape_token)
+
+    try:
+        return _delimiter_res[key]
+    except KeyError:
+        pass
+
+    if delimiter is None:
+        delimiter = '[%s]' % (re.escape(whitespace))
+    else:
+        delimiter = re.escape(delimiter)
+
+    escape_token = re.escape(escape_token)
+
+    _delimiter_res[key] = re.compile('(?<!%s)(%s*)%s' % (escape_token,
+                                                         escape_token,
+                                                         delimiter))
+    return _delimiter_res[key]
+
+def iter_delimiters(string, delimiter=None, escape_token=ESCAPE_TOKEN):
+    """Generate the (START, END) spans of the DELIMITERs in STRING that
+    are not escaped by an odd number of ESCAPE_TOKENs.  If DELIMITER is
+    None, every whitespace character is a delimiter.
+    """
+    for match in _get_delimiter_re(delimiter, escape_token).finditer(string):
+        if not (len(match.group(1)) & 1):
+            yield match.end(1), match.end()
+
+def split(string, delimiter=None, maxsplit=None, escape_token=ESCAPE_TOKEN):
+    """Return a list of the parts of STRING, split at each unescaped
+    DELIMITER.  If MAXSPLIT is given, at most MAXSPLIT splits are done.
+    If DELIMITER is None, each whitespace character is a delimiter.
+    """
+    if maxsplit == 0:
+        return [string]
+
+    parts = []
+    i = 0
+
+    for k, l in iter_delimiters(string, delimiter, escape_token):
+        parts.append(string[i:k])
+        i = l
+
+        if len(parts) == maxsplit:
+            break
+
+    parts.append(string[i:])
+
+    return parts
+
+def rsplit(string, delimiter=None, maxsplit=None, escape_token=ESCAPE_TOKEN):
+    """Like split(), but if MAXSPLIT is given, the splits are done at
+    the rightmost unescaped delimiters.
+    """
+    spans = list(iter_delimiters(string, delimiter, escape_token))
+
+    if maxsplit is not None:
+        spans = spans[(len(spans) - maxsplit):] if maxsplit else []
+
+    parts = []
+    i = 0
+
+    for k, l in spans:
+        parts.append(string[i:k])
+        i = l
+
+    parts.append(string[i:])
+
+    return parts
+
+def is_escaped(string, i, escape_token=ESCAPE_TOKEN):
+    """Return True if the token in STRING at position I is preceded by
+    an odd number of ESCAPE_TOKENs.
+    """
+    n = 0
+    while (i > n) and (string[i - n - 1] == escape_token):
+        n += 1
+
+    return bool(n & 1)
+
+def _get_unescape_re(escaped_tokens, escape_token):
+    """Return a regular expression matching each ESCAPE_TOKEN in front
+    of any of the ESCAPED_TOKENS, or None if there are no such tokens.
+    """
+    key = (escaped_tokens, escape_token)
+
+    try:
+        return _unescape_res[key]
+    except KeyError:
+        pass
+    
+    tokens = ''.join(re.escape(token) for token in sorted(escaped_tokens)
+                     if token != escape_token)
+    if tokens:
+        _unescape_res[key] = re.compile('%s(?=[%s])'
+                                        % (re.escape(escape_token), tokens))
+    else:
+        _unescape_res[key] = None
+
+    return _unescape_res[key]
+
+def unescape(string, escaped_tokens=FIELD_SEPARATORS,
+             escape_token=ESCAPE_TOKEN):
+    """Return STRING without the ESCAPE_TOKENs in front of any of the
+    ESCAPED_TOKENS.
+    """
+    if escape_token not in string:
+        return string
+
+    unescape_re = _get_unescape_re(escaped_tokens, escape_token)
+    if unescape_re is None:
+        return string
+
+    return unescape_re.sub('', string)
+
+def unescape_all(strings, escaped_tokens=FIELD_SEPARATORS,
+                 escape_token=ESCAPE_TOKEN):
+    """Return a list of the results of unescape() applied to each of
+    STRINGS, such as all the fields of an entry.
+    """
+    unescape_re = _get_unescape_re(escaped_tokens, escape_token)
+    if unescape_re is None:
+        return list(strings)
+
+    return [unescape_re.sub('', string) if escape_token in string else string
+            for string in strings]
+
+def main():
+    """Module mainline (for standalone execution).
+    """
+    pass
+
+if __name__ == "__main__":
+    main()
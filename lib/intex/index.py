@@ -23,23 +23,27 @@ __author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
 __revision__ = "$Rev$"
 __version__ = "@VERSION@"
 
+from array import array
 from collections import defaultdict
 from cStringIO import StringIO
+import hashlib
 import logging
-import re
 import sys
 
 from config import (
     FIELD_SEPARATORS,
-    INTEX_DEFAULT_INDEX,
     TOKEN_COMMENT,
     TOKEN_ENTRY_META_INFO,
     )
 from acronym_entry import AcronymEntry
+from auxiliary import resolve_auxiliary, resolve_records
 from concept_entry import ConceptEntry
 from person_entry import PersonEntry
+from lexer import Lexer, LINE_DIRECTIVE, LINE_COMMENT, LINE_ENTRY
 from stack import Stack
-from utils import flatten, escape_aware_rsplit
+from utils import flatten, StringTable
+from inflection import DEFAULT_LANGUAGE, get_rule_pack, get_rule_packs
+from normalization import normalize
 
 import entry
 
@@ -52,88 +56,17 @@ class IndexSyntaxError(_IndexError, SyntaxError):
     """
 
 class Index(list):
-    _intex_re = re.compile('\\\@writefile\{%s\}' \
-                           '\{\\\indexentry\{(?P<key>.*)\}\{(?P<page>\w+)\}\}' \
-                           % (INTEX_DEFAULT_INDEX))
-
-    _aux_input_re = re.compile('\\\@input\{(?P<filename>.*\.aux)\}')
-    
     _concept_types = ['ACRONYMS', 'PEOPLE', 'CONCEPTS']
     _index_attrbiutes = {
         'name': None,
         }
 
-    _re_macros = {
-        'FIELD': '''
-        [^%(COMMENT_TOKEN)s:\s]         # Non-comment and non-meta.
-        (                               # Either
-                                        #  escaped field separators
-         \\\\[%(FIELD_SEPARATORS)s%(META_TOKEN)s] 
-        |                               # or
-                                        #  non-field-separators
-         [^%(FIELD_SEPARATORS)s%(META_TOKEN)s] 
-        )+                              # repeated.
-        ''',
-        'FIELD_SEPARATORS': FIELD_SEPARATORS,
-        'COMMENT_TOKEN': TOKEN_COMMENT,
-        'META_TOKEN': TOKEN_ENTRY_META_INFO,
-        'ALIAS_POINTER': '-->',
-        }
-    # Instantiate/format the FIELD macro value by supplying the other
-    # (i.e., FIELD_SEPARATORS, COMMENT_TOKEN, and META_TOKEN) mappings
-    # in _RE_MACROS.
-    _re_macros['FIELD'] = _re_macros['FIELD'] % _re_macros
-
-    # A regulare expression to match aliasing index entries.
-    _alias_re = re.compile('''
-    ^                                   # Starts with
-    (?P<entry>.+)                       # the entry (including whitespace),
-    \s*?%(ALIAS_POINTER)s\s*            # the alias indicator,
-    (?P<alias>.+)                       # the entry being aliased,
-    $                                   # at the end.
-    ''' % _re_macros, re.VERBOSE)
-    
-    # Regular expressions, one pattern matcher for each context:
-    _concept_re = re.compile('''
-    ^                                   # Starts with
-    (?P<indent>\s+)?                    # (possible) indentation,
-    (?P<concept>%(FIELD)s)?             # an entry,
-    [%(FIELD_SEPARATORS)s]*             # a separator,
-    (?P<typeset_as>%(FIELD)s)?          # the full form,
-    [%(FIELD_SEPARATORS)s]*             # another separator,
-    (?P<meta>%(META_TOKEN)s.+)?         # meta information
-    $                                   # at the end.
-    ''' % _re_macros, re.VERBOSE)
-
-    _acronym_re = re.compile('''
-    ^                                     # Starts with
-    (?P<indent>\s+)?                      # (possible) indentation,
-    (?P<acronym>%(FIELD)s)?               # an entry,
-    [%(FIELD_SEPARATORS)s]*               # a separator,
-    (?P<full_form>%(FIELD)s)?             # the full form,
-    [%(FIELD_SEPARATORS)s]*               # another separator,
-    (?P<typeset_as>%(FIELD)s)?            # the full form,
-    [%(FIELD_SEPARATORS)s]*               # another separator,
-    (?P<meta>%(META_TOKEN)s.+)?           # meta information
-    $                                     # at the end.
-    ''' % _re_macros, re.VERBOSE)
-
-    _person_re = re.compile('''
-    ^                                      # Starts with
-    (?P<indent>\s+)?                       # (possible) indentation,
-    (?P<initials>%(FIELD)s)?               # an entry,
-    [%(FIELD_SEPARATORS)s]*                # a separator,
-    (?P<name>%(FIELD)s)?                   # the name,
-    [%(FIELD_SEPARATORS)s]*                # another separator
-    (?P<meta>%(META_TOKEN)s.+)?            # meta information
-    $                                      # at the end.
-    ''' % _re_macros, re.VERBOSE)
-
-    # A map between context names and the match patterns:
-    _context_matcher = {
-        'ACRONYMS': _acronym_re,
-        'CONCEPTS': _concept_re,
-        'PEOPLE': _person_re,
+    # A map between context names and the names of the fields of an
+    # entry definition in that context:
+    _context_fields = {
+        'ACRONYMS': ('acronym', 'full_form', 'typeset_as'),
+        'CONCEPTS': ('concept', 'typeset_as'),
+        'PEOPLE': ('initials', 'name'),
         }
 
     _context_class = {
@@ -141,41 +74,21 @@ class Index(list):
         'CONCEPTS': ConceptEntry,
         'PEOPLE': PersonEntry,
         }
-        
-    # Add a macro definition to the values available when constructing
-    # the regular expressions below.
-    _re_macros['CONCEPT_TYPES'] = '|'.join(_context_matcher.keys())
-
-    # A pattern to match meta directives:
-    _meta_directive_re = re.compile('''
-    ^                                   # Starts with
-    %(COMMENT_TOKEN)s                   # the comment token,
-    \s*                                 # possibly some whitespace,
-    (                                   # then either
-     (?P<attribute>\w+)\s*              #  an attribute
-     =                                  #  sat to
-     \s*(?P<value>\w+)                  #  some value,
-     |                                  # or
-     (?P<context>\*(%(CONCEPT_TYPES)s)\*) #  a context switch
-    )                                   # followed by
-    \s*                                 # possibly trailing whitespace
-    $                                   # at the end.
-    ''' % _re_macros, re.VERBOSE)
-
-    # A pattern to match comment-only lines.
-    _pure_comment_re = re.compile('''
-    ^                                   # Starts with
-    \s*                                 # possibly some whitespace
-    %(COMMENT_TOKEN)s                   # and the comment token,
-    .*                                  # followed by anything.
-    ''' % _re_macros, re.VERBOSE)
-
-    # A list used to instantiate the context dependent parser.
-    _matchers = [
-        _meta_directive_re,             # For matching meta directives.
-        _pure_comment_re,               # For matching pure comments.
-        None,               # The current context will be placed here.
-        ]
+
+    # The language of the entries, which decides how they are
+    # inflected.  Set by a "% language=<code>" meta directive.
+    language = DEFAULT_LANGUAGE
+    
+    # The lexer used to classify and tokenize the lines of .itx files.
+    _lexer = Lexer(_context_fields)
+
+    # Attributes that are only used while parsing, and hence need not
+    # be pickled.
+    _parse_state = ('_elements', '_current_line', '_line_num', '_state',
+                    '_block_key', '_block_offset', '_block_counts',
+                    '_added', '_removed', '_full_references',
+                    '_short_references', '_short_counts', '_duplicates',
+                    'compiled_sub_entries')
     
     def __init__(self, filename=None, index_name='default'):
         """The constructor.
@@ -183,15 +96,102 @@ class Index(list):
         list.__init__(self)             # Initialize the base class.
         
         self._name = index_name # FIXME:  The index's name for use in/by ...
-        self._current_matchers = list(Index._matchers)
+
+        # The current context is set by meta directives (see
+        # handle_meta_directive()).
+        self._context = None
+        self._entry_class = None
+        self._entry_fields = None
+        
+        # The attributes set by meta directives (e.g., the index's
+        # name).
+        self._attributes = dict()
         
         self._indentation_level = {
             '': 0,
             }
         
         self._elements = Stack()  # A stack of elements used when parsing.
+
+        # The values of the generated fields of the entries (and
+        # hence the keys of the reference index) are shared through
+        # this table.
+        self._strings = StringTable()
+        
+        # The tree of entries is stored in flat arrays, indexed by the
+        # positions of the entries: The position of each entry's
+        # parent (-1 for top-level entries), the depth of each entry,
+        # and the children of all entries, ordered by their parents'
+        # positions (see _build_tree()).  The children of the entry at
+        # position I are found at _CHILDREN[_CHILD_OFFSETS[I]:
+        # _CHILD_OFFSETS[I + 1]].
+        self._parents = array('l')
+        self._depths = array('l')
+        self._child_offsets = array('l')
+        self._children = []
+
+        # The (zero-based) line number of the definition of each
+        # entry, also indexed by the positions of the entries.
+        self._lines = array('l')
+
+        # A map between each alias entry and its resolved target (see
+        # resolve_aliases()).
+        self.aliases = dict()
+
+        # The reference phrases of the entries, recorded as the entries
+        # are parsed (see _add_references()): The full-form phrases,
+        # the first entry that defined each short-form phrase, the
+        # number of entries that share each short-form phrase, and the
+        # positions of the entries that define each duplicate
+        # full-form phrase.
+        self._full_references = dict()
+        self._short_references = dict()
+        self._short_counts = defaultdict(int)
+        self._duplicates = defaultdict(list)
+
+        # The line being parsed, and its (zero-based) number.
+        self._current_line = None
+        self._line_num = 0
+        
+        # The parser state that entry definitions depend on (see
+        # _get_block_key()).
+        self._state = None
+        
+        # The key of the block of entry definitions currently being
+        # parsed, and the offset of the next entry within that block.
+        self._block_key = None
+        self._block_offset = 0
+        self._block_counts = defaultdict(int)
+
+        # The entries created and discarded by an incremental parse
+        # (see from_string()).
+        self._added = []
+        self._removed = []
+
+        # The sub-entry definitions of the entries, parsed by
+        # Entry.compile_sub_entry().  Each index has its own table, so
+        # that indices built by different threads do not share it.  It
+        # is not pickled, but refilled as needed.
+        self.compiled_sub_entries = dict()
+
+        # The problems found in the index, as (FILENAME, LINE_NUMBER,
+        # SEVERITY, MESSAGE) tuples, if they are collected instead of
+        # logged (see from_string()).
+        self.problems = None
+
+        # A digest of the text that the index was built from (see
+        # from_string()).
+        self.digest = None
         #self.__entries = []  # A list of all the entries in the index.
         
+    def __getstate__(self):
+        return dict((key, value) for key, value in self.__dict__.iteritems()
+                    if key not in self._parse_state)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.compiled_sub_entries = dict()
+        
     # Accessors for the 'name' property (_-prefixed to force access
     # through the property):
     def _get_name(self):
@@ -202,16 +202,41 @@ class Index(list):
         
     name = property(_get_name, _set_name, None, 'The name of the index.')
 
+    # Accessors for the 'strings' property (_-prefixed to force access
+    # through the property):
+    def _get_strings(self):
+        return self._strings
+
+    strings = property(_get_strings, None, None,
+                       'The table of strings shared by the entries.')
+
+    def _get_rule_pack(self):
+        return get_rule_pack(self.language)
+
+    rule_pack = property(_get_rule_pack, None, None,
+                         'The inflection rules of the index\'s language.')
+
     def handle_meta_directive(self, attribute=None, value=None, context=None,
                               alias=None):
+        self._state = None
+        
         if attribute:
+            if (attribute == 'language') \
+                   and (value not in [rule_pack.language
+                                      for rule_pack in get_rule_packs()]):
+                self.syntax_error(self._filename, (self._line_num + 1),
+                                  'No inflection rules for the language '
+                                  '"%s".' % (value))
+                return
+                
             # Set an attribute describing this index (e.g., its name).
             logging.info('Setting the index\'s %s=%s.', attribute, repr(value))
             setattr(self, attribute, value)
+            self._attributes[attribute] = value
         elif context:
             self._context = context[1:-1] # Remove pre and post '*'s.
             logging.info('Switching context to: "%s"', self._context, )
-            self._matchers[-1] = self._context_matcher[self._context]
+            self._entry_fields = self._context_fields[self._context]
             self._entry_class = self._context_class[self._context]
             
     def handle_comment(self, alias=None):
@@ -238,15 +263,97 @@ class Index(list):
                                           self._current_line))
             else:
                 self._indentation_level[indent] = len(self._indentation_level)
+                self._state = None
                 
         return self._indentation_level[indent]
     
     def _get_current_parent(self):
         if self._elements:
-            return self._elements[-1].identity
+            return self._elements[-1].position
         else:
-            None
-            
+            return -1
+
+    def _append_entry(self, entry, parent):
+        """Append ENTRY, with the parent at position PARENT, and return
+        ENTRY's position.
+        """
+        self.append(entry)
+        self._parents.append(parent)
+        self._lines.append(self._line_num)
+        
+        if parent < 0:
+            self._depths.append(0)
+        else:
+            self._depths.append(self._depths[parent] + 1)
+
+        return (len(self) - 1)
+    
+    def add_entry(self, entry, parent):
+        """Append ENTRY, with the parent at position PARENT (-1 if
+        none), to the index.  Return the identity and the position of
+        ENTRY.  The identity is the key of the block of entry
+        definitions that ENTRY was defined in, together with ENTRY's
+        offset within that block.  Hence, it does not change when
+        other blocks are edited.
+        """
+        identity = (self._block_key, self._block_offset)
+        self._block_offset += 1
+        
+        self._added.append(entry)
+        
+        return identity, self._append_entry(entry, parent)
+
+    def _build_tree(self):
+        """Build the (CSR-style) arrays of children, from the array of
+        parents.  The children of each entry are kept in file order.
+        """
+        offsets = array('l', [0]) * (len(self) + 1)
+
+        for parent in self._parents:
+            if parent >= 0:
+                offsets[parent + 1] += 1
+
+        for i in xrange(len(self)):
+            offsets[i + 1] += offsets[i]
+
+        children = [None] * offsets[-1]
+        free = offsets[:-1]
+        
+        for position, parent in enumerate(self._parents):
+            if parent >= 0:
+                children[free[parent]] = self[position]
+                free[parent] += 1
+
+        self._child_offsets = offsets
+        self._children = children
+
+    def get_parent(self, position):
+        """Return the parent of the entry at POSITION, or None.
+        """
+        parent = self._parents[position]
+        if parent < 0:
+            return None
+        
+        return self[parent]
+
+    def get_children(self, position):
+        """Return the children of the entry at POSITION.
+        """
+        return self._children[self._child_offsets[position]:
+                              self._child_offsets[position + 1]]
+
+    def get_depth(self, position):
+        """Return the depth of the entry at POSITION (0 for top-level
+        entries).
+        """
+        return self._depths[position]
+
+    def get_line_number(self, position):
+        """Return the (one-based) number of the line that the entry at
+        POSITION was defined on.
+        """
+        return self._lines[position] + 1
+    
     def handle_entry(self, indent=None, **rest):
         indent_level = self._get_indentation_level(indent)
         
@@ -258,88 +365,319 @@ class Index(list):
         # Push the new entry onto the stack.  The current _ENTRY_CLASS
         # is set by the different meta directives (see
         # handle_meta_directive()).
-        self._elements.push(self._entry_class(index=self,
-                                              parent=self._get_current_parent(),
-                                              indent_level=indent_level,
-                                              **rest))
-        
-    _match_handler = {
-        _meta_directive_re: handle_meta_directive,
-        _pure_comment_re: handle_comment,
-        _concept_re: handle_entry,
-        _acronym_re: handle_entry,
-        _person_re: handle_entry,
-        }
+        new_entry = self._entry_class(index=self,
+                                      parent=self._get_current_parent(),
+                                      indent_level=indent_level, **rest)
+        self._add_references(new_entry)
+        self._elements.push(new_entry)
 
-    @staticmethod
-    def syntax_error(filename, line_number, message):
+    def _add_references(self, entry):
+        """Record the reference phrases of ENTRY, which must come after
+        the entries already recorded.  An entry whose short-form
+        phrases are shared with other entries is marked as not using
+        them (and so are those other entries).
+        """
+        full = self._full_references
+
+        # A phrase shared by several inflections of ENTRY itself (e.g.,
+        # of an uninflected entry) is not a duplicate; the last
+        # inflection that uses it is recorded.
+        for inflection, phrase in entry.reference.iteritems():
+            first = full.get(phrase, (entry, ))[0]
+            if first is entry:
+                full[phrase] = (entry, inflection)
+            else:
+                self._add_duplicate(phrase, first, entry)
+
+        entry.use_short_reference = True
+
+        short = self._short_references
+        counts = self._short_counts
+
+        # The last inflection that uses each phrase is recorded.
+        phrases = dict((phrase, inflection) for inflection, phrase
+                       in entry.reference_short.iteritems() if phrase)
+
+        for phrase, inflection in phrases.iteritems():
+            first = short.get(phrase)
+            if first is None:
+                counts[phrase] = 1
+                short[phrase] = (entry, inflection)
+            else:
+                counts[phrase] += 1
+                first[0].use_short_reference = False
+                entry.use_short_reference = False
+
+    def _record_references(self):
+        """Record the reference phrases of all the entries, from
+        scratch.
+        """
+        self._full_references = dict()
+        self._short_references = dict()
+        self._short_counts = defaultdict(int)
+        self._duplicates = defaultdict(list)
+
+        for entry in self:
+            self._add_references(entry)
+        
+    def _add_duplicate(self, phrase, first, entry):
+        """Record that ENTRY repeats PHRASE, first defined by FIRST (a
+        different entry).  Each entry is recorded once per phrase.
+        """
+        positions = self._duplicates[phrase]
+        if not positions:
+            positions.append(first.position)
+        if entry.position not in positions:
+            positions.append(entry.position)
+
+    def syntax_error(self, filename, line_number, message):
+        """Report a syntax error on LINE_NUMBER in FILENAME, and exit,
+        unless the problems are collected (see from_string()).
+        """
+        if self.problems is not None:
+            self.problems.append((filename, line_number, 'error', message))
+            return
+        
         logging.error('Syntax error on line %d in file "%s": %s',
                       line_number, filename, message)
         sys.exit(1)
+
+    def _add_problem(self, position, severity, message):
+        """Collect a problem with the entry at POSITION.
+        """
+        self.problems.append((self._filename, self.get_line_number(position),
+                              severity, message))
                  
     @classmethod
-    def from_file(cls, filename):
+    def from_file(cls, filename, problems=None):
+        logging.info('Reading index definitions from "%s".', filename)
+        
+        # Read the whole file at once, and let the lexer split it into
+        # lines.
+        stream = open(filename, 'r')
+        text = stream.read()
+        stream.close()            # Explicitly close the input stream.
+
+        return cls.from_string(text, filename, problems=problems)
+
+    @classmethod
+    def from_string(cls, text, filename='<string>', previous=None,
+                    problems=None):
+        """Build an index from TEXT, the contents of the .itx file
+        FILENAME.
+
+        If PREVIOUS is given, it should be an index built from an
+        earlier version of FILENAME.  Then, only the blocks of entry
+        definitions (a top-level entry and its sub-entries) that were
+        changed since are parsed.  The entries of unchanged blocks are
+        reused from PREVIOUS (which hence is consumed, and must not be
+        used by other threads).  Otherwise, indices may be built by
+        several threads at once.
+
+        If PROBLEMS (a list) is given, the errors and warnings found in
+        the index, then and when its reference index is generated, are
+        appended to it as (FILENAME, LINE_NUMBER, SEVERITY, MESSAGE)
+        tuples, where SEVERITY is 'error' or 'warning'.  Invalid entry
+        definitions (and their sub-entries) are then left out, instead
+        of stopping the program.
+        """
         self = cls()
         
         self._filename = filename
+        self.problems = problems
+        self.digest = hashlib.sha1(text).hexdigest()
+
+        if previous is None:
+            blocks = dict()
+            parents = None
+        else:
+            blocks = previous.get_blocks()
+            parents = previous._parents
         
-        logging.info('Reading index definitions from "%s".', filename)
+        block = []
         
-        stream = open(filename, 'r')
+        for token in self._lexer.tokenize(text):
+            line_number, line, kind, alias, data = token
+
+            # A top-level entry starts a new block.
+            if (kind == LINE_ENTRY) and (data[0] is None) and block:
+                self._handle_block(block, blocks, parents)
+                block = []
+
+            block.append(token)
+
+        if block:
+            self._handle_block(block, blocks, parents)
+
+        self._build_tree()
+
+        # Whatever is left of the previous blocks was removed or
+        # changed.
+        self._removed = flatten(blocks.itervalues())
+
+        if previous is not None:
+            logging.info('Parsed %d of %d entries in "%s" (%d removed).',
+                         len(self._added), len(self), filename,
+                         len(self._removed))
+            
+        return self
+
+    def get_blocks(self):
+        """Return a map between block keys and the entries defined in
+        each block (in order).
+        """
+        blocks = defaultdict(list)
         
-        for self._line_num, line in enumerate(stream):
-            # Ignore whitespace-only lines.
-            if line.isspace():
-                continue
+        for entry in self:
+            blocks[entry.identity[0]].append(entry)
+
+        return blocks
+
+    def _get_block_key(self, block):
+        """Return a key that identifies the entry definitions in BLOCK,
+        given the current parser state.  The line numbers are not part
+        of the key, so that the key survives edits in other blocks.
+        """
+        if self._state is None:
+            self._state = repr((self._context,
+                                sorted(self._attributes.iteritems()),
+                                sorted(self._indentation_level.iteritems())))
             
-            # Keep a copy of the original line (for error messages,
-            # etc.)
-            self._current_line = line
+        digest = hashlib.sha1(self._state)
+        
+        for line_number, line, kind, alias, data in block:
+            if kind != LINE_COMMENT:
+                digest.update(line)
+                digest.update('\n')
+
+        key = digest.hexdigest()
+
+        # Identical blocks are told apart by their order.
+        self._block_counts[key] += 1
+        if self._block_counts[key] > 1:
+            key = '%s#%d' % (key, self._block_counts[key])
             
-            # Remove trailing white-space.
-            line = line.rstrip()        
-
-            # Find out whether the entry is an alias for another
-            # entry.
-            for match in self._alias_re.finditer(line):
-                line, alias = map(match.group, ['entry', 'alias'])
-                break
-            else:
-                alias = None
+        return key
+    
+    def _handle_block(self, block, blocks, parents):
+        """Handle the tokens of BLOCK.  If BLOCKS (a map between block
+        keys and lists of entries) contains the entries defined by
+        BLOCK, those are reused instead of creating new ones.  PARENTS
+        is the array of parents of the index the reused entries come
+        from.
+        """
+        self._block_key = self._get_block_key(block)
+        self._block_offset = 0
+        
+        entries = blocks.pop(self._block_key, None)
+
+        # The indentation of the last invalid entry definition, whose
+        # sub-entries are left out (when collecting problems).
+        invalid = None
+        
+        if entries is not None:
+            # The positions of the reused entries, whose line numbers
+            # are updated below.
+            positions = iter(xrange(len(self), (len(self) + len(entries))))
+            
+            for reused in entries:
+                # A parent is in the same block as its children, at
+                # the same distance.
+                parent = parents[reused.position]
+                if parent >= 0:
+                    parent = len(self) - (reused.position - parent)
+                    
+                reused.index = self
+                reused.position = self._append_entry(reused, parent)
                 
-            # Parse the line trying different matchers.  Quit trying
-            # after the first applicable matcher is used.
-            for matcher in self._matchers:
-                if matcher is None:
-                    self.syntax_error(filename, (self._line_num + 1),
-                                      "Encountered an entry, but no " \
-                                      "current entry type " \
-                                      "('*ACRONYMS*', '*CONCEPTS*', or " \
-                                      "'*PERSONS*') has been defined.")
-
-                for match in matcher.finditer(line):
-                    # Call the appropriate handler, given the current
-                    # context.
-                    try:
-                        self._match_handler[matcher](self, alias=alias,
-                                                     **match.groupdict())
-                    except entry.MissingAcronymExpansionError, e:
-                        self.syntax_error(filename, (self._line_num + 1),
-                                          'Missing full-form expansion for ' \
-                                          'acronym definition of "%s".' \
-                                          % (e.message, ))
-                    except:
-                        raise
-                    break               # To avoid the else clause.
-                else:
-                    continue            # The matcher didn't apply, so
-                                        # let's try the next one.
+        for self._line_num, self._current_line, kind, alias, data in block:
+            if kind == LINE_DIRECTIVE:
+                self.handle_meta_directive(alias=alias, **data)
+                continue
+            elif kind == LINE_COMMENT:
+                self.handle_comment(alias=alias)
+                continue
+            
+            if self._entry_fields is None:
+                self.syntax_error(self._filename, (self._line_num + 1),
+                                  "Encountered an entry, but no " \
+                                  "current entry type " \
+                                  "('*ACRONYMS*', '*CONCEPTS*', or " \
+                                  "'*PERSONS*') has been defined.")
+                continue
+
+            # Lines that do not define a valid entry in the current
+            # context are ignored.
+            if kind != LINE_ENTRY:
+                continue
+            
+            indent, fields, meta = data
+            if len(fields) > len(self._entry_fields):
+                continue
+
+            if not hasattr(self, 'default_inflection'):
+                self.syntax_error(self._filename, (self._line_num + 1),
+                                  "Encountered an entry, but no default " \
+                                  "inflection ('default_inflection=...') " \
+                                  "has been defined.")
+
+                # Assume the singular inflection, so that the rest of
+                # the entries can be checked.
+                self.default_inflection = entry.Entry.INFLECTION_SINGULAR
+
+            if entries is not None:
+                # The entry is reused, but its indentation (and line
+                # number) must still be accounted for.
+                self._get_indentation_level(indent)
+                self._lines[positions.next()] = self._line_num
+                continue
+            
+            width = len((indent or '').expandtabs())
+            if invalid is not None:
+                if width > invalid:
+                    continue
+                invalid = None
                 
-                break                   # Skip the remaining matchers.
+            values = dict.fromkeys(self._entry_fields)
+            values.update(zip(self._entry_fields, fields))
+
+            size = len(self)
             
-        stream.close()            # Explicitly close the input stream.
-        
-        return self
+            try:
+                self.handle_entry(indent=indent, meta=meta, alias=alias,
+                                  **values)
+            except entry.MissingAcronymExpansionError, e:
+                self._discard_entries(size)
+                invalid = width
+                self.syntax_error(self._filename, (self._line_num + 1),
+                                  'Missing full-form expansion for ' \
+                                  'acronym definition of "%s".' \
+                                  % (e.message, ))
+            except Exception, e:
+                if self.problems is None:
+                    raise
+
+                if isinstance(e, IndentationError):
+                    message = 'The indentation does not match any ' \
+                              'enclosing indentation level.'
+                else:
+                    message = 'Invalid entry definition (%s).' % (e, )
+                    
+                self._discard_entries(size)
+                invalid = width
+                self.syntax_error(self._filename, (self._line_num + 1),
+                                  message)
+
+    def _discard_entries(self, size):
+        """Remove the entries after the first SIZE ones (the entries
+        of a definition that turned out to be invalid).
+        """
+        del self[size:]
+        del self._parents[size:]
+        del self._depths[size:]
+        del self._lines[size:]
+        self._added = [added for added in self._added
+                       if added.position < size]
 
     def __str__(self):
         stream = StringIO()
@@ -358,130 +696,455 @@ class Index(list):
         return string
 
     def generate_reference_index(self):
-        references = defaultdict(set)
+        """Build the reference index, a map between each reference
+        phrase and the entry (and inflection) it refers to, from the
+        phrases recorded while parsing (see _add_references()).  Entries
+        that share short-form phrases must be referred to by their
+        full-form phrases.  Full-form phrases defined more than once
+        are reported together (see report_duplicates()).
+        """
+        if len(self._added) < len(self):
+            # The references of the entries reused by an incremental
+            # parse (see from_string()) have not been recorded.
+            self._record_references()
+            
+        counts = self._short_counts
         
-        for entry in self:
-            for inflection, phrase in entry.reference_short.iteritems():
-                if phrase:
-                    references[phrase].add(entry)
+        references = dict((phrase, first)
+                          for phrase, first
+                          in self._short_references.iteritems()
+                          if first[0].use_short_reference)
+        
+        # The phrases that are used as references by more than one
+        # entry.  A full-form phrase of an entry overrides the short-form
+        # phrases of the entries before it, and vice versa.
+        contested = set()
+        
+        for phrase, (entry, inflection) in self._full_references.iteritems():
+            if phrase not in references:
+                references[phrase] = (entry, inflection)
+                continue
+
+            other = references[phrase][0]
+            if other is entry:
+                continue
+            elif other.position < entry.position:
+                self._add_duplicate(phrase, other, entry)
+            else:
+                contested.add(phrase)
+
+        if self.report_duplicates() and (self.problems is None):
+            sys.exit(1)
+            
+        # Keep track of the ambiguous phrases, for use by
+        # update_reference_index().
+        self._ambiguous_phrases = set(phrase
+                                      for phrase, count in counts.iteritems()
+                                      if count > 1)
 
-        ambiguous_short_references = [
-            entries
-            for phrase, entries in sorted(references.iteritems())
-            if len(entries) > 1]
+        if self.problems is not None:
+            # The ambiguous phrases, grouped by the first entry that
+            # defined them.
+            shared = defaultdict(list)
+            for phrase in sorted(self._ambiguous_phrases):
+                shared[self._short_references[phrase][0].position].append(
+                    '"%s"' % (phrase))
+
+            for position, phrases in shared.iteritems():
+                self._add_problem(position, 'warning', 'The short-form '
+                                  'reference%s %s %s shared with later '
+                                  'entries, which must be referred to using '
+                                  'their full-form references.'
+                                  % ('s'[:(len(phrases) > 1)],
+                                     ', '.join(phrases),
+                                     ('is', 'are')[len(phrases) > 1]))
+        else:
+            for phrase in sorted(self._ambiguous_phrases):
+                logging.warn('The short-form reference "%s" is shared by %d '
+                             'entries (the first defined on line %d in "%s"), '
+                             'and hence ambiguous.  Hence, the entries must '
+                             'be referred to using the full form references.',
+                             phrase, counts[phrase], self.get_line_number(
+                    self._short_references[phrase][0].position),
+                             self._filename)
+            
+        self._contested_phrases = contested
+        self.references = references
+        self._normalized_references = None
+        self.resolve_aliases()
+
+        if self.problems is not None:
+            # Find the references that only differ in spelling now,
+            # rather than when they are first looked up.
+            self._get_normalized_references()
+
+    def report_duplicates(self):
+        """Report all the full-form references that are defined more
+        than once (or collide with the short-form reference of an
+        earlier entry), together with the lines defining them, in a
+        single error message (or, if the problems are collected, as one
+        problem per line that repeats a reference).  Return the number
+        of such references.
+        """
+        if not self._duplicates:
+            return 0
+
+        if self.problems is not None:
+            # The phrases that each entry repeats, grouped by the entry
+            # that defined them first.
+            repeated = defaultdict(list)
+            
+            for phrase, positions in sorted(self._duplicates.iteritems()):
+                positions = sorted(positions)
+                for position in positions[1:]:
+                    repeated[(position, positions[0])].append(phrase)
+
+            for (position, first), phrases in repeated.iteritems():
+                self._add_problem(position, 'error', 'The full-form '
+                                  'reference%s %s %s already defined on line '
+                                  '%d.' % ('s'[:(len(phrases) > 1)],
+                                           ', '.join('"%s"' % (phrase)
+                                                     for phrase in phrases),
+                                           ('is', 'are')[len(phrases) > 1],
+                                           self.get_line_number(first)))
+
+            return len(self._duplicates)
         
-        for entries in ambiguous_short_references:
-            logging.warn('The short-form references for the entries\n'
-                         '%s\nare the same (%s) and hence ambiguous.  '
-                         'Hence, the entries must be referred to using '
-                         'the full form references.',
-                         '\nand\n'.join(str(entry) for entry in entries),
-                         list(entries)[0].reference_short['singular'])
+        lines = ['Duplicate full-form references detected.  Please '
+                 'correct the file "%s":' % (self._filename)]
 
-        ambiguous_short_references = set(flatten(ambiguous_short_references))
+        for phrase, positions in sorted(self._duplicates.iteritems()):
+            numbers = [str(self.get_line_number(position))
+                       for position in sorted(positions)]
+            lines.append('  "%s" (line%s %s)' % (phrase,
+                                                 's'[:(len(numbers) > 1)],
+                                                 ', '.join(numbers)))
 
+        logging.error('\n'.join(lines))
+
+        return len(self._duplicates)
+
+    @staticmethod
+    def _get_entry_references(entry):
+        """Return the references of ENTRY as a dict.  A phrase shared
+        by several inflections of ENTRY refers to the last of them.
+        """
         references = dict()
         
-        for entry in self:
-            for inflection, phrase in entry.reference.iteritems():
-                if phrase in references:
-                    logging.error('Duplicate full-form reference "%s" ' \
-                                  'detected.  Please correct the file "%s".', \
-                                  phrase, self._filename)
-                    sys.exit(1)
-                    
+        for inflection, phrase in entry.reference.iteritems():
+            references[phrase] = (entry, inflection)
+
+        for inflection, phrase in entry.reference_short.iteritems():
+            if phrase:
                 references[phrase] = (entry, inflection)
 
-            if entry not in ambiguous_short_references:
-                for inflection, phrase in entry.reference_short.iteritems():
-                    references[phrase] = (entry, inflection)
+        return references
 
-                use_short_reference = True
-            else:
-                use_short_reference = False
+    def update_reference_index(self, previous):
+        """Update the reference index of PREVIOUS in place, to reflect
+        the entries that were added and removed by parsing this index
+        incrementally (see from_string()), and adopt it.  If the
+        changes involve ambiguous or contested references, the
+        reference index is generated from scratch instead.
+        """
+        if not hasattr(previous, 'references'):
+            return self.generate_reference_index()
+        
+        references = previous.references
+        contested = previous._contested_phrases
+        ambiguous = previous._ambiguous_phrases
+
+        # Remove the references of the removed entries.
+        for entry in self._removed:
+            if not entry.use_short_reference:
+                return self.generate_reference_index()
+
+            phrases = self._get_entry_references(entry)
+            if not contested.isdisjoint(phrases):
+                return self.generate_reference_index()
+
+            for phrase in phrases:
+                if references.get(phrase, (None, ))[0] is entry:
+                    del references[phrase]
 
-            entry.use_short_reference = use_short_reference
+        # Add the references of the added entries, unless they collide
+        # with existing ones.
+        for entry in self._added:
+            phrases = self._get_entry_references(entry)
+            if not ambiguous.isdisjoint(phrases):
+                return self.generate_reference_index()
+
+            for phrase in phrases:
+                if phrase in references:
+                    return self.generate_reference_index()
+                
+            references.update(phrases)
+            entry.use_short_reference = True
 
         self.references = references
+        self._contested_phrases = contested
+        self._ambiguous_phrases = ambiguous
+        self._normalized_references = None
+        self.resolve_aliases()
 
-    def get_auxiliary_entries(self, filename):
-        for i, line in enumerate(open(filename, 'r')):
-            line_number = (i + 1)
+    def resolve_aliases(self):
+        """Resolve the alias of each alias entry once, into ALIASES: a
+        map between each alias entry and a tuple (TARGET, SEE_LINES),
+        where TARGET is the (non-alias) entry at the end of the chain
+        of aliases, and SEE_LINES are the index entries that point
+        each alias in the chain to the next, nearest to TARGET first.
+        Aliases of undefined entries, and cycles of aliases, are
+        reported (with line numbers) and left out.  Return the number
+        of problems reported.
+        """
+        aliases = dict()
+        broken = set()
+        problems = 0
+        
+        for entry in self:
+            if not entry.alias:
+                continue
+
+            # Follow the chain of aliases until an entry that is not an
+            # alias (or an alias already resolved) is found.
+            chain = []
+            current = entry
 
-            # Handle recursive \@include-statements within .aux files.
-            match = self._aux_input_re.match(line.rstrip())
-            if match:
-                input_filename = match.group('filename')
+            while current.alias and (current not in aliases) \
+                      and (current not in broken):
+                if current in chain:
+                    cycle = chain[chain.index(current):] + [current]
+                    description = ' --> '.join(
+                        '"%s" (line %d)' % (alias.alias, self.get_line_number(
+                        alias.position)) for alias in cycle)
+                    if self.problems is not None:
+                        self._add_problem(current.position, 'error',
+                                          'Cycle of aliases: %s.'
+                                          % (description))
+                    else:
+                        logging.error('Cycle of aliases in "%s": %s.',
+                                      self._filename, description)
+                    problems += 1
+                    break
                 
-                logging.info('Will include "%s"', (input_filename, ))
+                chain.append(current)
+                
+                if current.alias not in self.references:
+                    if self.problems is not None:
+                        self._add_problem(current.position, 'error',
+                                          'The alias refers to "%s", which '
+                                          'is not defined.' % (current.alias))
+                    else:
+                        logging.error('The alias on line %d in "%s" refers '
+                                      'to "%s", which is not defined.',
+                                      self.get_line_number(current.position),
+                                      self._filename, current.alias)
+                    problems += 1
+                    break
 
-                for result in self.get_auxiliary_entries(input_filename):
-                    yield result
-                    
+                current, inflection = self.references[current.alias]
+            else:
+                if current.alias and (current not in broken):
+                    resolved = aliases[current]
+                elif not current.alias:
+                    resolved = (current, ())
+                else:
+                    resolved = None
+                
+                # Resolve the chain backwards from its target.
+                if resolved is not None:
+                    for alias in reversed(chain):
+                        target, see_lines = resolved
+                        see_line = alias.get_see_line(
+                            self.references[alias.alias][0])
+                        if see_line:
+                            see_lines += (see_line, )
+                        resolved = aliases[alias] = (target, see_lines)
+                    continue
+
+            broken.update(chain)
+
+        self.aliases = aliases
+        
+        return problems
+
+    def _get_normalized_references(self):
+        """Return a map between the canonical forms (see normalize())
+        of the reference phrases and the phrases.  It is built the
+        first time it is needed, after the reference index has been
+        generated.
+
+        Among the phrases sharing a canonical form, the phrases that
+        already are in that form take precedence, then the phrases in
+        lower case, and then the rest.  If the phrases of the highest
+        ranking kind refer to more than one entry, the canonical form
+        is ambiguous, and maps to None.
+        """
+        if self._normalized_references is not None:
+            return self._normalized_references
+
+        candidates = dict()
+        
+        for phrase in sorted(self.references):
+            canonical = normalize(phrase)
+
+            if canonical.encode('utf-8') == phrase:
+                rank = 0
+            elif phrase.islower():
+                rank = 1
+            else:
+                rank = 2
+
+            # The phrase that makes a canonical form ambiguous is
+            # recorded, for the warning below.
+            best = candidates.get(canonical)
+            if (best is None) or (rank < best[0]):
+                candidates[canonical] = (rank, phrase, None)
+            elif (rank == best[0]) and (best[2] is None) \
+                     and (self.references[phrase][0]
+                          is not self.references[best[1]][0]):
+                candidates[canonical] = (rank, best[1], phrase)
+
+        normalized = dict()
+        
+        for canonical, (rank, phrase, other) in candidates.iteritems():
+            if other is None:
+                normalized[canonical] = phrase
                 continue
             
-            match = self._intex_re.match(line.rstrip())
-            if not match:
-                yield (filename, line_number, False, line)
+            normalized[canonical] = None
+
+            if self.problems is not None:
+                self._add_problem(self.references[other][0].position,
+                                  'warning', 'The references "%s" and "%s" '
+                                  'only differ in spelling, and hence will '
+                                  'not be matched by other spellings.'
+                                  % (phrase, other))
                 continue
-            key, page = match.groups()
+            
+            logging.warn('The references "%s" and "%s" only differ in '
+                         'spelling, and hence will not be matched by other '
+                         'spellings.', phrase, other)
 
-            # Keep track of any page-number typesetting hints.
-            parts = escape_aware_rsplit(key, '|', 1)
+        self._normalized_references = normalized
 
-            if len(parts) > 1:
-                key, typeset_page_number = parts
-                typeset_page_number = '|' + typeset_page_number
-            else:
-                typeset_page_number = ''
+        return self._normalized_references
                 
-            # Do _not_ try to convert page into an integer, it may
-            # occurr as roman numerals.
-            yield (filename, line_number, True,
-                   (key, page, typeset_page_number))
-            
+    def resolve_reference(self, key):
+        """Return the reference phrase that KEY refers to, and the
+        entry and inflection of that phrase, or None if KEY is not
+        found.  KEY refers to the phrase that equals it, or else to the
+        phrase with the same canonical form (see
+        _get_normalized_references()).
+        """
+        try:
+            return key, self.references[key]
+        except KeyError:
+            pass
+
+        phrase = self._get_normalized_references().get(normalize(key))
+        if phrase is None:
+            return None
+
+        return phrase, self.references[phrase]
+        
     def interpret_auxiliary(self, auxiliary_filename, internal_file,
-                            index_file):
+                            index_file, usage=None, jobs=1, cache=None,
+                            records=None):
+        """Write the index entries of the references in the .aux file
+        AUXILIARY_FILENAME to INDEX_FILE, and the macros of the entries
+        referred to to INTERNAL_FILE.  If USAGE (a UsageReport) is
+        given, each reference is recorded in it.  If JOBS is larger than
+        one, the included .aux files are scanned in parallel, and if
+        CACHE (an IndexCache) is given, the records of unchanged included
+        files are reused from it (see resolve_auxiliary()); the output
+        is the same.  Return the set of (KEY, PAGE) pairs of the
+        references that were not found.
+
+        If RECORDS (an iterable of the records of the .aux file, such as
+        those generated by follow_auxiliary()) is given, they are
+        interpreted instead, and the output files are flushed after each
+        reference.
+        """
         not_found = set()
-        already_output = set()
         already_handled = set()
+
+        # The page-dependent index entries already output, as tuples of
+        # the numbers of the start of the line (see
+        # Entry.get_index_template()), the page-number hint, and the
+        # page.  Hence, a duplicate costs no formatting, and only the
+        # numbered strings are kept.
+        already_output = set()
+        texts = dict()
+        hints = dict()
+        pages = dict()
         
-        for filename, line_number, is_concept, data \
-                in self.get_auxiliary_entries(auxiliary_filename):
-            if not is_concept:
-                logging.debug('Ignoring non-concept: "%s" on line %d in "%s".',
-                              data.rstrip(), line_number, filename)
-                continue
-            
-            key, page, typeset_page_number = data
+        # The page-independent index entries and the internal macros
+        # are (at most) a few per entry, and are deduplicated as lines.
+        already_seen = set()
+        already_defined = set()
 
-            logging.debug('Handling reference "%s" on page %s.', key, page)
-            
-            if key not in self.references:
-                if key.lower() in self.references:
-                    key = key.lower()
-                    logging.debug('lowered key: %s', key)
-                else:
-                    not_found.add((key, page))
-                    continue
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+        if records is None:
+            resolved = resolve_auxiliary(self, auxiliary_filename, jobs, cache)
+        else:
+            resolved = resolve_records(self, records)
+        
+        for key, page, typeset_page_number, phrase, position, inflection \
+                in resolved:
+            if debug:
+                logging.debug('Handling reference "%s" on page %s.', key,
+                              page)
             
-            concept, inflection = self.references[key]
-            logging.debug('Reference expanded to %s (inflection=%s)',
-                          repr(concept), inflection)
+            if position < 0:
+                not_found.add((key, page))
+                continue
+
+            key, concept = phrase, self[position]
+            if debug:
+                logging.debug('Reference expanded to %r (inflection=%s)',
+                              concept, inflection)
+
+            if usage is not None:
+                usage.add(concept, key, inflection, page)
             
-            for line in concept.generate_index_entries(page,
-                                                       typeset_page_number):
-                if line not in already_output:
-                    print >> index_file, line
-                    already_output.add(line)
+            page_number = pages.get(page)
+            if page_number is None:
+                page_number = pages[page] = len(pages)
+
+            hint_number = hints.get(typeset_page_number)
+            if hint_number is None:
+                hint_number = hints[typeset_page_number] = len(hints)
+
+            # The index entries are completed from the template of
+            # the entry (see Entry.generate_index_entries()).
+            for page_dependent, text in concept.get_index_template():
+                if page_dependent:
+                    text_number = texts.get(text)
+                    if text_number is None:
+                        text_number = texts[text] = len(texts)
+
+                    line_key = (text_number, hint_number, page_number)
+                    if line_key not in already_output:
+                        print >> index_file, \
+                              text + typeset_page_number + '}{' + page + '}'
+                        already_output.add(line_key)
+                elif text not in already_seen:
+                    print >> index_file, text
+                    already_seen.add(text)
                     
             if key not in already_handled:
                 for line in concept.generate_internal_macros(inflection):
-                    if line not in already_output:
+                    if line not in already_defined:
                         print >> internal_file, line
-                        already_output.add(line)
+                        already_defined.add(line)
 
                 already_handled.add(key)
+
+            if records is not None:
+                index_file.flush()
+                internal_file.flush()
             
         return not_found
 
@@ -0,0 +1,216 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+from collections import defaultdict
+import threading
+
+INFLECTION_SINGULAR = 'singular'
+INFLECTION_PLURAL = 'plural'
+INFLECTION_NONE = 'none'
+
+# The rule pack used by indices that do not select a language (by a
+# "% language=<code>" meta directive).
+DEFAULT_LANGUAGE = 'en'
+
+# The label counted for words found among a rule pack's exceptions.
+EXCEPTION = 'exception'
+
+class SuffixRules(object):
+    """A compiled set of suffix replacement rules.  The rule with the
+    longest matching suffix is applied, by looking up the word's
+    suffixes, longest first, in a dict per suffix length.  Words in
+    EXCEPTIONS are replaced as a whole instead.
+    """
+    def __init__(self, rules, exceptions=None):
+        """RULES is a sequence of (SUFFIX, REPLACEMENT) pairs.
+        """
+        by_length = defaultdict(dict)
+
+        for suffix, replacement in rules:
+            by_length[len(suffix)].setdefault(
+                suffix, (replacement, '*%s -> *%s' % (suffix, replacement)))
+
+        # The suffix tables, longest suffixes first.
+        self._tables = [(length, by_length[length])
+                        for length in sorted(by_length, reverse=True)]
+        self._exceptions = dict(exceptions or ())
+
+        # The number of times each rule (or the exceptions) was used.
+        # The rules are shared by all indices, which may be built by
+        # several threads at once, so each thread counts on its own
+        # (see get_hits()).
+        self._local = threading.local()
+        self._counters = []
+        self._lock = threading.Lock()
+
+    def _get_counter(self):
+        """Return the hit counts of the current thread.
+        """
+        try:
+            return self._local.hits
+        except AttributeError:
+            hits = self._local.hits = defaultdict(int)
+            self._lock.acquire()
+            self._counters.append(hits)
+            self._lock.release()
+            return hits
+
+    def get_hits(self):
+        """Return a dict mapping each rule label to the number of times
+        the rule was used, by all threads.
+        """
+        self._lock.acquire()
+        counters = self._counters[:]
+        self._lock.release()
+
+        hits = defaultdict(int)
+        for counter in counters:
+            for label, count in counter.items():
+                hits[label] += count
+
+        return hits
+
+    def inflect(self, word):
+        """Return WORD, inflected by the first matching rule.
+        """
+        if word in self._exceptions:
+            self._get_counter()[EXCEPTION] += 1
+            return self._exceptions[word]
+
+        n = len(word)
+
+        for length, table in self._tables:
+            if length > n:
+                continue
+
+            rule = table.get(word[(n - length):])
+            if rule is not None:
+                replacement, label = rule
+                self._get_counter()[label] += 1
+                return word[:(n - length)] + replacement
+
+        return word
+
+class RulePack(object):
+    """The inflection rules of one language: a set of suffix rules for
+    each target inflection.
+    """
+    def __init__(self, language, to_singular, to_plural, exceptions=None):
+        """EXCEPTIONS is a sequence of (SINGULAR, PLURAL) pairs of words
+        not covered by the suffix rules.
+        """
+        exceptions = list(exceptions or ())
+
+        self.language = language
+        self._rules = {
+            INFLECTION_SINGULAR: SuffixRules(
+                to_singular, [(plural, singular)
+                              for singular, plural in exceptions]),
+            INFLECTION_PLURAL: SuffixRules(to_plural, exceptions),
+            INFLECTION_NONE: SuffixRules([]),
+            }
+
+    def inflect(self, word, inflection):
+        """Return WORD in the given (target) INFLECTION.
+        """
+        return self._rules[inflection].inflect(word)
+
+    def inflect_last_words(self, phrases, inflection):
+        """Return copies of each of the PHRASES (lists of words), with
+        their last words in the given INFLECTION.
+        """
+        inflect = self._rules[inflection].inflect
+
+        result = []
+        for words in phrases:
+            words = words[:]
+            words[-1] = inflect(words[-1])
+            result.append(words)
+
+        return result
+
+    def get_hits(self):
+        """Return a dict mapping (INFLECTION, RULE) to the number of
+        times RULE was used to produce INFLECTION.
+        """
+        return dict(((inflection, label), count)
+                    for inflection, rules in self._rules.iteritems()
+                    for label, count in rules.get_hits().iteritems())
+
+_rule_packs = dict()
+
+def register_rule_pack(rule_pack):
+    _rule_packs[rule_pack.language] = rule_pack
+
+def get_rule_pack(language=DEFAULT_LANGUAGE):
+    return _rule_packs[language]
+
+def get_rule_packs():
+    return [_rule_packs[language] for language in sorted(_rule_packs)]
+
+# English.  Each plural suffix is paired with its singular suffix.
+_english = [
+    ('yses', 'ysis'),
+    ('ices', 'ex'),
+    ('ies', 'y'),
+    ('ses', 's'),
+    ('s', ''),
+    ]
+
+register_rule_pack(RulePack(
+    'en',
+    to_singular=_english,
+    to_plural=[(singular, plural) for plural, singular in _english]))
+
+# Norwegian (bokmål).  Most nouns take -er in the indefinite plural,
+# nouns in -e take -r, and agent nouns in -er take -e.  Going from
+# plural to singular is ambiguous (biler/bil, but jenter/jente), so the
+# most common case is chosen.
+register_rule_pack(RulePack(
+    'nb',
+    to_singular=[
+        ('ere', 'er'),
+        ('er', ''),
+        ],
+    to_plural=[
+        ('', 'er'),
+        ('e', 'er'),
+        ('er', 'ere'),
+        ],
+    exceptions=[
+        ('mann', 'menn'),
+        ('barn', 'barn'),
+        ('hus', 'hus'),
+        ('menneske', 'mennesker'),
+        ('museum', 'museer'),
+        ]))
+
+def main():
+    """Module mainline (for standalone execution).
+    """
+    pass
+
+if __name__ == "__main__":
+    main()
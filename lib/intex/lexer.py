@@ -0,0 +1,212 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+import re
+import string
+
+from config import FIELD_SEPARATORS, TOKEN_COMMENT, TOKEN_ENTRY_META_INFO
+
+ALIAS_POINTER = '-->'
+ESCAPE_TOKEN = '\\'
+
+# The different kinds of lines recognized by the lexer.
+LINE_DIRECTIVE = 'directive'
+LINE_COMMENT = 'comment'
+LINE_ENTRY = 'entry'
+LINE_INVALID = 'invalid'
+
+class Lexer(object):
+    """A line lexer for .itx files.
+
+    Each line is classified and tokenized in a single left-to-right
+    pass.  None of the patterns used below can backtrack across field
+    boundaries, so the cost of lexing a line is linear in its length,
+    no matter how many escaped separators or alias pointers it
+    contains.
+    """
+    # A field starts with a non-comment, non-meta, and non-whitespace
+    # token, followed by at least one more token that is either an
+    # escaped field separator (or meta token) or anything but a field
+    # separator (or meta token).  Because nothing follows the
+    # repetition, the pattern is matched greedily without
+    # backtracking.
+    _field_re = re.compile(r'''
+    [^%(COMMENT_TOKEN)s%(META_TOKEN)s\s]
+    (?:
+     \\[%(FIELD_SEPARATORS)s%(META_TOKEN)s]
+     |
+     [^%(FIELD_SEPARATORS)s%(META_TOKEN)s]
+    )+
+    ''' % {
+        'COMMENT_TOKEN': TOKEN_COMMENT,
+        'META_TOKEN': TOKEN_ENTRY_META_INFO,
+        'FIELD_SEPARATORS': FIELD_SEPARATORS,
+        }, re.VERBOSE)
+
+    # Tokens that may not start a field.
+    _invalid_first = frozenset(TOKEN_COMMENT + string.whitespace)
+
+    _separators_re = re.compile('[%s]*' % (FIELD_SEPARATORS))
+
+    _word_re = re.compile(r'\w+$')
+
+    def __init__(self, contexts):
+        """CONTEXTS is the collection of context names (e.g.,
+        'CONCEPTS') that may be switched to by a meta directive.
+        """
+        self._contexts = frozenset(contexts)
+
+    @staticmethod
+    def split_alias(line):
+        """Split LINE into the entry and the entry being aliased, if
+        LINE contains an alias pointer.  The rightmost pointer that is
+        both preceded and followed by something is used.
+        """
+        i = line.rfind(ALIAS_POINTER)
+
+        # The pointer must be followed by something.
+        while i >= 0 and (i + len(ALIAS_POINTER)) == len(line):
+            i = line.rfind(ALIAS_POINTER, 0, (i + len(ALIAS_POINTER) - 1))
+
+        # ... and preceded by something.
+        if i < 1:
+            return line, None
+
+        return line[:i], line[(i + len(ALIAS_POINTER)):].lstrip()
+
+    def lex_directive(self, line):
+        """Return the meta directive given by LINE as a dict, or None if
+        LINE is not a meta directive.
+        """
+        body = line[len(TOKEN_COMMENT):].strip()
+
+        if len(body) > 2 and body[0] == '*' and body[-1] == '*' \
+               and body[1:-1] in self._contexts:
+            return {'attribute': None, 'value': None, 'context': body}
+
+        if '=' in body:
+            attribute, value = body.split('=', 1)
+            attribute, value = attribute.rstrip(), value.lstrip()
+
+            if self._word_re.match(attribute) and self._word_re.match(value):
+                return {'attribute': attribute, 'value': value,
+                        'context': None}
+
+        return None
+
+    def lex_entry(self, line):
+        """Tokenize an entry definition.  Returns a tuple (INDENT,
+        FIELDS, META), where FIELDS is a tuple of the field values, or
+        None if the line is not a valid entry definition.
+        """
+        body = line.lstrip()
+        indent = line[:(len(line) - len(body))] or None
+
+        if ESCAPE_TOKEN not in body:
+            # Without escapes, the fields and the meta information can
+            # be found by plain splitting.
+            head, meta_token, meta = body.partition(TOKEN_ENTRY_META_INFO)
+            if meta_token:
+                if not meta:
+                    return None
+                meta = meta_token + meta
+            else:
+                meta = None
+
+            fields = tuple(field for field in head.split(FIELD_SEPARATORS)
+                           if field)
+
+            for field in fields:
+                if (len(field) < 2) or (field[0] in self._invalid_first):
+                    return None
+
+            return indent, fields, meta
+
+        fields = []
+        i = 0
+        n = len(body)
+
+        while i < n:
+            match = self._field_re.match(body, i)
+            if match is None:
+                break
+            fields.append(match.group())
+            i = self._separators_re.match(body, match.end()).end()
+
+        if i == n:
+            meta = None
+        elif body[i] == TOKEN_ENTRY_META_INFO and (i + 1) < n:
+            meta = body[i:]
+        else:
+            return None
+
+        return indent, tuple(fields), meta
+
+    def tokenize(self, text):
+        """Generate one token per non-blank line in TEXT.  Each token is
+        a tuple (LINE_NUMBER, LINE, KIND, ALIAS, DATA), where LINE_NUMBER
+        is zero-based, LINE is the original line, and DATA depends on
+        KIND:
+
+          LINE_DIRECTIVE -- a dict of the directive's attribute, value,
+                            and context,
+          LINE_COMMENT   -- None,
+          LINE_ENTRY     -- an (INDENT, FIELDS, META) tuple, and
+          LINE_INVALID   -- None.
+        """
+        for line_number, line in enumerate(text.split('\n')):
+            # Ignore blank lines.
+            stripped = line.rstrip()
+            if not stripped:
+                continue
+
+            # Find out whether the entry is an alias for another
+            # entry.
+            stripped, alias = self.split_alias(stripped)
+
+            if stripped.lstrip()[:1] == TOKEN_COMMENT:
+                # Meta directives must start in the first column.
+                directive = (stripped[0] == TOKEN_COMMENT) \
+                            and self.lex_directive(stripped)
+                if directive:
+                    yield line_number, line, LINE_DIRECTIVE, alias, directive
+                else:
+                    yield line_number, line, LINE_COMMENT, alias, None
+                continue
+
+            entry = self.lex_entry(stripped)
+
+            if entry is None:
+                yield line_number, line, LINE_INVALID, alias, None
+            else:
+                yield line_number, line, LINE_ENTRY, alias, entry
+
+def main():
+    """Module mainline (for standalone execution).
+    """
+    pass
+
+if __name__ == "__main__":
+    main()
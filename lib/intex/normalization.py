@@ -0,0 +1,124 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+import re
+import unicodedata
+
+# The combining characters of the LaTeX accent macros.
+_accents = {
+    '`': u'̀',
+    "'": u'́',
+    '^': u'̂',
+    '~': u'̃',
+    '=': u'̄',
+    'u': u'̆',
+    '.': u'̇',
+    '"': u'̈',
+    'r': u'̊',
+    'H': u'̋',
+    'v': u'̌',
+    'd': u'̣',
+    'c': u'̧',
+    'k': u'̨',
+    'b': u'̱',
+    }
+
+# The characters typeset by LaTeX macros (without arguments).
+_letters = {
+    'ss': u'ß',
+    'aa': u'å',
+    'AA': u'Å',
+    'ae': u'æ',
+    'AE': u'Æ',
+    'oe': u'œ',
+    'OE': u'Œ',
+    'o': u'ø',
+    'O': u'Ø',
+    'l': u'ł',
+    'L': u'Ł',
+    'i': u'i',
+    'j': u'j',
+    }
+
+# An accent macro applied to a letter (or a dotless \i or \j), as in
+# \'e, \'{e}, {\'e}, \v c, or \c{c}.  The macros named by letters must
+# be followed by a space or a brace.
+_accent_re = re.compile(r'(\{)?\\(?:([`\'^"~=.])|([%s])(?=[\s{]))\s*'
+                        r'(?:\{\s*(\\[ij]|[^\W\d_])\s*\}'
+                        r'|(\\[ij])(?![a-zA-Z])\s?|([^\W\d_]))(?(1)\})'
+                        % (''.join(accent for accent in _accents
+                                   if accent.isalpha())), re.UNICODE)
+
+# A letter macro, as in \o, {\o}, \o{}, or \aa (which swallows the
+# following space).
+_letter_re = re.compile(r'(\{)?\\(%s)(?![a-zA-Z])(?(1)\}|(?:\{\}|\s?))'
+                        % ('|'.join(sorted(_letters, key=len, reverse=True))))
+
+def _replace_accent(match):
+    accent = match.group(2) or match.group(3)
+    letter = match.group(4) or match.group(5) or match.group(6)
+
+    return _letters.get(letter[1:], letter) + _accents[accent]
+
+def _replace_letter(match):
+    return _letters[match.group(2)]
+
+def decode(string):
+    """Return STRING as a unicode string.  Byte strings are decoded as
+    UTF-8, or, if they are not valid UTF-8, as Latin-1.
+    """
+    if isinstance(string, str):
+        try:
+            return string.decode('utf-8')
+        except UnicodeDecodeError:
+            return string.decode('latin-1')
+
+    return string
+
+def normalize(key):
+    """Return the canonical form of KEY (a reference phrase): A unicode
+    string with LaTeX accent and letter macros replaced by the
+    characters they typeset, in Unicode normal form C, with ties (~),
+    control spaces, and runs of whitespace replaced by single spaces,
+    and in lower case.  Phrases that only differ in spelling details
+    like these have the same canonical form.
+    """
+    key = decode(key)
+    
+    if u'\\' in key:
+        key = _accent_re.sub(_replace_accent, key)
+        key = _letter_re.sub(_replace_letter, key).replace(u'\\ ', u' ')
+
+    key = u' '.join(key.replace(u'~', u' ').split())
+
+    return unicodedata.normalize('NFC', key).lower()
+
+def main():
+    """Module mainline (for standalone execution).
+    """
+    pass
+
+if __name__ == "__main__":
+    main()
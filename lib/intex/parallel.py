@@ -0,0 +1,104 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+import cPickle
+import multiprocessing
+import sys
+
+from index import Index
+
+def load_index(filename, cache=None):
+    """Return the index defined in FILENAME, with its reference index
+    generated.  If CACHE is given, it is used to avoid re-parsing
+    unchanged files.
+    """
+    if cache is not None:
+        return cache.get_index(filename)
+
+    index = Index.from_file(filename)
+    index.generate_reference_index()
+
+    return index
+
+def _load_packed_index((filename, cache)):
+    """Load an index in a worker process, and return it pickled (which
+    is far more compact than the default pickling done by the pool),
+    together with the worker's cache statistics.
+    """
+    try:
+        index = load_index(filename, cache)
+    except SystemExit, e:
+        # Let the parent process do the exiting, so that the pool is
+        # not left waiting for a dead worker.
+        return None, e.code, None
+
+    if cache is None:
+        statistics = None
+    else:
+        statistics = (cache.hits, cache.misses)
+
+    return cPickle.dumps(index, cPickle.HIGHEST_PROTOCOL), None, statistics
+
+def load_indices(filenames, jobs=1, cache=None):
+    """Return one index per file in FILENAMES (in the same order).  If
+    JOBS is larger than one, the files are parsed in (at most) JOBS
+    worker processes.
+    """
+    jobs = min(jobs, len(filenames))
+
+    if jobs <= 1:
+        return [load_index(filename, cache) for filename in filenames]
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        results = pool.map(_load_packed_index,
+                           [(filename, cache) for filename in filenames],
+                           chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    indices = []
+
+    for data, exit_code, statistics in results:
+        if data is None:
+            sys.exit(exit_code)
+
+        if statistics is not None:
+            hits, misses = statistics
+            cache.hits += hits
+            cache.misses += misses
+
+        indices.append(cPickle.loads(data))
+
+    return indices
+
+def main():
+    """Module mainline (for standalone execution).
+    """
+    pass
+
+if __name__ == "__main__":
+    main()
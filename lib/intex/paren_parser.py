@@ -43,6 +43,14 @@ class UnexpectedClosingError(ValueError):
     pass
 
 class ParenParser(object):
+    """A parser for strings with (possibly nested) parenthetical scopes.
+
+    The parser keeps no scanning state on itself, so one instance can
+    safely be shared, even between threads.  The outermost scopes of
+    each string are computed in a single pass, and are remembered (for
+    up to _SCOPE_CACHE_SIZE strings), so that splitting and stripping
+    the same string several times only scans it once.
+    """
     ESCAPE_TOKEN = '\\'
 
     __default_paren_pair = {
@@ -50,63 +58,95 @@ class ParenParser(object):
         '{': '}',
         '[': ']',
         }
+
+    _SCOPE_CACHE_SIZE = 10000
+
+    _whitespace_re = re.compile(r'\s+')
     
     def __init__(self, paren_pair=__default_paren_pair):
         self.__paren_pair = paren_pair
         self.__closings = set(self.__paren_pair.values())
+
+        # Each match is a parenthetical token, together with the run
+        # of escape tokens right in front of it.  The look-behind
+        # makes every match start at the beginning of such a run.
+        tokens = ''.join(self.__paren_pair) + ''.join(self.__closings)
+        self.__token_re = re.compile(r'(?<!%s)(%s*)([%s])'
+                                     % (re.escape(self.ESCAPE_TOKEN),
+                                        re.escape(self.ESCAPE_TOKEN),
+                                        re.escape(tokens)))
         
-    def __reset(self):
-        self.__consecutive_escapes = 0  # The number of consecutive escapes.
-        self.__opened_scopes = []       # A stack of opened scopes.
-        self.__expected_closing = None
-        
-    def __update_expected_closing(self):
-        if self.__opened_scopes:
-            most_recent_opening = self.__opened_scopes[-1][0]
-            self.__expected_closing = self.__paren_pair[most_recent_opening]
-        else:
-            self.__expected_closing = None
+        self.__outer_scopes = dict()
         
-    def get_scope_spans(self, string, start_index=0):
-        self.__reset()
+    def __iter_scopes(self, string, start_index=0):
+        """Generate (START, END, DEPTH) for each scope in STRING, in the
+        order they are closed, where DEPTH is the number of scopes
+        still open around it.
+        """
+        opened_scopes = []              # A stack of opened scopes.
+        expected_closing = None
         
-        for i in xrange(start_index, len(string)):
-            token = string[i]
-            
-            if token == self.ESCAPE_TOKEN:
-                self.__consecutive_escapes += 1
+        for match in self.__token_re.finditer(string, start_index):
+            # Skip tokens escaped by an odd number of escape tokens.
+            escapes, token = match.groups()
+            if len(escapes) & 1:
                 continue
+
+            i = match.start(2)
             
-            # If the current TOKEN is not escaped; that is, the
-            # __CONSECUTIVE_ESCAPES is zero or odd (bit-wise "& 1")...
-            if not (self.__consecutive_escapes & 1):
-                # If the TOKEN is an expected closing...
-                if token == self.__expected_closing:
-                    # Yield the start and end index for the closing
-                    # scope.
-                    yield self.__opened_scopes.pop()[1], (i + 1)
-                    
-                    self.__update_expected_closing()
-
-                # If TOKEN is an unexpected closing...
-                elif token in self.__closings:
-                    j = self.__opened_scopes[-1][1]
-                    reason = "Received unexpected closing '%s' at " \
-                             "input position %d.  " \
-                             "Input (from position %d):\n%s\n" \
-                             "Expected closing was '%s'." \
-                             % (token, i, j, string[j:(i + 1)],
-                                self.__expected_closing)
-                    raise UnexpectedClosingError, reason
+            # If the TOKEN is an expected closing...
+            if token == expected_closing:
+                # Yield the start and end index for the closing scope.
+                opening, j = opened_scopes.pop()
+                yield j, (i + 1), len(opened_scopes)
+                
+            # If TOKEN is an unexpected closing...
+            elif token in self.__closings:
+                if opened_scopes:
+                    j = opened_scopes[-1][1]
+                else:
+                    j = start_index
+                reason = "Received unexpected closing '%s' at " \
+                         "input position %d.  " \
+                         "Input (from position %d):\n%s\n" \
+                         "Expected closing was '%s'." \
+                         % (token, i, j, string[j:(i + 1)], expected_closing)
+                raise UnexpectedClosingError, reason
                 
-                # If TOKEN is a legal opening token...
-                elif (token in self.__paren_pair):
-                    self.__opened_scopes.append((token, i))
-                    self.__update_expected_closing()
-                    
-            # Reset the escape-token counter.
-            self.__consecutive_escapes = 0
+            # If TOKEN is a legal opening token...
+            else:
+                opened_scopes.append((token, i))
+
+            if opened_scopes:
+                expected_closing = self.__paren_pair[opened_scopes[-1][0]]
+            else:
+                expected_closing = None
 
+    def get_scope_spans(self, string, start_index=0):
+        """Generate the (START, END) spans of all the scopes in STRING,
+        innermost scopes first.
+        """
+        for i, j, depth in self.__iter_scopes(string, start_index):
+            yield i, j
+        
+    def get_outer_scopes(self, string):
+        """Return a tuple of the (START, END) spans of the outermost
+        scopes in STRING, in order.
+        """
+        try:
+            return self.__outer_scopes[string]
+        except KeyError:
+            pass
+
+        scopes = tuple((i, j) for i, j, depth in self.__iter_scopes(string)
+                       if depth == 0)
+
+        if len(self.__outer_scopes) >= self._SCOPE_CACHE_SIZE:
+            self.__outer_scopes.clear()
+        self.__outer_scopes[string] = scopes
+        
+        return scopes
+            
     @staticmethod
     def filter_outer_scopes(scopes):
         """Removes scopes that appear inside other scopes.  Hence, only
@@ -129,59 +169,92 @@ class ParenParser(object):
             keep.append((i, j))
             
         return keep
+
+    def is_escaped(self, string, i):
+        """Return True if the token in STRING at position I is preceded
+        by an odd number of escape tokens.
+        """
+        n = 0
+        while (i > n) and (string[i - n - 1] == self.ESCAPE_TOKEN):
+            n += 1
+
+        return bool(n & 1)
     
-    def split(self, string, separator=None, maxsplit=None):
+    def __iter_separators(self, string, separator, start_index, escape_aware):
+        """Generate the (START, END) spans of the separators in STRING
+        that are not inside any scope.
+        """
+        k = start_index
+        
+        for i, j in self.get_outer_scopes(string) + ((len(string), None), ):
+            if separator is None:
+                for match in self._whitespace_re.finditer(string, k, i):
+                    if not (escape_aware and self.is_escaped(string,
+                                                             match.start())):
+                        yield match.span()
+            else:
+                m = string.find(separator, k, i)
+                while m >= 0:
+                    if not (escape_aware and self.is_escaped(string, m)):
+                        yield m, (m + len(separator))
+                    m = string.find(separator, (m + len(separator)), i)
+            k = j
+            
+    def split(self, string, separator=None, maxsplit=None,
+              escape_aware=False):
         """Return a list of the words in the string STRING, using
         SEPARATOR as the delimiter string, but scopes defined by
         parenthetical tokens are not split.  If MAXSPLIT is given, at
         most MAXSPLIT splits are done.  If SEPARATOR is not specified
-        or is None, any whitespace string is a separator.
-
-        Please note: The MAXSPLIT argument is not honored yet.
+        or is None, any whitespace string is a separator.  If
+        ESCAPE_AWARE is true, escaped separators are not split at.
         """
-        # Make sure only outermost scopes are considered.
-        indices = self.filter_outer_scopes(self.get_scope_spans(string))
+        if maxsplit is None:
+            maxsplit = -1
 
-        # If no parenthetical scopes were detected, there are no
-        # scopes to honor.
-        if not indices:
-            return string.split(separator)
-        
-        # The following is added to avoid any special-case handling
-        # after the for-loop below.
-        if indices[-1][-1] < len(string):
-            indices.append((-1, None))
-        
-        k = None
-        result = []
-        
-        for i, j in indices:
-            parts = filter(''.__ne__, string[k:i].split(separator)) \
-                    + [string[i:j]]
+        # If no parenthetical scopes (or escapes) were detected, there
+        # are no scopes to honor.
+        if not (self.get_outer_scopes(string)
+                or (escape_aware and (self.ESCAPE_TOKEN in string))):
+            return string.split(separator, maxsplit)
+
+        if separator is None:
+            # Leading whitespace is ignored, as by str.split().
+            k = len(string) - len(string.lstrip())
+        else:
+            k = 0
             
-            first_part = parts[0]
-            if result and (k is not None) and (first_part[0] == string[k]):
-                result[-1] += first_part
-            else:
-                result.append(first_part)
+        result = []
 
-            if len(parts) > 1:
-                result.extend(parts[1:-1])
-                
-                last_part = parts[-1]
-                if result[-1][-1] == string[i - 1]:
-                    result[-1] += last_part
-                else:
-                    result.append(last_part)
-                
+        for i, j in self.__iter_separators(string, separator, k,
+                                           escape_aware):
+            if len(result) == maxsplit:
+                break
+            
+            result.append(string[k:i])
             k = j
 
+        # As with str.split(), whitespace separation never yields
+        # empty words.
+        if (separator is not None) or (k < len(string)):
+            result.append(string[k:])
+        
         return result
 
     def strip(self, string, valid_left_sides=''.join(__default_paren_pair)):
-        if (len(string) > 1) \
-           and (string[0] in valid_left_sides) \
-           and (string[-1] in self.__default_paren_pair[string[0]]):
+        """Return STRING without its surrounding parenthetical tokens,
+        if STRING is one scope opened by a token in VALID_LEFT_SIDES.
+        """
+        if (len(string) < 2) or (string[0] not in valid_left_sides) \
+               or (string[-1] != self.__paren_pair[string[0]]):
+            return string
+
+        try:
+            scopes = self.get_outer_scopes(string)
+        except UnexpectedClosingError:
+            return string
+        
+        if scopes[:1] == ((0, len(string)), ):
             return string[1:-1]
         else:
             return string
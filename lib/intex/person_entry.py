@@ -23,11 +23,19 @@ __author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
 __revision__ = "$Rev$"
 __version__ = "@VERSION@"
 
-from utils import escape_aware_split
-from entry import Entry
+import escaping
+from entry import Entry, InflectionArray
 import string
 
 class PersonEntry(Entry):
+    __slots__ = (
+        'reference',
+        'reference_short',
+        'typeset_in_text_first',
+        'typeset_in_text_last',
+        'typeset_in_index',
+        )
+    
     _generated_fields = [
         # The values of REFERENCE are how this entry will be referred
         # to in the text (\co{<reference>}).
@@ -52,12 +60,16 @@ class PersonEntry(Entry):
 
     _sortkey_remove = [',', '\\', '"', "'", '{', '}', ]
 
+    # The arguments to str.translate() that remove _SORTKEY_REMOVE.
+    _identity_table = string.maketrans('', '')
+    _sortkey_delete = ''.join(_sortkey_remove)
+
     def __init__(self, index, parent, initials=None, name=None,
                  index_as=None, sort_as=None, meta=None, alias=None,
                  **rest):
         
         for attribute in self._generated_fields:
-            setattr(self, attribute, dict.fromkeys([Entry.INFLECTION_NONE,]))
+            setattr(self, attribute, InflectionArray())
             
         Entry.__init__(self, index, parent, meta)
 
@@ -65,7 +77,7 @@ class PersonEntry(Entry):
         # here.
         self.alias = alias
 
-        names = escape_aware_split(name, ',')
+        names = escaping.split(name, ',')
         
         if len(names) > 1:
             last_name, first_name = names
@@ -101,6 +113,8 @@ class PersonEntry(Entry):
         for field, variable in field_variable_map:
             getattr(self, field)[Entry.INFLECTION_NONE] = variables[variable]
 
+        self.intern_fields(field_variable_map)
+        
         self.index_inflection = Entry.INFLECTION_NONE
         
     def get_plain_header(self):
@@ -120,9 +134,23 @@ class PersonEntry(Entry):
                           for attribute in self._generated_fields]) \
                 + alias_line
 
-    def generate_index_entries(self, page, typeset_page_number=''):
+    def compile_index_template(self):
         inflection = self.index_inflection
 
+        # If this is an alias entry, the index entries are affected.
+        # Generate the index entries accordingly.
+        if self.alias:
+            # Aliases that could not be resolved have been reported
+            # by Index.resolve_aliases().
+            if self not in self.index.aliases:
+                return ()
+            
+            concept, see_lines = self.index.aliases[self]
+            
+            # Skip the regular index entries.
+            return concept.get_index_template() \
+                   + tuple((False, line) for line in see_lines)
+        
         typeset_in_index = self.typeset_in_index[inflection]
 
         # TODO: Handle this in a more proper manner.  The use of
@@ -130,28 +158,15 @@ class PersonEntry(Entry):
         # with the authorindex package.
         # The original read: sort_as = typeset_in_index
         #
-        table = string.maketrans('', '')
-        delete = ''.join(self._sortkey_remove)
-        
-        sort_as = typeset_in_index.upper().translate(table, delete)
+        sort_as = typeset_in_index.upper().translate(self._identity_table,
+                                                     self._sortkey_delete)
 
         # For compatibility with the authorindex package:
         last, rest = typeset_in_index.split(None, 1)
         typeset_in_index = '%s %s' % (last, '~'.join(rest.split()), )
         
-        # If this is an alias entry, the index entries are affected.
-        # Generate the index entries accordingly.
-        if self.alias:
-            concept, _inflection = self.index.references[self.alias]
-            for entry in concept.generate_index_entries(page,
-                                                        typeset_page_number):
-                yield entry
-                
-            return                   # Skip the regular index entries.
-        
-        yield '\indexentry{%(sort_as)s@%(typeset_in_index)s' \
-              '%(typeset_page_number)s}{%(page)s}' \
-              % locals()
+        return ((True, '\indexentry{%(sort_as)s@%(typeset_in_index)s'
+                 % locals()), )
 
     def generate_internal_macros(self, inflection):
         type_name = self.get_entry_type()
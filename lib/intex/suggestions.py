@@ -0,0 +1,294 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import compress, imap, islice
+import logging
+from operator import eq
+import time
+
+from normalization import normalize
+from utils import sort_pages
+
+# The length of the n-grams that the keys are indexed by.
+GRAM_LENGTH = 3
+
+# The number of n-grams, beyond those that the allowed edits may
+# destroy, that are looked up for each query.  Candidates must share at
+# least this many of them with the query.
+EXTRA_GRAMS = 3
+
+# The number of suggestions returned for each key, by default.
+SUGGESTIONS = 3
+
+_padding = (u'\x02' * (GRAM_LENGTH - 1), u'\x03' * (GRAM_LENGTH - 1))
+
+def get_grams(string):
+    """Return the set of n-grams of STRING, padded at both ends.
+    """
+    string = _padding[0] + string + _padding[1]
+
+    return set([string[i:(i + GRAM_LENGTH)]
+                for i in xrange(len(string) - GRAM_LENGTH + 1)])
+
+def get_max_distance(string):
+    """Return the largest edit distance between STRING and the keys
+    suggested for it.
+    """
+    if len(string) < 6:
+        return 1
+    else:
+        return 2
+
+def get_distance(a, b, limit):
+    """Return the (Levenshtein) edit distance between the strings A and
+    B, or LIMIT + 1 if it is larger than LIMIT.  Only the diagonal band
+    of width 2 * LIMIT + 1 of the table of distances is computed.
+    """
+    n, m = len(a), len(b)
+    if abs(n - m) > limit:
+        return limit + 1
+
+    # The common prefix and suffix do not add to the distance.
+    i = 0
+    while (i < n) and (i < m) and (a[i] == b[i]):
+        i += 1
+    while (n > i) and (m > i) and (a[n - 1] == b[m - 1]):
+        n -= 1
+        m -= 1
+    a, b = a[i:n], b[i:m]
+    n, m = (n - i), (m - i)
+    
+    too_far = limit + 1
+    previous = range(m + 1)
+
+    for i in xrange(1, n + 1):
+        first = max(1, i - limit)
+        last = min(m, i + limit)
+
+        current = [too_far] * (m + 1)
+        if first == 1:
+            current[0] = i
+
+        token = a[i - 1]
+        best = current[0] if (first == 1) else too_far
+
+        for j in xrange(first, last + 1):
+            cost = previous[j - 1] + (token != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost
+            if cost < best:
+                best = cost
+
+        if best > limit:
+            return too_far
+
+        previous = current
+
+    return min(previous[m], too_far)
+
+class SuggestionIndex(object):
+    """An index of reference phrases, for suggesting the phrases that an
+    unresolved reference may have been meant as.  The canonical forms
+    (see normalize()) of the phrases are indexed by their n-grams.  The
+    index is built the first time it is used.
+    """
+    def __init__(self, references):
+        """REFERENCES is an iterable of (PHRASE, TARGET) pairs, read when
+        the index is built.  TARGET is what PHRASE refers to (such as an
+        entry).  Only the nearest phrase of each target is suggested.
+        """
+        self._source = references
+
+        # The canonical forms of the phrases, one phrase for each, and
+        # its target, all indexed by key number.
+        self._keys = None
+        self._phrases = None
+        self._targets = None
+
+        # The number of the first key of each length, and a map between
+        # each n-gram and the numbers of the keys it occurs in.
+        self._offsets = None
+        self._postings = None
+
+    @classmethod
+    def from_indices(cls, indices):
+        """Return a suggestion index of the reference phrases of
+        INDICES.
+        """
+        return cls((phrase, entry) for index in indices
+                   for phrase, (entry, inflection)
+                   in index.references.iteritems())
+
+    def _build(self):
+        start = time.time()
+
+        # The phrases in lower case are preferred as suggestions.
+        phrases = dict()
+        for phrase, target in self._source:
+            key = normalize(phrase)
+            other = phrases.get(key, (None, ))[0]
+            if (other is None) or ((not phrase.islower(), phrase)
+                                   < (not other.islower(), other)):
+                phrases[key] = (phrase, target)
+
+        # The keys are numbered in order of length.  Hence, the keys of
+        # each length are numbered consecutively, from the offset of
+        # that length, and so are they in the (sorted) lists of the
+        # numbers of the keys each n-gram occurs in.
+        keys = sorted(phrases, key=len)
+        offsets = array('i', [0])
+        postings = defaultdict(lambda: array('i'))
+
+        for number, key in enumerate(keys):
+            while len(offsets) <= len(key):
+                offsets.append(number)
+            
+            for gram in get_grams(key):
+                postings[gram].append(number)
+
+        offsets.append(len(keys))
+
+        self._keys = keys
+        self._phrases = [phrases[key][0] for key in keys]
+        self._targets = [phrases[key][1] for key in keys]
+        self._offsets = offsets
+        self._postings = dict(postings)
+        self._source = None
+
+        logging.info('Indexed %d reference phrases for suggestions in '
+                     '%.3f s.', len(keys), (time.time() - start))
+
+    def __len__(self):
+        if self._keys is None:
+            self._build()
+
+        return len(self._keys)
+
+    def suggest(self, phrase, limit=SUGGESTIONS):
+        """Return up to LIMIT reference phrases that are within a small
+        edit distance (see get_max_distance()) of PHRASE, nearest first,
+        except those of the target of PHRASE, if it has one.  Phrases of
+        a single character are too short to be looked up.
+        """
+        if self._keys is None:
+            self._build()
+
+        key = normalize(phrase)
+        max_distance = get_max_distance(key)
+
+        # Only the keys whose lengths are within MAX_DISTANCE of the
+        # length of KEY are considered.
+        offsets = self._offsets
+        first = offsets[min(max(0, (len(key) - max_distance)),
+                            (len(offsets) - 1))]
+        last = offsets[min((len(key) + max_distance + 1), (len(offsets) - 1))]
+
+        postings = []
+        for gram in get_grams(key):
+            numbers = self._postings.get(gram)
+            if numbers is None:
+                postings.append(())
+            else:
+                postings.append(numbers[bisect_left(numbers, first):
+                                        bisect_left(numbers, last)])
+        
+        # An edit destroys at most GRAM_LENGTH of the n-grams of KEY.
+        # Hence, if KEY has P n-grams, each key within MAX_DISTANCE
+        # shares at least P - MAX_DISTANCE * GRAM_LENGTH of them.  The
+        # rarest n-grams are used, to keep the candidates few.
+        postings.sort(key=len)
+        postings = postings[:(max_distance * GRAM_LENGTH + EXTRA_GRAMS)]
+        required = len(postings) - max_distance * GRAM_LENGTH
+
+        if required < 1:
+            return []
+
+        # In the sorted list of the numbers in these postings, the
+        # numbers that occur at least REQUIRED times are those equal to
+        # the number REQUIRED - 1 places further on.
+        numbers = array('i')
+        for part in postings:
+            numbers.extend(part)
+        numbers = sorted(numbers)
+        
+        keys = self._keys
+        candidates = []
+
+        for number in set(compress(numbers, imap(eq, numbers,
+                                                 islice(numbers,
+                                                        (required - 1),
+                                                        None)))):
+            distance = get_distance(key, keys[number], max_distance)
+            if distance <= max_distance:
+                candidates.append((distance, self._phrases[number],
+                                   self._targets[number]))
+
+        candidates.sort()
+
+        suggestions = []
+        targets = []
+        
+        for distance, phrase, target in candidates:
+            if target in targets:
+                continue
+            
+            targets.append(target)
+
+            # The target of a phrase with the same canonical form as
+            # PHRASE is not suggested, as PHRASE would refer to it.
+            if distance == 0:
+                continue
+            
+            suggestions.append(phrase)
+            
+            if len(suggestions) == limit:
+                break
+
+        return suggestions
+
+def group_misses(not_found):
+    """Return a list of each key in NOT_FOUND (an iterable of (KEY,
+    PAGE) pairs), together with a sorted list of the pages it occurs
+    on, ordered by key.
+    """
+    pages = defaultdict(set)
+    for key, page in not_found:
+        pages[key].add(page)
+
+    return [(key, sort_pages(pages[key])) for key in sorted(pages)]
+
+def main():
+    """Module mainline (for standalone execution).
+    """
+    pass
+
+if __name__ == "__main__":
+    main()
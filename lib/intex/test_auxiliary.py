@@ -0,0 +1,299 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+from cStringIO import StringIO
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from auxiliary import follow_auxiliary, resolve_auxiliary, scan_auxiliary, \
+     _encode
+from cache import IndexCache
+from index import Index
+from test_support import get_auxiliary_entries
+
+def get_records(filename):
+    """Return the records of FILENAME found by get_auxiliary_entries().
+    """
+    return [data for filename, line_number, is_concept, data
+            in get_auxiliary_entries(filename) if is_concept]
+
+class ScanTestCase(unittest.TestCase):
+    files = {
+        'main.aux': [
+            '\\relax',
+            '\\@writefile{raw}{\\indexentry{graph}{1}}',
+            '\\@writefile{toc}{\\contentsline {section}{Graphs}{1}}',
+            '\\@writefile{raw}{\\indexentry{graph theory|textbf}{iv}}',
+            '\\@input{chapter.aux}',
+            '\\@input{empty.aux}',
+            '\\@writefile{raw}{\\indexentry{{\\em tree} \\{x}{12}}\r',
+            '  \\@writefile{raw}{\\indexentry{indented}{3}}',
+            '\\newlabel{x}{{1}{2}}\\@writefile{raw}{\\indexentry{late}{3}}',
+            '\\@writefile{raw}{\\indexentry{unbalanced\\}{5}}',
+            '\\@writefile{raw}{\\indexentry{a|b\\|c}{6}}',
+            '\\@writefile{raw}{\\indexentry{{a{b{c}}}d}{13}}',
+            '\\@input{last.aux}',
+            ],
+        'chapter.aux': [
+            '\\@writefile{raw}{\\indexentry{forest}{7}}',
+            '\\@writefile{raw}{\\indexentry{bad}{x y}}',
+            ],
+        'empty.aux': [],
+        'last.aux': [
+            '\\@writefile{raw}{\\indexentry{last}{14}}',
+            ],
+        }
+
+    records = [
+        ('graph', '1', ''),
+        ('graph theory', 'iv', '|textbf'),
+        ('forest', '7', ''),
+        ('{\\em tree} \\{x', '12', ''),
+        ('unbalanced\\', '5', ''),
+        ('a', '6', '|b\\|c'),
+        ('{a{b{c}}}d', '13', ''),
+        ('last', '14', ''),
+        ]
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+
+        for filename, lines in self.files.iteritems():
+            stream = open(filename, 'wb')
+            stream.write(''.join(line + '\n' for line in lines))
+            stream.close()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+        
+    def runTest(self):
+        self.assertEqual(list(scan_auxiliary('main.aux')), self.records)
+        self.assertEqual(get_records('main.aux'), self.records)
+
+        # The keys are parsed with brace matching, so a key is not
+        # extended to a later page on the same line.
+        stream = open('main.aux', 'ab')
+        stream.write('\\@writefile{raw}{\\indexentry{x}{8}} {y}{9}}\n')
+        stream.write('\\@input{missing.aux}\n')
+        stream.close()
+
+        self.assertEqual(list(scan_auxiliary('main.aux')),
+                         self.records + [('x', '8', '')])
+        self.assertEqual(list(scan_auxiliary('missing.aux')), [])
+        
+class ResolveTestCase(ScanTestCase):
+    text = '\n'.join(['% default_inflection=singular',
+                      '% *CONCEPTS*',
+                      'graph',
+                      'graph theory',
+                      'forest',
+                      'last',
+                      ''])
+    
+    def runTest(self):
+        self.assertEqual(list(scan_auxiliary('main.aux', recursive=False)),
+                         self.records[:2] + ['chapter.aux', 'empty.aux']
+                         + self.records[3:-1] + ['last.aux'])
+        
+        index = Index.from_string(self.text)
+        index.generate_reference_index()
+
+        # The included files are resolved by worker processes, but the
+        # records are in document order.
+        records = list(resolve_auxiliary(index, 'main.aux'))
+        self.assertEqual([record[:3] for record in records], self.records)
+        self.assertEqual([record[3:5] for record in records
+                          if record[4] >= 0],
+                         [('graph', 0), ('graph theory', 1), ('forest', 2),
+                          ('last', 3)])
+        self.assertEqual(list(resolve_auxiliary(index, 'main.aux', 3)),
+                         records)
+
+        outputs = []
+        for jobs in [1, 3]:
+            internal_file, index_file = StringIO(), StringIO()
+            not_found = index.interpret_auxiliary('main.aux', internal_file,
+                                                  index_file, jobs=jobs)
+            outputs.append((internal_file.getvalue(), index_file.getvalue(),
+                            not_found))
+        self.assertEqual(outputs[0], outputs[1])
+        
+class CacheTestCase(ResolveTestCase):
+    def runTest(self):
+        index = Index.from_string(self.text)
+        index.generate_reference_index()
+        
+        cache = IndexCache(os.path.join(self.directory, 'cache'))
+        records = list(resolve_auxiliary(index, 'main.aux'))
+
+        # The first time, the included files are resolved and cached.
+        self.assertEqual(list(resolve_auxiliary(index, 'main.aux', 1, cache)),
+                         records)
+        path = cache.get_records_path('chapter.aux', index)
+        self.assertEqual(list(resolve_auxiliary(index, 'chapter.aux')),
+                         list(resolve_auxiliary(index, 'chapter.aux', 1,
+                                                cache)))
+
+        # The cached records are used as long as the file is unchanged.
+        replayed = [('forest', '70', '', 'forest', 2, 'singular')]
+        cache.store(path, _encode(replayed))
+        self.assertEqual(list(resolve_auxiliary(index, 'main.aux', 1,
+                                                cache))[2:3], replayed)
+
+        stream = open('chapter.aux', 'ab')
+        stream.write('\\@writefile{raw}{\\indexentry{last}{8}}\n')
+        stream.close()
+        
+        records = list(resolve_auxiliary(index, 'main.aux'))
+        self.assertEqual(records[3][:3], ('last', '8', ''))
+        self.assertEqual(list(resolve_auxiliary(index, 'main.aux', 2, cache)),
+                         records)
+
+        # Changing the index invalidates the cached records.
+        path = cache.get_records_path('chapter.aux', index)
+        index = Index.from_string(self.text.replace('forest\n', ''))
+        index.generate_reference_index()
+        self.assertNotEqual(cache.get_records_path('chapter.aux', index),
+                            path)
+        self.assertEqual(list(resolve_auxiliary(index, 'main.aux', 1, cache)),
+                         list(resolve_auxiliary(index, 'main.aux')))
+        
+def write_gradually(filename, lines, delay=0.01):
+    """Write LINES to FILENAME (overwriting it) one at a time, like
+    LaTeX, pausing for DELAY seconds after each.  If a line is a
+    function, it is called instead, and if it is a (FILENAME, LINES)
+    pair, the lines are written to the included file FILENAME.
+    """
+    stream = open(filename, 'wb')
+        
+    for line in lines:
+        if callable(line):
+            line()
+            continue
+        elif isinstance(line, tuple):
+            included, lines = line
+            line = '\\@input{%s}' % (included)
+            stream.write(line + '\n')
+            stream.flush()
+            write_gradually(included, lines, delay)
+            continue
+            
+        stream.write(line + '\n')
+        stream.flush()
+        time.sleep(delay)
+
+    stream.close()
+    
+class FollowTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    @staticmethod
+    def record(key, page):
+        return '\\@writefile{raw}{\\indexentry{%s}{%d}}' % (key, page)
+    
+    def runTest(self):
+        # The files of the previous run: the first chapter is rewritten,
+        # but the second is not (as if excluded by \includeonly).
+        write_gradually('main.aux', [self.record('stale', 1)], 0)
+        write_gradually('one.aux', [self.record('stale', 2)], 0)
+        write_gradually('two.aux', [self.record('two', 3)], 0)
+        for filename in ['main.aux', 'one.aux', 'two.aux']:
+            os.utime(filename, ((time.time() - 100), (time.time() - 100)))
+
+        seen = threading.Event()
+        streamed = []
+        done = threading.Event()
+        
+        lines = [self.record('a', 1),
+                 lambda: streamed.append(seen.wait(10)),
+                 ('one.aux', [self.record('b', 2), self.record('c', 2)]),
+                 '\\@input{two.aux}',
+                 self.record('d', 4)]
+        
+        def latex():
+            time.sleep(0.05)
+            write_gradually('main.aux', lines)
+            done.set()
+
+        writer = threading.Thread(target=latex)
+        writer.start()
+
+        records = []
+        for record in follow_auxiliary('main.aux', done.is_set,
+                                       (time.time() - 10), 0.01):
+            records.append(record)
+            seen.set()
+
+        writer.join()
+
+        # The first record was read while the file was being written.
+        self.assertEqual(streamed, [True])
+        self.assertEqual(records, list(scan_auxiliary('main.aux')))
+        self.assertEqual([record[0] for record in records],
+                         ['a', 'b', 'c', 'two', 'd'])
+        
+        # A FIFO is read until the writer closes it.
+        os.mkfifo('pipe.aux')
+        writer = threading.Thread(target=write_gradually,
+                                  args=('pipe.aux', lines[2:]))
+        writer.start()
+        records = list(follow_auxiliary('pipe.aux', lambda: False,
+                                        interval=0.01))
+        writer.join()
+        
+        self.assertEqual([record[0] for record in records],
+                         ['b', 'c', 'two', 'd'])
+        
+class AuxiliaryTestSuite(unittest.TestSuite):
+    def __init__(self):
+        unittest.TestSuite.__init__(self, [
+            ScanTestCase(),
+            ResolveTestCase(),
+            CacheTestCase(),
+            FollowTestCase(),
+            ])
+        
+def main():
+    """Module mainline (for standalone execution).
+    """
+    suite = AuxiliaryTestSuite()
+    unittest.TextTestRunner(verbosity=2).run(suite)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from cache import IndexCache
+from index import Index
+
+class EvictionTestCase(unittest.TestCase):
+    text = '\n'.join(['% default_inflection=singular',
+                      '% *CONCEPTS*',
+                      'graph',
+                      'tree',
+                      ''])
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+
+        self.cache = IndexCache(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def write(self, filename, text):
+        stream = open(filename, 'wb')
+        stream.write(text)
+        stream.close()
+
+    def get_entries(self, suffix):
+        return sorted(name for name in os.listdir(self.cache._directory)
+                      if name.endswith(suffix))
+        
+    def runTest(self):
+        cache = self.cache
+        
+        # Only the latest index of each file is kept.
+        for text in [self.text, (self.text + 'forest\n'), self.text]:
+            self.write('glossary.itx', text)
+            index = cache.get_index('glossary.itx')
+            self.assertEqual(len(self.get_entries('.pickle')), 1)
+
+        self.write('other.itx', (self.text + 'vertex\n'))
+        cache.get_index('other.itx')
+        self.assertEqual(len(self.get_entries('.pickle')), 2)
+
+        # Likewise for the records of each .aux file.
+        for page in ['1', '2']:
+            self.write('chapter.aux',
+                       '\\@writefile{raw}{\\indexentry{graph}{%s}}\n' % (page))
+            os.utime('chapter.aux', (time.time(), (time.time() + int(page))))
+            cache.store(cache.get_records_path('chapter.aux', index), '')
+            self.assertEqual(len(self.get_entries('.records')), 1)
+
+        # Entries that were used recently are not pruned.
+        entries = self.get_entries('')
+        self.assertEqual(cache.prune(60), 0)
+        self.assertEqual(self.get_entries(''), entries)
+
+        os.utime(os.path.join(cache._directory, entries[0]), (0, 0))
+        self.assertEqual(cache.prune(60), 1)
+        self.assertEqual(self.get_entries(''), entries[1:])
+        
+        self.assertEqual(cache.prune(0), len(entries) - 1)
+        self.assertEqual(self.get_entries(''), [])
+        
+class CacheTestSuite(unittest.TestSuite):
+    def __init__(self):
+        unittest.TestSuite.__init__(self, [
+            EvictionTestCase(),
+            ])
+        
+def main():
+    """Module mainline (for standalone execution).
+    """
+    suite = CacheTestSuite()
+    unittest.TextTestRunner(verbosity=2).run(suite)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+import random
+from string import whitespace
+import unittest
+
+from config import FIELD_SEPARATORS
+import escaping
+from escaping import ESCAPE_TOKEN
+from test_support import escape_aware_rsplit, escape_aware_split, \
+     original_is_escaped, original_unescape
+
+class SimpleEscapingTestCase(unittest.TestCase):
+    alphabet = 'ab\\ \t|,@-'
+
+    # Delimiters that cannot overlap themselves.  (The original
+    # functions split overlapping delimiters, such as "--" in "---",
+    # twice.)
+    delimiters = [None, '|', ',', '-->', 'a@']
+    
+    def setUp(self):
+        self.generator = random.Random(1)
+        
+    def generate(self, n):
+        for i in xrange(n):
+            yield ''.join(self.generator.choice(self.alphabet)
+                          for j in xrange(self.generator.randint(0, 14)))
+
+    def is_defined(self, string, delimiter):
+        """Return True if the original functions are well-defined for
+        STRING.  They failed on delimiters at the very start, and
+        miscounted escapes running all the way to the start.
+        """
+        if string[:1] == ESCAPE_TOKEN:
+            return False
+        elif delimiter is None:
+            return string[:1] not in whitespace
+        else:
+            return not string.startswith(delimiter)
+
+class SplitTestCase(SimpleEscapingTestCase):
+    def runTest(self):
+        for string in self.generate(3000):
+            for delimiter in self.delimiters:
+                if not self.is_defined(string, delimiter):
+                    continue
+                
+                for maxsplit in [None, 0, 1, 2]:
+                    self.assertEqual(escaping.split(string, delimiter,
+                                                    maxsplit),
+                                     escape_aware_split(string, delimiter,
+                                                        maxsplit))
+                    # The original rsplit() did not stop at MAXSPLIT 0.
+                    if maxsplit != 0:
+                        self.assertEqual(
+                            escaping.rsplit(string, delimiter, maxsplit),
+                            escape_aware_rsplit(string, delimiter, maxsplit))
+
+        # Escapes running all the way to the start are counted.
+        self.assertEqual(escaping.split('\\@b@c', '@'), ['\\@b', 'c'])
+        self.assertEqual(escaping.split('\\\\@b', '@'), ['\\\\', 'b'])
+        self.assertEqual(escaping.split('@b', '@'), ['', 'b'])
+        self.assertEqual(escaping.rsplit('a@b', '@', 0), ['a@b'])
+
+class UnescapeTestCase(SimpleEscapingTestCase):
+    def runTest(self):
+        for string in self.generate(3000):
+            # The original function failed on trailing escapes.
+            if string[-1:] == ESCAPE_TOKEN:
+                continue
+
+            for tokens in [FIELD_SEPARATORS, FIELD_SEPARATORS + '-',
+                           '|\\', '']:
+                self.assertEqual(escaping.unescape(string, tokens),
+                                 original_unescape(string, tokens))
+                self.assertEqual(escaping.unescape_all([string, string],
+                                                       tokens),
+                                 [original_unescape(string, tokens)] * 2)
+
+            if string[:1] == ESCAPE_TOKEN:
+                continue
+            
+            for i in xrange(len(string)):
+                self.assertEqual(escaping.is_escaped(string, i),
+                                 original_is_escaped(string, i))
+
+class LongEscapeRunTestCase(SimpleEscapingTestCase):
+    def runTest(self):
+        # Long runs of escapes and delimiters are handled in one pass.
+        string = ('\\' * 100001 + '|') * 20 + 'x'
+        self.assertEqual(len(escaping.split(string, '|')), 1)
+        self.assertEqual(len(escaping.rsplit(string, '|', 1)), 1)
+        
+        string = ('\\' * 100000 + '|') * 20
+        self.assertEqual(len(escaping.split(string, '|')), 21)
+
+class EscapingTestSuite(unittest.TestSuite):
+    def __init__(self):
+        unittest.TestSuite.__init__(self, [
+            SplitTestCase(),
+            UnescapeTestCase(),
+            LongEscapeRunTestCase(),
+            ])
+        
+def main():
+    """Module mainline (for standalone execution).
+    """
+    suite = EscapingTestSuite()
+    unittest.TextTestRunner(verbosity=2).run(suite)
+
+if __name__ == "__main__":
+    main()
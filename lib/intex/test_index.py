@@ -0,0 +1,410 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__revision__ = "$Rev$"
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+
+import cPickle
+from cStringIO import StringIO
+from multiprocessing.pool import ThreadPool
+import sys
+import unittest
+
+from test_support import generate_glossary
+from entry import Entry
+from index import Index
+from inflection import get_rule_packs
+
+class SimpleIndexTestCase(unittest.TestCase):
+    text = '\n'.join([
+        '% default_inflection=singular',
+        '% *ACRONYMS*',
+        'DAG\tdirected acyclic graph',
+        'XML\tExtensible Markup Language',
+        '  - format',
+        '',
+        '% *CONCEPTS*',
+        'graph',
+        '  directed -',
+        '  (-) theory',
+        'matrices\t:#+',
+        'tree',
+        '% a comment',
+        'forest --> tree',
+        ])
+
+    def build(self, text):
+        index = Index.from_string(text)
+        index.generate_reference_index()
+        return index
+
+    def update(self, previous, text):
+        # Work on a copy, the way the cache does.
+        previous = cPickle.loads(cPickle.dumps(previous,
+                                               cPickle.HIGHEST_PROTOCOL))
+        index = Index.from_string(text, previous=previous)
+        index.update_reference_index(previous)
+        return index
+
+    def summarize(self, index):
+        return (str(index), [entry.identity for entry in index],
+                sorted((phrase, entry.identity, inflection)
+                       for phrase, (entry, inflection)
+                       in index.references.iteritems()))
+
+    def assertSameAsRebuild(self, previous, text):
+        index = self.update(previous, text)
+        self.assertEqual(self.summarize(index),
+                         self.summarize(self.build(text)))
+        return index
+
+class StableIdentityTestCase(SimpleIndexTestCase):
+    def runTest(self):
+        before = self.build(self.text)
+        after = self.build('% a new first line\n'
+                           + self.text.replace('tree\n', 'trees\t:#+\n'))
+
+        # Only the identity of the edited entry changes.
+        changed = set(entry.identity for entry in before) \
+                  ^ set(entry.identity for entry in after)
+        self.assertEqual(len(changed), 2)
+
+        for entry in after:
+            if entry.parent is not None:
+                self.assert_(entry in entry.parent.children)
+
+class IncrementalParseTestCase(SimpleIndexTestCase):
+    def runTest(self):
+        previous = self.build(self.text)
+        lines = self.text.split('\n')
+
+        for text in [
+            self.text,
+            # Edit a sub-entry.
+            self.text.replace('(-) theory', '(-) theories\t:#+'),
+            # Remove a block.
+            '\n'.join(lines[:10] + lines[11:]),
+            # Add a block.
+            self.text + '\nvertex',
+            # Make the short-form references ambiguous.
+            self.text + '\n% *ACRONYMS*\nMAT\tmatrix',
+            # Duplicate a block.
+            self.text + '\n% *CONCEPTS*\nmatrices\t:#+',
+            # Change the state that all the blocks depend on.
+            '% name=glossary\n' + self.text,
+            ]:
+            try:
+                expected = self.summarize(self.build(text))
+            except SystemExit:
+                self.assertRaises(SystemExit, self.update, previous, text)
+                continue
+
+            self.assertEqual(self.summarize(self.update(previous, text)),
+                             expected)
+
+        # Only the edited block is parsed again.
+        index = self.update(previous, self.text.replace('matrices', 'tables'))
+        self.assertEqual(len(index._added), 1)
+        self.assertEqual(len(index._removed), 1)
+
+class LazyFieldsTestCase(SimpleIndexTestCase):
+    def runTest(self):
+        index = self.build(self.text)
+
+        # Only the fields needed for looking up entries (and the "see"
+        # lines of aliases) are set up by parsing the index.
+        aliased = set(index.aliases)
+        aliased.update(index.references[alias.alias][0]
+                       for alias in index.aliases)
+        
+        for entry in index:
+            if entry in aliased:
+                continue
+            
+            for field, variable in entry._lazy_field_map:
+                self.failIf(hasattr(entry, '_' + field))
+
+        # Sub-entries set up their parents' fields when needed.
+        sub_entry = index.references['directed graph'][0]
+        self.assertEqual(sub_entry.typeset_in_index['plural'],
+                         'directed --')
+        self.assert_(hasattr(sub_entry.parent, '_typeset_in_index'))
+
+        # Entries that are pickled before their lazy fields are set up
+        # can still set them up.
+        pickled = cPickle.dumps(index, cPickle.HIGHEST_PROTOCOL)
+        self.assertEqual(str(cPickle.loads(pickled)), str(index))
+
+class StringTableTestCase(SimpleIndexTestCase):
+    def runTest(self):
+        index = self.build(self.text)
+        str(index)                      # Set up all the fields.
+
+        strings = index.strings
+        for entry in index:
+            for field in entry._generated_fields:
+                for inflection, value in getattr(entry, field).iteritems():
+                    self.assert_(strings[value] is value)
+
+        for phrase in index.references:
+            self.assert_(strings[phrase] is phrase)
+
+        self.assert_(strings.requests > len(strings))
+        self.assert_(strings.bytes_saved > 0)
+
+        # An incremental parse releases the strings of the entries that
+        # were changed, but shares those of the reused entries.
+        index = self.update(index, self.text.replace('matrices', 'tables'))
+        str(index)
+        
+        strings = index.strings
+        self.assertEqual([string for string in strings
+                          if 'matri' in string], [])
+        for entry in index:
+            for field in entry._generated_fields:
+                for inflection, value in getattr(entry, field).iteritems():
+                    self.assert_(strings[value] is value)
+
+class TreeTestCase(SimpleIndexTestCase):
+    def runTest(self):
+        text = self.text.replace('  directed -\n',
+                                 '  directed -\n    acyclic -\n')
+        index = self.build(text)
+
+        graph = index[3]
+        directed, acyclic, theory = index[4:7]
+        
+        self.assertEqual(graph.children, [directed, theory])
+        self.assertEqual(directed.children, [acyclic])
+        self.assert_(acyclic.parent is directed)
+        self.assertEqual([entry.depth for entry in (graph, directed, acyclic)],
+                         [0, 1, 2])
+
+        self.assertEqual(list(acyclic.generate_index_entries('1')),
+                         ['\\indexentry{graph@graph!directed graph@'
+                          'directed --!acyclic directed graph@acyclic --}{1}'])
+
+        # The tree survives being reused by an incremental parse.
+        index = self.update(index, text.replace('tree', 'trees'))
+        self.assertEqual(index[5].parent.children, [index[5]])
+        self.assertEqual(index[5].depth, 2)
+        
+class SubEntryTemplateTestCase(SimpleIndexTestCase):
+    def runTest(self):
+        index = self.build(self.text.replace('  (-) theory',
+                                             '  (-) theory \\-x'))
+        graph, directed, theory = index[3:6]
+
+        for template, parts in [
+            ('directed -',
+             [('directed', None, ''),
+              ('', directed.PLACEHOLDER_IN_TEXT_AND_INDEX, '')]),
+            ('(-) theory \\-x',
+             [('', directed.PLACEHOLDER_IN_INDEX_ONLY, ''),
+              ('theory', None, ''),
+              ('\\-x', None, '')]),
+            ]:
+            self.assertEqual(directed.compile_sub_entry(template)['reference'],
+                             parts)
+
+        # Compiled templates are shared within, but not between,
+        # indices.
+        self.assert_(directed.compile_sub_entry('directed -')
+                     is theory.compile_sub_entry('directed -'))
+        self.assert_(directed.compile_sub_entry('directed -')
+                     is not self.build(self.text)[4].compile_sub_entry(
+                         'directed -'))
+
+        # The escaped placeholder is kept (but unescaped).
+        self.assertEqual(theory.typeset_in_text['plural'], 'theory -xs')
+        self.assertEqual(theory.typeset_in_index['singular'], '-- theory -x')
+        
+class AliasTestCase(SimpleIndexTestCase):
+    def runTest(self):
+        text = self.text + '\n'.join([
+            '',
+            'grove --> forest',
+            'thicket --> grove',
+            'chicken --> egg',
+            'egg --> chicken',
+            'ghost --> nothing',
+            ])
+        index = self.build(text)
+        tree, forest, grove, thicket = [index.references[phrase][0]
+                                     for phrase in ['tree', 'forest',
+                                                    'grove', 'thicket']]
+
+        self.assertEqual(index.get_line_number(thicket.position), 16)
+        
+        # Chains of aliases are resolved to their final target, with
+        # the "see" line of each alias, nearest to the target first.
+        target, see_lines = index.aliases[thicket]
+        self.assert_(target is tree)
+        self.assertEqual(see_lines,
+                         ('\\indexentry{forest@forest|see{tree}}{0}',
+                          '\\indexentry{grove@grove|see{forest}}{0}',
+                          '\\indexentry{thicket@thicket|see{grove}}{0}'))
+        self.assertEqual(list(thicket.generate_index_entries('7')),
+                         ['\\indexentry{tree@tree}{7}'] + list(see_lines))
+
+        # The cycle and the undefined target are reported, and left
+        # unresolved.
+        self.assertEqual(len(index.aliases), 3)
+        self.assertEqual(index.resolve_aliases(), 2)
+        chicken = index.references['chicken'][0]
+        self.assertEqual(list(chicken.generate_index_entries('7')), [])
+        
+class IndexTemplateTestCase(SimpleIndexTestCase):
+    def runTest(self):
+        text = self.text.replace('  - format', '  - format\n  - schema') \
+               + '\n'.join(['',
+                            'grove --> forest',
+                            '% *PEOPLE*',
+                            'DEK\tKnuth, Donald Ervin',
+                            ''])
+        index = self.build(text)
+
+        xml, format = index[1:3]
+        see_xml = '\\indexentry{XML@XML|see{Extensible Markup Language}}{0}'
+        self.assertEqual(xml.get_index_template(),
+                         ((True, '\\indexentry{Extensible Markup Language@'
+                           'Extensible Markup Language'), (False, see_xml)))
+
+        # The sub-entries share the "see" line of their parent.
+        self.assertEqual(list(format.generate_index_entries('3', '|textbf')),
+                         ['\\indexentry{Extensible Markup Language@'
+                          'Extensible Markup Language!Extensible Markup '
+                          'Language format@-- format|textbf}{3}',
+                          see_xml,
+                          '\\indexentry{XML@XML!XML format@-- format'
+                          '|see{---, -- format}}{0}'])
+        
+        # The output is the same as if every line generated for every
+        # reference were deduplicated.
+        records = [(phrase, page, typeset_page_number)
+                   for page in ['1', '2']
+                   for typeset_page_number in ['', '|textbf']
+                   for phrase in sorted(index.references)]
+        
+        expected = []
+        for key, page, typeset_page_number in records:
+            entry = index.references[key][0]
+            for line in entry.generate_index_entries(page,
+                                                     typeset_page_number):
+                if line not in expected:
+                    expected.append(line)
+        
+        index_file = StringIO()
+        index.interpret_auxiliary(None, StringIO(), index_file,
+                                  records=records)
+        self.assertEqual(index_file.getvalue().splitlines(), expected)
+        
+class DuplicateReferencesTestCase(SimpleIndexTestCase):
+    def runTest(self):
+        index = Index.from_string(self.text + '\nmatrices\t:#+\ntree\n')
+
+        # All the duplicates are reported together, before exiting.
+        self.assertRaises(SystemExit, index.generate_reference_index)
+        self.assertEqual(index.report_duplicates(), 8)
+        self.assertEqual([index.get_line_number(position)
+                          for position in index._duplicates['tree']],
+                         [12, 16])
+        self.assertEqual(index._duplicates['trees'],
+                         index._duplicates['tree'])
+        self.assert_('matrices' in index._duplicates)
+
+class UninflectedReferencesTestCase(SimpleIndexTestCase):
+    def runTest(self):
+        # The inflections of an uninflected entry share their phrases,
+        # which are not duplicates.
+        text = self.text + '\nsoftware\t:#!'
+        previous = self.build(text)
+        self.assertEqual(previous.report_duplicates(), 0)
+        self.assertEqual(previous.references['software'][1],
+                         Entry.INFLECTION_NONE)
+
+        # Nor do they force a full update of the reference index.
+        text = text.replace('matrices', 'tables')
+        index = Index.from_string(text, previous=previous)
+        references = previous.references
+        index.update_reference_index(previous)
+        self.assert_(index.references is references)
+        self.assertEqual(self.summarize(index),
+                         self.summarize(self.build(text)))
+        
+class ConcurrentBuildTestCase(SimpleIndexTestCase):
+    def build_and_summarize(self, text):
+        return self.summarize(self.build(text))
+
+    def get_hits(self):
+        return sum(sum(rule_pack.get_hits().itervalues())
+                   for rule_pack in get_rule_packs())
+    
+    def runTest(self):
+        texts = [self.text] + [generate_glossary(25, seed)
+                               for seed in xrange(1, 12)]
+
+        hits = self.get_hits()
+        serial = map(self.build_and_summarize, texts)
+        hits = self.get_hits() - hits
+
+        # Switch threads as often as possible, so that the builds
+        # interleave.
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        pool = ThreadPool(8)
+        
+        try:
+            before = self.get_hits()
+            concurrent = pool.map(self.build_and_summarize, (texts * 2),
+                                  chunksize=1)
+            self.assertEqual((self.get_hits() - before), (2 * hits))
+        finally:
+            pool.close()
+            pool.join()
+            sys.setcheckinterval(interval)
+
+        self.assertEqual(concurrent, (serial * 2))
+        
+class IndexTestSuite(unittest.TestSuite):
+    def __init__(self):
+        unittest.TestSuite.__init__(self, [
+            StableIdentityTestCase(),
+            IncrementalParseTestCase(),
+            LazyFieldsTestCase(),
+            StringTableTestCase(),
+            TreeTestCase(),
+            SubEntryTemplateTestCase(),
+            AliasTestCase(),
+            IndexTemplateTestCase(),
+            DuplicateReferencesTestCase(),
+            UninflectedReferencesTestCase(),
+            ConcurrentBuildTestCase(),
+            ])
+
+def main():
+    """Module mainline (for standalone execution).
+    """
+    suite = IndexTestSuite()
+    unittest.TextTestRunner(verbosity=2).run(suite)
+
+if __name__ == "__main__":
+    main()
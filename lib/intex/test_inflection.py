@@ -0,0 +1,155 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+import random
+import unittest
+
+from index import Index
+import inflection
+
+class SimpleInflectionTestCase(unittest.TestCase):
+    # The suffix list formerly used by Entry.get_inflection().  The
+    # order is significant (also when the pairs are reversed).
+    plural_to_singular = [
+        ('yses', 'ysis'),
+        ('ices', 'ex'),
+        ('ies', 'y'),
+        ('ses', 's'),
+        ('s', ''),
+        ]
+
+    def setUp(self):
+        self.english = inflection.get_rule_pack('en')
+        self.norwegian = inflection.get_rule_pack('nb')
+
+    def original_inflection(self, word, target):
+        if target == inflection.INFLECTION_SINGULAR:
+            rules = self.plural_to_singular
+        else:
+            rules = [(singular, plural)
+                     for plural, singular in self.plural_to_singular]
+            
+        for suffix, replacement in rules:
+            if word.endswith(suffix):
+                offset = (- len(suffix)) or None
+                return word[:offset] + replacement
+            
+        return word
+
+class EnglishTestCase(SimpleInflectionTestCase):
+    def runTest(self):
+        # The English rule pack must agree with the original suffix
+        # list.
+        generator = random.Random(1)
+        
+        for n in xrange(5000):
+            word = ''.join(generator.choice('aeiysxc')
+                           for i in xrange(generator.randint(0, 7)))
+            for target in [inflection.INFLECTION_SINGULAR,
+                           inflection.INFLECTION_PLURAL]:
+                self.assertEqual(self.english.inflect(word, target),
+                                 self.original_inflection(word, target))
+
+            self.assertEqual(self.english.inflect(word,
+                                                  inflection.INFLECTION_NONE),
+                             word)
+
+class NorwegianTestCase(SimpleInflectionTestCase):
+    def runTest(self):
+        for singular, plural in [('bil', 'biler'), ('lærer', 'lærere'),
+                                 ('mann', 'menn'), ('hus', 'hus')]:
+            self.assertEqual(self.norwegian.inflect(
+                singular, inflection.INFLECTION_PLURAL), plural)
+            self.assertEqual(self.norwegian.inflect(
+                plural, inflection.INFLECTION_SINGULAR), singular)
+        
+        self.assertEqual(self.norwegian.inflect(
+            'jente', inflection.INFLECTION_PLURAL), 'jenter')
+
+class BatchTestCase(SimpleInflectionTestCase):
+    def runTest(self):
+        phrases = [['directed', 'graph'], ['index'], ['acyclic', 'analysis']]
+        
+        hits = self.english.get_hits()
+        self.assertEqual(self.english.inflect_last_words(
+            phrases, inflection.INFLECTION_PLURAL),
+                         [['directed', 'graphs'], ['indices'],
+                          ['acyclic', 'analyses']])
+        # The phrases themselves are left alone.
+        self.assertEqual(phrases[1], ['index'])
+
+        # Each rule used is counted.
+        for label, count in [('* -> *s', 1), ('*ex -> *ices', 1),
+                             ('*ysis -> *yses', 1)]:
+            key = (inflection.INFLECTION_PLURAL, label)
+            self.assertEqual(self.english.get_hits()[key],
+                             hits.get(key, 0) + count)
+
+class LanguageDirectiveTestCase(SimpleInflectionTestCase):
+    text = '\n'.join([
+        '%% language=%s',
+        '%% default_inflection=singular',
+        '%% *CONCEPTS*',
+        'bil',
+        'lærer',
+        ])
+    
+    def runTest(self):
+        index = Index.from_string(self.text % ('nb'))
+        self.assertEqual([entry.reference[inflection.INFLECTION_PLURAL]
+                          for entry in index], ['biler', 'lærere'])
+
+        index = Index.from_string(self.text % ('en'))
+        self.assertEqual([entry.reference[inflection.INFLECTION_PLURAL]
+                          for entry in index], ['bils', 'lærers'])
+
+        # A later directive does not affect the entries defined before
+        # it, not even their lazily set up fields.
+        index = Index.from_string(self.text % ('nb') + '\n% language=en')
+        self.assertEqual([(entry.reference[inflection.INFLECTION_PLURAL],
+                           entry.typeset_in_text[inflection.INFLECTION_PLURAL])
+                          for entry in index],
+                         [('biler', 'biler'), ('lærere', 'lærere')])
+        
+        # Unknown languages are reported.
+        self.assertRaises(SystemExit, Index.from_string, self.text % ('xx'))
+
+class InflectionTestSuite(unittest.TestSuite):
+    def __init__(self):
+        unittest.TestSuite.__init__(self, [
+            EnglishTestCase(),
+            NorwegianTestCase(),
+            BatchTestCase(),
+            LanguageDirectiveTestCase(),
+            ])
+        
+def main():
+    """Module mainline (for standalone execution).
+    """
+    suite = InflectionTestSuite()
+    unittest.TextTestRunner(verbosity=2).run(suite)
+
+if __name__ == "__main__":
+    main()
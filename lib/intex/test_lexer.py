@@ -0,0 +1,228 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__revision__ = "$Rev$"
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+
+import random
+import time
+import unittest
+
+import lexer
+from test_support import RegexCascade
+
+class SimpleLexerTestCase(unittest.TestCase):
+    field_names = {
+        'ACRONYMS': ('acronym', 'full_form', 'typeset_as'),
+        'CONCEPTS': ('concept', 'typeset_as'),
+        'PEOPLE': ('initials', 'name'),
+        }
+
+    def setUp(self):
+        self.lexer = lexer.Lexer(self.field_names)
+        self.cascade = RegexCascade()
+
+    def classify(self, line, context):
+        """Classify LINE the way Index.from_file() interprets the
+        lexer's tokens.
+        """
+        tokens = list(self.lexer.tokenize(line))
+        self.assertEqual(len(tokens), 1)
+        line_number, original, kind, alias, data = tokens[0]
+
+        if kind == lexer.LINE_DIRECTIVE:
+            groups = data
+        elif kind == lexer.LINE_ENTRY:
+            indent, fields, meta = data
+            names = self.field_names[context]
+            if len(fields) > len(names):
+                return lexer.LINE_INVALID, alias, None
+            groups = dict.fromkeys(names)
+            groups.update(zip(names, fields))
+            groups.update(indent=indent, meta=meta)
+        else:
+            groups = None
+
+        return kind, alias, groups
+
+    def assertSameAsCascade(self, line, context):
+        expected = self.cascade.classify(line, context)
+        kind, alias, groups = self.classify(line, context)
+
+        self.assertEqual(expected[:2], (kind, alias))
+
+        if kind == lexer.LINE_DIRECTIVE:
+            for key in ['attribute', 'value', 'context']:
+                self.assertEqual(expected[2][key], groups[key])
+        elif kind == lexer.LINE_ENTRY:
+            self.assertEqual(expected[2], groups)
+
+class WellFormedLinesTestCase(SimpleLexerTestCase):
+    lines = {
+        'ACRONYMS': [
+            'DAG\tdirected acyclic graph',
+            'H2O@H$_{2}$O\tdihydrogen monoxide',
+            'LL\t(LaTeX Lover)@{\\LaTeX Lover}',
+            '  WN20@(- 2.0)\t(-) version 2.0',
+            '  (-) OSs\t(-) operating systems\t:#+:#- OS\t- operating system',
+            'EUWN\tEuroWordNet\tEuroWordNet',
+            'XML\tExtensible Markup Language\t\t:#+',
+            '  - format',
+            'AB\\:C\tescaped\\\tseparators',
+            'AB\\\\:C\tdouble escape',
+            ],
+        'CONCEPTS': [
+            'alphabet@(A\\, {B}\\, and C)',
+            'antonym\t:#-',
+            '  not\\-so\\-direct -',
+            '\t\tdirect (-)',
+            'buses\t:#+',
+            'katter@k4tt3r\t:#+:#katt@k4tt',
+            'alias11 --> rule model node c11s',
+            'alias12\t-->  target with spaces',
+            'a --> b --> c',
+            'a --> b -->',
+            '--> target',
+            '  --> target',
+            'LaTeX@{\\LaTeX}',
+            'TeXnician@{\\TeX}nician',
+            '  -\'s tool',
+            'percent % inside',
+            ],
+        'PEOPLE': [
+            'JFK\tKennedy, John Fitzgerald',
+            'MLK\tKing, Martin Luther\t:sort_as=KING',
+            ],
+        }
+
+    def runTest(self):
+        for context, lines in self.lines.iteritems():
+            for line in lines:
+                self.assertSameAsCascade(line, context)
+
+class MalformedLinesTestCase(SimpleLexerTestCase):
+    def runTest(self):
+        for context, line in [
+            # Single-token fields are not valid fields.
+            ('PEOPLE', 'M\tMadonna'),
+            ('CONCEPTS', 'ab\tc'),
+            # Too many fields for the context.
+            ('CONCEPTS', 'abc\tdef\tghi'),
+            # Fields must not start with a comment token or whitespace.
+            ('CONCEPTS', 'abc\t%def'),
+            ('ACRONYMS', 'ABC\t def'),
+            # An empty meta field.
+            ('CONCEPTS', 'abc\t:'),
+            ]:
+            self.assertSameAsCascade(line, context)
+
+class DirectiveAndCommentTestCase(SimpleLexerTestCase):
+    def runTest(self):
+        for line in [
+            '% name=main',
+            '%default_inflection = singular ',
+            '% *ACRONYMS*',
+            '%*PEOPLE*  ',
+            '% *PERSONS*',
+            '% *CONCEPTS*:',
+            '% name = two words',
+            '   % indented comment',
+            '% comment --> with alias',
+            '%',
+            ]:
+            self.assertSameAsCascade(line, 'CONCEPTS')
+
+class LineNumbersTestCase(SimpleLexerTestCase):
+    def runTest(self):
+        text = '% *CONCEPTS*\n\n   \nabc\n\t\ndef\tghi'
+        self.assertEqual([(line_number, kind)
+                          for line_number, line, kind, alias, data
+                          in self.lexer.tokenize(text)],
+                         [(0, lexer.LINE_DIRECTIVE),
+                          (3, lexer.LINE_ENTRY),
+                          (5, lexer.LINE_ENTRY)])
+
+class RandomLinesTestCase(SimpleLexerTestCase):
+    """Compare the lexer with the cascade on random lines.
+
+    Lines with escaped meta tokens are excluded: When the cascade
+    fails to match such a line, it backtracks and reinterprets the
+    escaped meta token as the start of the meta information, whereas
+    the lexer (correctly) rejects the line.
+    """
+    tokens = ['a', 'b', ' ', '\t', ':', '\\', '%', '-->', '#', '\\\t']
+
+    def runTest(self):
+        generator = random.Random(0)
+
+        for i in xrange(5000):
+            line = ''.join(generator.choice(self.tokens)
+                           for j in xrange(generator.randint(1, 12)))
+            if line.isspace() or ('\\:' in line):
+                continue
+            self.assertSameAsCascade(line, generator.choice(
+                self.field_names.keys()))
+
+class PathologicalLinesTestCase(SimpleLexerTestCase):
+    """Lines that caused catastrophic backtracking in the regular
+    expression cascade.  Each of them must be lexed in time linear in
+    its length.
+    """
+    lines = [
+        'ab cd ' * 2000 + '\t%',
+        'a' * 10000 + '\tx',
+        'ab\\\t' * 2000 + '\tx',
+        'AB\\:' * 2000 + '\tx\t%',
+        'x-->' * 5000,
+        '-->' * 5000 + 'a',
+        ' ' * 5000 + ':' * 5000,
+        '\\' * 10000 + '\t' + '\\' * 10000,
+        ]
+
+    def runTest(self):
+        for line in self.lines:
+            start = time.time()
+            self.classify(line, 'ACRONYMS')
+            self.assert_((time.time() - start) < 0.5, repr(line[:20]))
+
+        # The alias pointer handling must pick the rightmost pointer.
+        kind, alias, groups = self.classify('x-->' * 5000, 'CONCEPTS')
+        self.assertEqual(alias, 'x-->')
+
+class LexerTestSuite(unittest.TestSuite):
+    def __init__(self):
+        unittest.TestSuite.__init__(self, [
+            WellFormedLinesTestCase(),
+            MalformedLinesTestCase(),
+            DirectiveAndCommentTestCase(),
+            LineNumbersTestCase(),
+            RandomLinesTestCase(),
+            PathologicalLinesTestCase(),
+            ])
+
+def main():
+    """Module mainline (for standalone execution).
+    """
+    suite = LexerTestSuite()
+    unittest.TextTestRunner(verbosity=2).run(suite)
+
+if __name__ == "__main__":
+    main()
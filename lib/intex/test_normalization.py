@@ -0,0 +1,93 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+import unittest
+
+from index import Index
+from normalization import normalize
+
+class SpellingTestCase(unittest.TestCase):
+    def runTest(self):
+        for spellings in [
+            ['Gödel', 'G\\"odel', 'G{\\"o}del', 'G\\"{o}del', 'GÖDEL',
+             'Go\xcc\x88del'],
+            ['Erdős', 'Erd\\H{o}s', 'Erd\\H os'],
+            ['Ångström', '\\AA ngstr\\"om', '{\\AA}ngstr\\"om'],
+            ['naïve', 'na\\"\\i ve', 'na\\"{\\i}ve'],
+            ['directed acyclic graph', 'Directed~Acyclic  Graph',
+             ' directed\tacyclic\\ graph '],
+            ]:
+            self.assertEqual(set(normalize(spelling)
+                                 for spelling in spellings),
+                             set([spellings[0].decode('utf-8').lower()]))
+
+        # Other macros are left alone.
+        self.assertEqual(normalize('\\textbf{Bold}'), u'\\textbf{bold}')
+
+class LookupTestCase(unittest.TestCase):
+    text = '\n'.join([
+        '% default_inflection=singular',
+        '% *ACRONYMS*',
+        'BUS\tbinary unit system',
+        '% *CONCEPTS*',
+        'bus',
+        'G\\"odel number',
+        'A~B tree',
+        'A  B tree',
+        ])
+    
+    def runTest(self):
+        index = Index.from_string(self.text)
+        index.generate_reference_index()
+
+        resolve = lambda key: index.resolve_reference(key)[1][0]
+        bus, godel = index[1], index[2]
+
+        # Exact matches come first, then phrases in canonical form.
+        self.assert_(resolve('BUS') is index[0])
+        self.assert_(resolve('Bus') is bus)
+        self.assert_(resolve('Gödel~numbers') is godel)
+        self.assertEqual(index.resolve_reference('GÖDEL NUMBER')[:2],
+                         ('G\\"odel number', (godel, 'singular')))
+        
+        # Different entries spelled alike are not matched.
+        self.assert_(resolve('A~B tree') is index[3])
+        self.assertEqual(index.resolve_reference('a b tree'), None)
+        
+class NormalizationTestSuite(unittest.TestSuite):
+    def __init__(self):
+        unittest.TestSuite.__init__(self, [
+            SpellingTestCase(),
+            LookupTestCase(),
+            ])
+        
+def main():
+    """Module mainline (for standalone execution).
+    """
+    suite = NormalizationTestSuite()
+    unittest.TextTestRunner(verbosity=2).run(suite)
+
+if __name__ == "__main__":
+    main()
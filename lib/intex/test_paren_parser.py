@@ -22,9 +22,11 @@ along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
 __revision__ = "$Rev$"
 __author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
 
-import paren_parser
+import random
+import threading
 import unittest
 
+import paren_parser
 
 class SimpleParenParserTestCase(unittest.TestCase):
     matching_pairs = [
@@ -128,6 +130,100 @@ class TokenSplitTestCase(SimpleParenParserTestCase):
             ]:
             self.assertEqual(self.parser.split(string, separator), parts)
                 
+class MaskedSplitTestCase(SimpleParenParserTestCase):
+    alphabet = 'ab @(){}[]\\'
+    
+    def mask(self, string):
+        """Return STRING with the contents of its outermost scopes
+        replaced by a token that is never split at.
+        """
+        masked = list(string)
+        for i, j in self.parser.get_outer_scopes(string):
+            masked[i:j] = '#' * (j - i)
+        return ''.join(masked)
+    
+    def runTest(self):
+        # Splitting must behave like str.split(), except that the
+        # outermost scopes are never split.
+        generator = random.Random(1)
+        
+        for n in xrange(20000):
+            string = ''.join(generator.choice(self.alphabet)
+                             for i in xrange(generator.randint(0, 12)))
+            try:
+                masked = self.mask(string)
+            except paren_parser.UnexpectedClosingError:
+                continue
+            
+            for separator in [None, '@']:
+                maxsplit = generator.choice([None, 0, 1, 2])
+                parts = self.parser.split(string, separator, maxsplit)
+
+                # Find the parts in STRING, and mask them the same way.
+                k = 0
+                masked_parts = []
+                for part in parts:
+                    k = string.index(part, k)
+                    masked_parts.append(masked[k:(k + len(part))])
+                    k += len(part)
+                    
+                if maxsplit is None:
+                    maxsplit = -1
+                self.assertEqual(masked_parts,
+                                 masked.split(separator, maxsplit))
+
+class MaxSplitTestCase(SimpleParenParserTestCase):
+    def runTest(self):
+        for separator, string, maxsplit, parts in [
+            ('@', 'abc@(d@e)@ghi', 1, ['abc', '(d@e)@ghi']),
+            ('@', '(a@b)@c@d', 1, ['(a@b)', 'c@d']),
+            ('@', '(a@b)@c@d', 0, ['(a@b)@c@d']),
+            (None, ' (a b) c d ', 1, ['(a b)', 'c d ']),
+            ]:
+            self.assertEqual(self.parser.split(string, separator, maxsplit),
+                             parts)
+
+        # Escaped separators are not split at, either.
+        self.assertEqual(self.parser.split('a\\@b@(c@d)@e', '@', 1,
+                                           escape_aware=True),
+                         ['a\\@b', '(c@d)@e'])
+        self.assertEqual(self.parser.split('a\\\\@b', '@',
+                                           escape_aware=True),
+                         ['a\\\\', 'b'])
+
+class StripTestCase(SimpleParenParserTestCase):
+    def runTest(self):
+        for string, stripped in [
+            ('(abc)', 'abc'),
+            ('{(abc)}', '(abc)'),
+            ('(a) (b)', '(a) (b)'),
+            ('(a]', '(a]'),
+            ('(a', '(a'),
+            ]:
+            self.assertEqual(self.parser.strip(string), stripped)
+
+class ConcurrentSplitTestCase(SimpleParenParserTestCase):
+    def runTest(self):
+        # One parser shared by several threads must give the same
+        # results as when used by a single thread.
+        strings = ['abc(def)ghi (jkl) mno(pqr) stu %d' % (i)
+                   for i in xrange(200)] \
+                  + ['{a [b (c) d] e} (%d) f' % (i) for i in xrange(200)]
+        expected = [self.parser.split(string) for string in strings]
+        results = []
+        
+        def work():
+            parser = self.parser
+            results.append([parser.split(string) for string in strings])
+            
+        threads = [threading.Thread(target=work) for i in xrange(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [expected] * len(threads))
+        
 class ParenParserTestSuite(unittest.TestSuite):
     def __init__(self):
         unittest.TestSuite.__init__(self, [
@@ -136,6 +232,10 @@ class ParenParserTestSuite(unittest.TestSuite):
             LaTeXTestCase(),
             WhitespaceSplitTestCase(),
             TokenSplitTestCase(),
+            MaskedSplitTestCase(),
+            MaxSplitTestCase(),
+            StripTestCase(),
+            ConcurrentSplitTestCase(),
             ])
         
 def main():
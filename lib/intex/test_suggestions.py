@@ -0,0 +1,121 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+import random
+import unittest
+
+from index import Index
+from suggestions import (get_distance, get_max_distance, group_misses,
+                         SuggestionIndex)
+
+def levenshtein(a, b):
+    previous = range(len(b) + 1)
+    for i, x in enumerate(a):
+        current = [i + 1]
+        for j, y in enumerate(b):
+            current.append(min(previous[j + 1] + 1, current[j] + 1,
+                               previous[j] + (x != y)))
+        previous = current
+    return previous[-1]
+
+class DistanceTestCase(unittest.TestCase):
+    def runTest(self):
+        generator = random.Random(1)
+        
+        for n in xrange(2000):
+            a, b = [''.join(generator.choice('abc')
+                            for i in xrange(generator.randint(0, 8)))
+                    for k in xrange(2)]
+            for limit in xrange(3):
+                self.assertEqual(get_distance(a, b, limit),
+                                 min(levenshtein(a, b), (limit + 1)))
+
+class SuggestionTestCase(unittest.TestCase):
+    def runTest(self):
+        generator = random.Random(1)
+        words = [''.join(generator.choice('abcdefgh')
+                         for i in xrange(generator.randint(2, 6)))
+                 for k in xrange(100)]
+        phrases = list(set(' '.join(generator.choice(words)
+                                    for i in xrange(generator.randint(1, 3)))
+                           for k in xrange(300)))
+        suggestions = SuggestionIndex((phrase, phrase) for phrase in phrases)
+
+        # The n-gram filter must not lose any phrase within the
+        # maximum distance.
+        for n in xrange(50):
+            phrase = list(generator.choice(phrases))
+            phrase[generator.randrange(len(phrase))] = generator.choice('ah')
+            phrase = ''.join(phrase)
+
+            expected = sorted((levenshtein(phrase, other), other)
+                              for other in phrases)
+            expected = [other for distance, other in expected
+                        if 0 < distance <= get_max_distance(phrase)]
+            self.assertEqual(suggestions.suggest(phrase, len(phrases)),
+                             expected)
+
+class IndexSuggestionTestCase(unittest.TestCase):
+    text = '\n'.join([
+        '% default_inflection=singular',
+        '% *CONCEPTS*',
+        'directed graph',
+        'directed tree',
+        ])
+
+    def runTest(self):
+        index = Index.from_string(self.text)
+        index.generate_reference_index()
+        suggestions = SuggestionIndex.from_indices([index])
+
+        # One phrase is suggested for each entry.
+        self.assertEqual(suggestions.suggest('Directed grahp'),
+                         ['directed graph'])
+        self.assertEqual(suggestions.suggest('directed grae'),
+                         ['directed graph', 'directed tree'])
+
+        # A phrase is not suggested as itself.
+        self.assertEqual(suggestions.suggest('Directed~graph'), [])
+
+        self.assertEqual(group_misses([('b', '2'), ('a', 'ii'), ('a', '10'),
+                                       ('a', '9'), ('a', '10')]),
+                         [('a', ['9', '10', 'ii']), ('b', ['2'])])
+        
+class SuggestionsTestSuite(unittest.TestSuite):
+    def __init__(self):
+        unittest.TestSuite.__init__(self, [
+            DistanceTestCase(),
+            SuggestionTestCase(),
+            IndexSuggestionTestCase(),
+            ])
+        
+def main():
+    """Module mainline (for standalone execution).
+    """
+    suite = SuggestionsTestSuite()
+    unittest.TextTestRunner(verbosity=2).run(suite)
+
+if __name__ == "__main__":
+    main()
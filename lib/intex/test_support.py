@@ -0,0 +1,449 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+import random
+import re
+from string import whitespace
+
+from config import FIELD_SEPARATORS, INTEX_DEFAULT_INDEX, TOKEN_COMMENT, \
+     TOKEN_ENTRY_META_INFO
+import escaping
+import lexer
+import paren_parser
+
+# The words that the phrases of the synthetic index files are made of.
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'matrix', 'index', 'class',
+         'bus', 'analysis', 'vertex', 'party', 'glass', 'tree', 'graph',
+         'node', 'edge', 'model', 'set', 'rule', 'grammar']
+
+def generate_glossary(size, seed=1, counts=None):
+    """Return the text of a synthetic .itx file with roughly 2 * SIZE
+    lines, mixing acronyms, people, and concepts with sub-entries and
+    aliases.  COUNTS may map context names to the number of (main)
+    entries to define in each context.
+    """
+    if counts is None:
+        counts = {'ACRONYMS': (size // 4), 'PEOPLE': (size // 8),
+                  'CONCEPTS': size}
+        
+    generator = random.Random(seed)
+    phrase = lambda n: ' '.join(generator.choice(WORDS)
+                                for i in xrange(generator.randint(1, n)))
+    lines = ['% name=main', '% default_inflection=singular', '',
+             '% *ACRONYMS*']
+
+    for k in xrange(counts.get('ACRONYMS', 0)):
+        lines.append('AC%dX\t%s %d' % (k, phrase(3), k))
+        if (k % 5) == 0:
+            lines.append('  - fmt%d\t- format%d' % (k, k))
+
+    lines += ['', '% *PEOPLE*']
+
+    for k in xrange(counts.get('PEOPLE', 0)):
+        lines.append('P%dQ\tSurname%d, Given%d Middle' % (k, k, k))
+
+    lines += ['', '% *CONCEPTS*']
+
+    for k in xrange(counts.get('CONCEPTS', 0)):
+        concept = '%s c%d' % (phrase(3), k)
+        meta = generator.choice(['', '', '\t:#+', '\t:#-'])
+        if meta == '\t:#+':
+            concept += 's'
+        if (k % 7) == 0:
+            concept = '%s@{\\em %s}' % (concept, concept)
+        lines.append(concept + meta)
+        if (k % 3) == 0:
+            lines.append('  sub%d -' % (k))
+            lines.append('  (-) par%d' % (k))
+        if (k % 11) == 0 and k:
+            lines.append('alias%d --> %s' % (k, concept.split('@')[0]))
+
+    return '\n'.join(lines) + '\n'
+
+class RegexCascade(object):
+    """The regular expression cascade formerly used by
+    Index.from_file(), kept as a reference for the lexer
+    (see test_lexer.py).
+    """
+    _re_macros = {
+        'FIELD': '''
+        [^%(COMMENT_TOKEN)s:\s]
+        (
+         \\\\[%(FIELD_SEPARATORS)s%(META_TOKEN)s]
+        |
+         [^%(FIELD_SEPARATORS)s%(META_TOKEN)s]
+        )+
+        ''',
+        'FIELD_SEPARATORS': FIELD_SEPARATORS,
+        'COMMENT_TOKEN': TOKEN_COMMENT,
+        'META_TOKEN': TOKEN_ENTRY_META_INFO,
+        'ALIAS_POINTER': '-->',
+        'CONCEPT_TYPES': 'ACRONYMS|CONCEPTS|PEOPLE',
+        }
+    _re_macros['FIELD'] = _re_macros['FIELD'] % _re_macros
+
+    alias_re = re.compile('''
+    ^(?P<entry>.+)\s*?%(ALIAS_POINTER)s\s*(?P<alias>.+)$
+    ''' % _re_macros, re.VERBOSE)
+
+    context_re = {
+        'CONCEPTS': re.compile('''
+        ^(?P<indent>\s+)?
+        (?P<concept>%(FIELD)s)?[%(FIELD_SEPARATORS)s]*
+        (?P<typeset_as>%(FIELD)s)?[%(FIELD_SEPARATORS)s]*
+        (?P<meta>%(META_TOKEN)s.+)?$
+        ''' % _re_macros, re.VERBOSE),
+        'ACRONYMS': re.compile('''
+        ^(?P<indent>\s+)?
+        (?P<acronym>%(FIELD)s)?[%(FIELD_SEPARATORS)s]*
+        (?P<full_form>%(FIELD)s)?[%(FIELD_SEPARATORS)s]*
+        (?P<typeset_as>%(FIELD)s)?[%(FIELD_SEPARATORS)s]*
+        (?P<meta>%(META_TOKEN)s.+)?$
+        ''' % _re_macros, re.VERBOSE),
+        'PEOPLE': re.compile('''
+        ^(?P<indent>\s+)?
+        (?P<initials>%(FIELD)s)?[%(FIELD_SEPARATORS)s]*
+        (?P<name>%(FIELD)s)?[%(FIELD_SEPARATORS)s]*
+        (?P<meta>%(META_TOKEN)s.+)?$
+        ''' % _re_macros, re.VERBOSE),
+        }
+
+    meta_directive_re = re.compile('''
+    ^%(COMMENT_TOKEN)s\s*
+    ((?P<attribute>\w+)\s*=\s*(?P<value>\w+)
+     |(?P<context>\*(%(CONCEPT_TYPES)s)\*))\s*$
+    ''' % _re_macros, re.VERBOSE)
+
+    pure_comment_re = re.compile('^\s*%(COMMENT_TOKEN)s.*' % _re_macros)
+
+    def classify(self, line, context):
+        """Return (KIND, ALIAS, GROUPS) for LINE, where GROUPS is the
+        match's groupdict().
+        """
+        line = line.rstrip()
+
+        match = self.alias_re.match(line)
+        if match:
+            line, alias = match.group('entry', 'alias')
+        else:
+            alias = None
+
+        for kind, matcher in [(lexer.LINE_DIRECTIVE, self.meta_directive_re),
+                              (lexer.LINE_COMMENT, self.pure_comment_re),
+                              (lexer.LINE_ENTRY, self.context_re[context])]:
+            match = matcher.match(line)
+            if match:
+                return kind, alias, match.groupdict()
+
+        return lexer.LINE_INVALID, alias, None
+
+class OriginalParenParser(object):
+    """The stateful ParenParser formerly used by Entry, kept as a
+    reference for tools/benchmark.py.
+    """
+    ESCAPE_TOKEN = '\\'
+
+    __default_paren_pair = {
+        '(': ')',
+        '{': '}',
+        '[': ']',
+        }
+    
+    def __init__(self, paren_pair=__default_paren_pair):
+        self.__paren_pair = paren_pair
+        self.__closings = set(self.__paren_pair.values())
+        
+    def __reset(self):
+        self.__consecutive_escapes = 0  # The number of consecutive escapes.
+        self.__opened_scopes = []       # A stack of opened scopes.
+        self.__expected_closing = None
+        
+    def __update_expected_closing(self):
+        if self.__opened_scopes:
+            most_recent_opening = self.__opened_scopes[-1][0]
+            self.__expected_closing = self.__paren_pair[most_recent_opening]
+        else:
+            self.__expected_closing = None
+        
+    def get_scope_spans(self, string, start_index=0):
+        self.__reset()
+        
+        for i in xrange(start_index, len(string)):
+            token = string[i]
+            
+            if token == self.ESCAPE_TOKEN:
+                self.__consecutive_escapes += 1
+                continue
+            
+            # If the current TOKEN is not escaped; that is, the
+            # __CONSECUTIVE_ESCAPES is zero or odd (bit-wise "& 1")...
+            if not (self.__consecutive_escapes & 1):
+                # If the TOKEN is an expected closing...
+                if token == self.__expected_closing:
+                    # Yield the start and end index for the closing
+                    # scope.
+                    yield self.__opened_scopes.pop()[1], (i + 1)
+                    
+                    self.__update_expected_closing()
+
+                # If TOKEN is an unexpected closing...
+                elif token in self.__closings:
+                    j = self.__opened_scopes[-1][1]
+                    reason = "Received unexpected closing '%s' at " \
+                             "input position %d.  " \
+                             "Input (from position %d):\n%s\n" \
+                             "Expected closing was '%s'." \
+                             % (token, i, j, string[j:(i + 1)],
+                                self.__expected_closing)
+                    raise paren_parser.UnexpectedClosingError, reason
+                
+                # If TOKEN is a legal opening token...
+                elif (token in self.__paren_pair):
+                    self.__opened_scopes.append((token, i))
+                    self.__update_expected_closing()
+                    
+            # Reset the escape-token counter.
+            self.__consecutive_escapes = 0
+
+    @staticmethod
+    def filter_outer_scopes(scopes):
+        """Removes scopes that appear inside other scopes.  Hence, only
+        the outermost scopes will be returned.
+        
+        Example:
+        >>> parenparser.remove_inner_scopes([(2, 5), (3, 4), (6, 12),
+        ...                                  (7, 11), (8, 10)])
+        [(2, 5), (6, 12)]
+        """
+        scopes = sorted(scopes)
+        keep = []
+        
+        for n, (i, j) in enumerate(scopes):
+            if n == 0:
+                pass                    # Must define an outer scope.
+            elif j < keep[-1][-1]:
+                continue
+            
+            keep.append((i, j))
+            
+        return keep
+    
+    def split(self, string, separator=None, maxsplit=None):
+        """Return a list of the words in the string STRING, using
+        SEPARATOR as the delimiter string, but scopes defined by
+        parenthetical tokens are not split.  If MAXSPLIT is given, at
+        most MAXSPLIT splits are done.  If SEPARATOR is not specified
+        or is None, any whitespace string is a separator.
+
+        Please note: The MAXSPLIT argument is not honored yet.
+        """
+        # Make sure only outermost scopes are considered.
+        indices = self.filter_outer_scopes(self.get_scope_spans(string))
+
+        # If no parenthetical scopes were detected, there are no
+        # scopes to honor.
+        if not indices:
+            return string.split(separator)
+        
+        # The following is added to avoid any special-case handling
+        # after the for-loop below.
+        if indices[-1][-1] < len(string):
+            indices.append((-1, None))
+        
+        k = None
+        result = []
+        
+        for i, j in indices:
+            parts = filter(''.__ne__, string[k:i].split(separator)) \
+                    + [string[i:j]]
+            
+            first_part = parts[0]
+            if result and (k is not None) and (first_part[0] == string[k]):
+                result[-1] += first_part
+            else:
+                result.append(first_part)
+
+            if len(parts) > 1:
+                result.extend(parts[1:-1])
+                
+                last_part = parts[-1]
+                if result[-1][-1] == string[i - 1]:
+                    result[-1] += last_part
+                else:
+                    result.append(last_part)
+                
+            k = j
+
+        return result
+
+    def strip(self, string, valid_left_sides=''.join(__default_paren_pair)):
+        if (len(string) > 1) \
+           and (string[0] in valid_left_sides) \
+           and (string[-1] in self.__default_paren_pair[string[0]]):
+            return string[1:-1]
+        else:
+            return string
+
+_intex_re = re.compile('\\\@writefile\{%s\}' \
+                       '\{\\\indexentry\{(?P<key>.*)\}\{(?P<page>\w+)\}\}' \
+                       % (INTEX_DEFAULT_INDEX))
+
+_aux_input_re = re.compile('\\\@input\{(?P<filename>.*\.aux)\}')
+
+def get_auxiliary_entries(filename):
+    """The line-by-line scanner that scan_auxiliary() replaced (as
+    Index.get_auxiliary_entries()), kept for comparison.
+    """
+    for i, line in enumerate(open(filename, 'r')):
+        line_number = (i + 1)
+
+        # Handle recursive \@include-statements within .aux files.
+        match = _aux_input_re.match(line.rstrip())
+        if match:
+            input_filename = match.group('filename')
+
+            for result in get_auxiliary_entries(input_filename):
+                yield result
+
+            continue
+
+        match = _intex_re.match(line.rstrip())
+        if not match:
+            yield (filename, line_number, False, line)
+            continue
+        key, page = match.groups()
+
+        # Keep track of any page-number typesetting hints.
+        parts = escaping.rsplit(key, '|', 1)
+
+        if len(parts) > 1:
+            key, typeset_page_number = parts
+            typeset_page_number = '|' + typeset_page_number
+        else:
+            typeset_page_number = ''
+
+        yield (filename, line_number, True, (key, page, typeset_page_number))
+
+# The escape handling formerly found in utils and Entry, kept as a
+# reference for the escaping module (see test_escaping.py).
+
+def _init_escape_aware_split(delimiter):
+    if delimiter is None:
+        delimiter = whitespace
+        lookahead = 1
+    else:
+        lookahead = len(delimiter)
+
+    return delimiter, lookahead, list(), (None, None)
+
+def escape_aware_split(string, delimiter=None, maxsplit=None):
+    delimiter, lookahead, parts, (i, j) = _init_escape_aware_split(delimiter)
+    
+    for k in xrange((len(string) - (lookahead - 1))):
+        token = string[k:(k + lookahead)]
+
+        if (token == delimiter) or (token in delimiter):
+            # Found a delimiter.  Check the number of contiguous
+            # escape tokens in front of it (right to left).
+            for l in xrange((k - 1), -1, -1):
+                if string[l] != escaping.ESCAPE_TOKEN:
+                    break
+            
+            escapes = (k - l - 1)
+            
+            if not (escapes & 1):   # Odd number of escapes?
+                # Split here.
+                parts.append(string[i:k])
+                
+                i = (k + lookahead) # Skip the delimiter token.
+                
+        if len(parts) == maxsplit:
+            break
+                
+    parts.append(string[i:j])
+    
+    return parts
+
+def escape_aware_rsplit(string, delimiter=None, maxsplit=None):
+    delimiter, lookahead, parts, (i, j) = _init_escape_aware_split(delimiter)
+    
+    for k in xrange((len(string) - lookahead), -1, -1):
+        token = string[k:(k + lookahead)]
+
+        if (token == delimiter) or (token in delimiter):
+            # Found a delimiter.  Check the number of contiguous
+            # escape tokens in front of it (right to left).
+            for l in xrange((k - 1), -1, -1):
+                if string[l] != escaping.ESCAPE_TOKEN:
+                    break
+                
+            escapes = (k - l - 1)
+            
+            if not (escapes & 1):   # Odd number of escapes?
+                # Split here.
+                parts.append(string[k + lookahead:j])
+                
+                j = k                   # Skip the delimiter token.
+                
+        if len(parts) == maxsplit:
+            break
+        
+    parts.append(string[i:j])           # Add the rest, if applicable.
+    parts.reverse()                     # Reverse the list in-place.
+    
+    return parts
+
+def original_unescape(string, escaped_tokens=FIELD_SEPARATORS,
+                      escape_token=escaping.ESCAPE_TOKEN):
+    new = list(string) 
+    previous_token = None
+    
+    for i, token in reversed(list(enumerate(string))):
+        if (token == escape_token) \
+               and (previous_token in escaped_tokens) \
+               and not (previous_token == escape_token):
+            del new[i]
+            
+        previous_token = token
+        
+    return ''.join(new)
+
+def original_is_escaped(string, i):
+    if i > 0:
+       for n, character in enumerate(string[(i - 1)::-1]):
+           if character != escaping.ESCAPE_TOKEN:
+               break
+    else:
+        n = 0
+    
+    return bool(n & 1)
+
+def main():
+    """Module mainline (for standalone execution).
+    """
+    pass
+
+if __name__ == "__main__":
+    main()
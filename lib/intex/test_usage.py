@@ -0,0 +1,153 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+from cStringIO import StringIO
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from config import INTEX_DEFAULT_INDEX
+from index import Index
+from usage import UsageReport
+
+class UsageReportTestCase(unittest.TestCase):
+    text = '\n'.join([
+        '% default_inflection=singular',
+        '% *CONCEPTS*',
+        'graph',
+        '  (-) theory',
+        'tree',
+        'forest --> tree',
+        'vertex',
+        ])
+
+    references = [
+        ('graph', '3'),
+        ('graphs', '3'),
+        ('theory', '5'),
+        ('forest', 'ii'),
+        ('graph', '12'),
+        ]
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.auxiliary = os.path.join(self.directory, 'document.aux')
+
+        stream = open(self.auxiliary, 'w')
+        for key, page in self.references:
+            print >> stream, '\\@writefile{%s}{\\indexentry{%s}{%s}}' \
+                  % (INTEX_DEFAULT_INDEX, key, page)
+        stream.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        
+    def runTest(self):
+        index = Index.from_string(self.text, 'glossary.itx')
+        index.generate_reference_index()
+        
+        usage = UsageReport([index])
+        index.interpret_auxiliary(self.auxiliary, StringIO(), StringIO(),
+                                  usage)
+
+        # The most referred to entries come first.
+        rows = usage.get_rows()
+        self.assertEqual(rows[0], ('glossary.itx', 3, 'concept', 'graph',
+                                   3, 0, ['3', '12']))
+        self.assertEqual(rows[1][3:], ('graph theory', 1, 1, ['5']))
+
+        # The target of a used alias is not unused.
+        self.assertEqual([row[3] for row in usage.get_unused_rows()],
+                         ['vertex'])
+
+        stream = StringIO()
+        usage.write(stream, 'usage.json', unused=True)
+        self.assertEqual(json.loads(stream.getvalue()),
+                         [{'file': 'glossary.itx', 'line': 7,
+                           'type': 'concept', 'reference': 'vertex',
+                           'count': 0, 'short_count': 0, 'pages': []}])
+
+        stream = StringIO()
+        usage.write(stream, 'usage.tsv')
+        self.assertEqual(stream.getvalue().split('\n')[1],
+                         'glossary.itx\t3\tconcept\tgraph\t3\t0\t3,12')
+        
+class EncodingTestCase(UsageReportTestCase):
+    # An index file in Latin-1, not UTF-8.
+    text = '\n'.join([
+        '% default_inflection=singular',
+        '% *CONCEPTS*',
+        'Bokm\xe5lsordboka',
+        'Nynorskordboka',
+        ])
+
+    references = [
+        ('Bokm\xe5lsordboka', '2'),
+        ]
+    
+    def runTest(self):
+        index = Index.from_string(self.text, 'glossary.itx')
+        index.generate_reference_index()
+        
+        usage = UsageReport([index])
+        index.interpret_auxiliary(self.auxiliary, StringIO(), StringIO(),
+                                  usage)
+
+        # An entry without any references is reported without one.
+        entry = index[1]
+        for inflection, phrase in entry.reference.items():
+            entry.reference[inflection] = ''
+        
+        stream = StringIO()
+        usage.write(stream, 'usage.json')
+        self.assertEqual([(row['reference'], row['pages'])
+                          for row in json.loads(stream.getvalue())],
+                         [(u'Bokm\xe5lsordboka', [u'2']), (u'', [])])
+
+        # The pages are decoded as well (the auxiliary file is written
+        # in the encoding of the document).
+        stream = StringIO()
+        UsageReport.write_json([('glossary.itx', 3, 'concept', 'graph', 1,
+                                 0, ['f\xf8r'])], stream)
+        self.assertEqual(json.loads(stream.getvalue())[0]['pages'],
+                         [u'f\xf8r'])
+        
+class UsageTestSuite(unittest.TestSuite):
+    def __init__(self):
+        unittest.TestSuite.__init__(self, [
+            UsageReportTestCase(),
+            EncodingTestCase(),
+            ])
+        
+def main():
+    """Module mainline (for standalone execution).
+    """
+    suite = UsageTestSuite()
+    unittest.TextTestRunner(verbosity=2).run(suite)
+
+if __name__ == "__main__":
+    main()
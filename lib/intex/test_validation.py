@@ -0,0 +1,132 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from index import Index
+from validation import check_files, check_text
+
+class CheckTextTestCase(unittest.TestCase):
+    text = '\n'.join([
+        'graph',
+        '% default_inflection=singular',
+        '% *ACRONYMS*',
+        'DAG',
+        '  - format',
+        '% *CONCEPTS*',
+        'tree',
+        '    (-) root',
+        '  (-) leaf',
+        'tree',
+        'forest --> woods',
+        ])
+    
+    def runTest(self):
+        problems = check_text(self.text, 'glossary.itx')
+
+        # All the problems are found, not just the first one.  The
+        # sub-entry of the invalid acronym is left out.
+        self.assertEqual([problem[:3] for problem in problems],
+                         [('glossary.itx', 1, 'error'),
+                          ('glossary.itx', 4, 'error'),
+                          ('glossary.itx', 9, 'error'),
+                          ('glossary.itx', 10, 'error'),
+                          ('glossary.itx', 7, 'warning'),
+                          ('glossary.itx', 11, 'error')])
+        self.assertEqual(problems[3][3], 'The full-form references "Tree", '
+                         '"Trees", "tree", "trees" are already defined on '
+                         'line 7.')
+        
+class UninflectedTestCase(unittest.TestCase):
+    text = '\n'.join([
+        '% default_inflection=singular',
+        '% *ACRONYMS*',
+        'DNA\tdeoxyribonucleic acid\t:#!',
+        '% *CONCEPTS*',
+        'graph',
+        '  directed -',
+        '    perhaps:#!',
+        'software\t:#!',
+        ])
+    
+    def runTest(self):
+        # The check and the build agree on which files are valid.
+        for text, lines in [(self.text, []),
+                            (self.text + '\nsoftware', [9])]:
+            problems = check_text(text, 'glossary.itx')
+            self.assertEqual([line for (filename, line, severity, message)
+                              in problems if severity == 'error'], lines)
+
+            index = Index.from_string(text, 'glossary.itx')
+            if lines:
+                self.assertRaises(SystemExit, index.generate_reference_index)
+            else:
+                index.generate_reference_index()
+                self.assert_('DNA' in index.references)
+                
+class CheckFilesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filenames = [os.path.join(self.directory, name)
+                          for name in ('a.itx', 'b.itx', 'missing.itx')]
+
+        for filename, text in zip(self.filenames,
+                                  [CheckTextTestCase.text, 'graph\n']):
+            stream = open(filename, 'w')
+            stream.write(text)
+            stream.close()
+            
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        
+    def runTest(self):
+        problems = check_files(self.filenames)
+        
+        self.assertEqual(len(problems), 8)
+        self.assertEqual(problems, sorted(problems))
+        self.assertEqual(problems[-1][:3], (self.filenames[2], 0, 'error'))
+
+        # The problems do not depend on the number of worker processes.
+        self.assertEqual(check_files(self.filenames, jobs=3), problems)
+        
+class ValidationTestSuite(unittest.TestSuite):
+    def __init__(self):
+        unittest.TestSuite.__init__(self, [
+            CheckTextTestCase(),
+            UninflectedTestCase(),
+            CheckFilesTestCase(),
+            ])
+        
+def main():
+    """Module mainline (for standalone execution).
+    """
+    suite = ValidationTestSuite()
+    unittest.TextTestRunner(verbosity=2).run(suite)
+
+if __name__ == "__main__":
+    main()
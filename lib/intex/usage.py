@@ -0,0 +1,174 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+from array import array
+import json
+import os
+
+from normalization import decode
+from utils import sort_pages
+
+# The columns of usage reports (in the order of the TSV format).
+COLUMNS = ('file', 'line', 'type', 'reference', 'count', 'short_count',
+           'pages')
+
+class _IndexUsage(object):
+    """The references to the entries of one index, stored in arrays
+    indexed by the positions of the entries.
+    """
+    __slots__ = ('index', 'counts', 'short_counts', 'pages')
+
+    def __init__(self, index):
+        self.index = index
+        self.counts = array('l', [0]) * len(index)
+        self.short_counts = array('l', [0]) * len(index)
+
+        # The pages that each entry (that has been referred to) was
+        # referred to on, in the order of the references.
+        self.pages = dict()
+
+class UsageReport(object):
+    """A reverse index of the references to the entries of a set of
+    indices: how many times each entry was referred to, how many of
+    those references used a short-form phrase, and on which pages.
+    """
+    def __init__(self, indices):
+        self._usages = [_IndexUsage(index) for index in indices]
+        self._by_index = dict((id(usage.index), usage)
+                              for usage in self._usages)
+
+    def add(self, entry, phrase, inflection, page):
+        """Record a reference to ENTRY on PAGE, by the reference PHRASE
+        of the given INFLECTION.
+        """
+        usage = self._by_index.get(id(entry.index))
+        if usage is None:
+            return
+
+        position = entry.position
+        usage.counts[position] += 1
+
+        # A reference phrase that differs from the entry's full-form
+        # phrase of the same inflection is a short-form phrase.
+        if entry.reference[inflection] != phrase:
+            usage.short_counts[position] += 1
+
+        pages = usage.pages.setdefault(position, [])
+        if not pages or (pages[-1] != page):
+            pages.append(page)
+
+    def _get_row(self, usage, position):
+        index = usage.index
+        entry = index[position]
+
+        reference = entry.reference[entry.index_inflection] \
+                    or next((phrase for phrase in entry.reference if phrase),
+                            '')
+
+        return (index._filename, index.get_line_number(position),
+                entry.get_entry_type(), reference, usage.counts[position],
+                usage.short_counts[position],
+                sort_pages(usage.pages.get(position, ())))
+
+    def get_rows(self):
+        """Return a row (a tuple of the values of the COLUMNS) for each
+        entry, the most referred to entries first.
+        """
+        rows = [self._get_row(usage, position)
+                for usage in self._usages
+                for position in xrange(len(usage.index))]
+        rows.sort(key=lambda row: (- row[4], row[:2]))
+
+        return rows
+
+    def get_unused_rows(self):
+        """Return a row (see get_rows()) for each entry that was never
+        referred to, either directly or through an alias, in the order
+        of the files and lines they were defined on.
+        """
+        used = set()
+        for usage in self._usages:
+            for alias, (target, see_lines) in usage.index.aliases.iteritems():
+                if usage.counts[alias.position]:
+                    used.add(target)
+
+        return [self._get_row(usage, position)
+                for usage in self._usages
+                for position in xrange(len(usage.index))
+                if not (usage.counts[position]
+                        or (usage.index[position] in used))]
+
+    @staticmethod
+    def write_tsv(rows, stream):
+        """Write ROWS to STREAM as tab-separated values, with the pages
+        separated by commas.
+        """
+        print >> stream, '\t'.join(COLUMNS)
+
+        for row in rows:
+            print >> stream, '\t'.join([str(value) for value in row[:-1]]
+                                       + [','.join(row[-1])])
+
+    @staticmethod
+    def write_json(rows, stream):
+        """Write ROWS to STREAM as a JSON list of objects.  The strings
+        (including the pages) are decoded as by normalization.decode(),
+        as the index and auxiliary files may be in UTF-8 or Latin-1.
+        """
+        def decode_value(value):
+            if isinstance(value, str):
+                return decode(value)
+            elif isinstance(value, list):
+                return [decode_value(item) for item in value]
+            return value
+        
+        rows = [[decode_value(value) for value in row] for row in rows]
+        
+        json.dump([dict(zip(COLUMNS, row)) for row in rows], stream,
+                  indent=1, separators=(',', ': '), sort_keys=True)
+        stream.write('\n')
+
+    def write(self, stream, filename, unused=False):
+        """Write the report (or only the unused entries, if UNUSED is
+        true) to STREAM.  The format is JSON if FILENAME ends with
+        .json, and TSV otherwise.
+        """
+        if unused:
+            rows = self.get_unused_rows()
+        else:
+            rows = self.get_rows()
+
+        if os.path.splitext(filename)[1].lower() == '.json':
+            self.write_json(rows, stream)
+        else:
+            self.write_tsv(rows, stream)
+
+def main():
+    """Module mainline (for standalone execution).
+    """
+    pass
+
+if __name__ == "__main__":
+    main()
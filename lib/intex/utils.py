@@ -24,80 +24,48 @@ __revision__ = "$Rev$"
 __version__ = "@VERSION@"
 
 from itertools import chain
-from string import whitespace
-
-ESCAPE_TOKEN = '\\'
+import sys
 
 def flatten(sequence):
     """Returns a flattened list.
     """
     return list(chain(*sequence))
 
-def _init_escape_aware_split(delimiter):
-    if delimiter is None:
-        delimiter = whitespace
-        lookahead = 1
+def _get_page_order(page):
+    # Arabic page numbers in numeric order, before any other (such as
+    # roman) page numbers.
+    if page.isdigit():
+        return (0, int(page), page)
     else:
-        lookahead = len(delimiter)
-
-    return delimiter, lookahead, list(), (None, None)
+        return (1, 0, page)
 
-def escape_aware_split(string, delimiter=None, maxsplit=None):
-    delimiter, lookahead, parts, (i, j) = _init_escape_aware_split(delimiter)
-    
-    for k in xrange((len(string) - (lookahead - 1))):
-        token = string[k:(k + lookahead)]
+def sort_pages(pages):
+    """Return a sorted list of the distinct page numbers in PAGES (an
+    iterable of strings).
+    """
+    return sorted(set(pages), key=_get_page_order)
 
-        if (token == delimiter) or (token in delimiter):
-            # Found a delimiter.  Check the number of contiguous
-            # escape tokens in front of it (right to left).
-            for l in xrange((k - 1), -1, -1):
-                if string[l] != ESCAPE_TOKEN:
-                    break
-            
-            escapes = (k - l - 1)
-            
-            if not (escapes & 1):   # Odd number of escapes?
-                # Split here.
-                parts.append(string[i:k])
-                
-                i = (k + lookahead) # Skip the delimiter token.
-                
-        if len(parts) == maxsplit:
-            break
-                
-    parts.append(string[i:j])
-    
-    return parts
+class StringTable(dict):
+    """A table of strings, used for sharing one string object among
+    all the places that hold an equal string.
+    """
+    def __init__(self):
+        dict.__init__(self)
 
-def escape_aware_rsplit(string, delimiter=None, maxsplit=None):
-    delimiter, lookahead, parts, (i, j) = _init_escape_aware_split(delimiter)
-    
-    for k in xrange((len(string) - lookahead), -1, -1):
-        token = string[k:(k + lookahead)]
+        self.requests = 0         # The number of strings interned.
+        self.bytes_saved = 0      # The size of the duplicates dropped.
 
-        if (token == delimiter) or (token in delimiter):
-            # Found a delimiter.  Check the number of contiguous
-            # escape tokens in front of it (right to left).
-            for l in xrange((k - 1), -1, -1):
-                if string[l] != ESCAPE_TOKEN:
-                    break
-                
-            escapes = (k - l - 1)
-            
-            if not (escapes & 1):   # Odd number of escapes?
-                # Split here.
-                parts.append(string[k + lookahead:j])
-                
-                j = k                   # Skip the delimiter token.
-                
-        if len(parts) == maxsplit:
-            break
+    def intern(self, string):
+        """Return the string in the table that equals STRING, after
+        adding STRING to the table if there is none.
+        """
+        self.requests += 1
         
-    parts.append(string[i:j])           # Add the rest, if applicable.
-    parts.reverse()                     # Reverse the list in-place.
-    
-    return parts
+        shared = self.setdefault(string, string)
+        if shared is not string:
+            self.bytes_saved += sys.getsizeof(string)
+
+        return shared
 
 def main():
     """Module mainline (for standalone execution).
@@ -0,0 +1,110 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+from itertools import chain
+import multiprocessing
+import os
+
+from index import Index
+
+def check_text(text, filename):
+    """Return the problems found in TEXT, the contents of the .itx file
+    FILENAME (see Index.from_string()), including those found when its
+    reference index is generated.
+    """
+    problems = []
+    
+    index = Index.from_string(text, filename, problems=problems)
+    index.generate_reference_index()
+
+    return problems
+
+def check_file(filename, cache=None):
+    """Return the problems found in the index file FILENAME.  If CACHE
+    (an IndexCache) is given, the problems of unchanged files are not
+    looked for again.
+    """
+    try:
+        stream = open(filename, 'rb')
+        text = stream.read()
+        stream.close()
+    except IOError, e:
+        return [(filename, 0, 'error',
+                 'Unable to read the file (%s).' % (e.strerror))]
+
+    if cache is not None:
+        return cache.get_problems(text, filename)
+    
+    return check_text(text, filename)
+
+def _check_file((filename, cache)):
+    return check_file(filename, cache)
+
+def _get_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+def check_files(filenames, jobs=1, cache=None):
+    """Return the problems found in the index files FILENAMES, sorted by
+    file and line.  If JOBS is larger than one, the files are checked
+    in (at most) JOBS worker processes.  CACHE is passed on to
+    check_file().
+    """
+    jobs = min(jobs, len(filenames))
+
+    if jobs <= 1:
+        return sorted(chain.from_iterable(check_file(filename, cache)
+                                          for filename in filenames))
+
+    # The largest files are checked first, so that no worker is left
+    # with a large file at the end.
+    filenames = sorted(filenames, key=_get_size, reverse=True)
+    
+    pool = multiprocessing.Pool(jobs)
+    try:
+        results = pool.map(_check_file,
+                           [(filename, cache) for filename in filenames],
+                           chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    return sorted(chain.from_iterable(results))
+
+def format_problem(problem):
+    """Return PROBLEM formatted as FILENAME:LINE_NUMBER: SEVERITY:
+    MESSAGE.
+    """
+    return '%s:%d: %s: %s' % problem
+
+def main():
+    """Module mainline (for standalone execution).
+    """
+    pass
+
+if __name__ == "__main__":
+    main()
@@ -27,14 +27,23 @@ from contextlib import nested
 from itertools import count, imap
 
 import logging
+import multiprocessing
 import optparse
 import os
 import re
+import subprocess
 import sys
+import time
 
 from intex.config import INTEX_DEFAULT_INDEX, INTEX_INPUT_EXT, INTEX_OUTPUT_EXT
 
-from intex.index import Index
+from intex.auxiliary import follow_auxiliary
+from intex.cache import IndexCache
+from intex.inflection import get_rule_packs
+from intex.parallel import load_indices
+from intex.suggestions import group_misses, SuggestionIndex
+from intex.usage import UsageReport
+from intex.validation import check_files, format_problem
         
 def parse_command_line(command_line_options, usage):
     """Parse the command line according to the possible
@@ -57,13 +66,16 @@ Written by Martin Thorsen Ranang."""
     return parser.parse_args()
 
 
-def resolve_auxiliary_and_args(args):
+def resolve_auxiliary_and_args(args, may_be_missing=False):
     """Resolve the name of the current LaTeX auxiliary file (.aux)
     based on the supplied arguments and the current working directory.
+    If MAY_BE_MISSING is true, an .aux file given explicitly need not
+    exist (yet).
     """
     aux_re = re.compile('^.*\.aux$', re.IGNORECASE)
     auxiliary = [arg for arg in args
-                 if aux_re.match(arg) and os.path.exists(arg)]
+                 if aux_re.match(arg)
+                 and (may_be_missing or os.path.exists(arg))]
     args = [arg for arg in args if arg not in auxiliary]
 
     attempts = count(-2)
@@ -85,6 +97,61 @@ def resolve_auxiliary_and_args(args):
         
     return auxiliary, args
 
+
+def get_index_filenames(args):
+    """Return the names of the index files given by ARGS, or, if none
+    were given, of those in the current working directory.
+    """
+    if args:
+        return args
+    
+    suffix_re = re.compile('^.*\.%s$' % (INTEX_INPUT_EXT))
+        
+    return [filename
+            for filename in os.listdir(os.getcwd())
+            if suffix_re.match(filename)]
+
+def check(filenames, jobs, cache):
+    """Check the index files FILENAMES (in JOBS parallel processes,
+    using CACHE, if given), output all the problems found, sorted by
+    file and line, and exit with a non-zero status if any of them are
+    errors.
+    """
+    problems = check_files(filenames, jobs, cache)
+
+    for problem in problems:
+        print format_problem(problem)
+
+    errors = len([problem for problem in problems if problem[2] == 'error'])
+    
+    logging.info('Checked %d index file(s): %d error(s), %d warning(s).',
+                 len(filenames), errors, (len(problems) - errors))
+    
+    if errors:
+        sys.exit(1)
+        
+def log_string_statistics(indices):
+    """Log how much memory was saved by sharing equal strings within
+    each of the INDICES.
+    """
+    for index in indices:
+        strings = index.strings
+        logging.info('Shared %d generated strings as %d distinct strings '
+                     'in "%s" (%d bytes saved, the table uses %d bytes).',
+                     strings.requests, len(strings), index._filename,
+                     strings.bytes_saved, sys.getsizeof(strings))
+        
+def log_inflection_statistics():
+    """Log how often each inflection rule was used (by this process;
+    indices loaded from the cache or parsed by worker processes are
+    not counted).
+    """
+    for rule_pack in get_rule_packs():
+        hits = sorted(rule_pack.get_hits().iteritems(),
+                      key=lambda (rule, count): count, reverse=True)
+        for (inflection, label), count in hits:
+            logging.info('Inflection rule %s (%s, %s) used %d times.',
+                         label, rule_pack.language, inflection, count)
         
 def main():
     """Module mainline (for standalone execution).
@@ -129,6 +196,60 @@ def main():
           'metavar': 'FILE',
           'help': 'output (person) name definitions to FILE ' \
           '(default: %default)'}),
+        (['-j', '--jobs'],
+         {'dest': 'jobs',
+          'default': None,
+          'type': 'int',
+          'metavar': 'N',
+          'help': 'parse the index files, and scan the included .aux ' \
+          'files, in N parallel processes ' \
+          '(default: 1, or the number of CPUs with --check)'}),
+        (['--check'],
+         {'dest': 'check',
+          'default': False,
+          'action': 'store_true',
+          'help': 'only check the index files, and report all the errors ' \
+          'and warnings found (exits with a non-zero status if there ' \
+          'were errors)'}),
+        (['--usage-report'],
+         {'dest': 'usage_report',
+          'default': None,
+          'metavar': 'FILE',
+          'help': 'output how many times, and on which pages, each entry ' \
+          'of the last index file was referred to, to FILE (JSON if ' \
+          'FILE ends with .json, otherwise TSV; - for standard output)'}),
+        (['--unused'],
+         {'dest': 'unused',
+          'default': False,
+          'action': 'store_true',
+          'help': 'only list the entries (of the last index file) that ' \
+          'were never referred to in the usage report'}),
+        (['--follow'],
+         {'dest': 'follow',
+          'default': None,
+          'metavar': 'COMMAND',
+          'help': 'run the LaTeX COMMAND (such as "pdflatex paper"), and ' \
+          'interpret the .aux file while it is being written; the output ' \
+          'files are replaced when COMMAND exits successfully'}),
+        (['--no-cache'],
+         {'dest': 'use_cache',
+          'default': True,
+          'action': 'store_false',
+          'help': 'do not use (or update) the cache of parsed index files ' \
+          'and resolved included .aux files'}),
+        (['--cache-dir'],
+         {'dest': 'cache_dir',
+          'default': None,
+          'metavar': 'DIR',
+          'help': 'cache parsed index files in DIR ' \
+          '(default: $XDG_CACHE_HOME/intex or ~/.cache/intex)'}),
+        (['--prune-cache'],
+         {'dest': 'prune_cache',
+          'default': None,
+          'type': 'float',
+          'metavar': 'DAYS',
+          'help': 'only remove the cache entries that have not been used ' \
+          'in DAYS days (0 empties the cache)'}),
         ]
 
     # Parse the command line options.
@@ -149,8 +270,30 @@ def main():
     # Configure the logging module.
     logging.basicConfig(format='%(asctime)s: %(levelname)s: %(message)s',
                         level=log_level)
+
+    if options.prune_cache is not None:
+        removed = IndexCache(options.cache_dir).prune(options.prune_cache
+                                                      * 24 * 60 * 60)
+        logging.info('Removed %d cache entries.', removed)
+        return
     
-    auxiliary, args = resolve_auxiliary_and_args(args)
+    if options.use_cache:
+        cache = IndexCache(options.cache_dir)
+    else:
+        cache = None
+
+    if options.check:
+        if options.jobs is None:
+            options.jobs = multiprocessing.cpu_count()
+            
+        check(get_index_filenames(args), options.jobs, cache)
+        return
+
+    if options.jobs is None:
+        options.jobs = 1
+        
+    auxiliary, args = resolve_auxiliary_and_args(args,
+                                                 (options.follow is not None))
     if not auxiliary:
         logging.warning('No LaTeX auxiliary file specified; exiting.')
         sys.exit(1)
@@ -159,14 +302,7 @@ def main():
         logging.warning('No output index file specified; exiting.')
         sys.exit(1)
         
-    if len(args) == 0:
-        suffix_re = re.compile('^.*\.%s$' % (INTEX_INPUT_EXT))
-        
-        filenames = [filename
-                     for filename in os.listdir(os.getcwd())
-                     if suffix_re.match(filename)]
-    else:
-        filenames = args
+    filenames = get_index_filenames(args)
 
     # If no ITO file was explicitly stated, deduce the implied name.
     if options.ito_filename is None:
@@ -183,14 +319,22 @@ def main():
         logging.info('Will use InTeX input files: %s',
                      ', '.join(imap('"%s"'.__mod__, filenames)))
         
+    # LaTeX is started first, so that it runs while the indices are
+    # generated.
+    if options.follow is not None:
+        since = time.time()
+        latex = subprocess.Popen(options.follow, shell=True)
+        
     # Instatiate one Index object per file specified on the command
     # line.
     logging.info('Generating index...')
-    indices = [Index.from_file(filename) for filename in filenames]
+
+    # Parse the files and generate all reference indices.
+    indices = load_indices(filenames, options.jobs, cache)
     
-    # Generate all reference indices. 
-    for index in indices:
-        index.generate_reference_index()
+    if cache is not None:
+        logging.info('Index cache: %d hit(s), %d miss(es).',
+                     cache.hits, cache.misses)
         
     logging.info('... done (index generated).')
     
@@ -199,17 +343,78 @@ def main():
             logging.debug('\n%s', index)
             
     if options.only_build_index:
+        log_string_statistics(indices)
+        log_inflection_statistics()
         return
     
-    with nested(open(options.ito_filename, 'w'),
-                open(options.index_filename, 'w')) \
+    # The references are only looked up in the last index, so only its
+    # entries are reported.
+    if options.usage_report is not None:
+        usage = UsageReport(indices[-1:])
+    else:
+        usage = None
+        
+    if options.follow is None:
+        records = None
+        suffix = ''
+    else:
+        records = follow_auxiliary(auxiliary,
+                                   lambda: (latex.poll() is not None), since)
+
+        # LaTeX reads the .ito file while it runs, so the output is
+        # written to temporary files until it is done.
+        suffix = os.extsep + 'tmp'
+        
+    with nested(open(options.ito_filename + suffix, 'w'),
+                open(options.index_filename + suffix, 'w')) \
         as (internal_file, index_file):
-        not_found = index.interpret_auxiliary(auxiliary, internal_file,
-                                              index_file)
+        not_found = indices[-1].interpret_auxiliary(auxiliary,
+                                                    internal_file, index_file,
+                                                    usage, options.jobs,
+                                                    cache, records)
+
+    if suffix:
+        # The output of a failed LaTeX run is discarded, keeping the
+        # files of the last successful run (see the end of main()).
+        for filename in (options.ito_filename, options.index_filename):
+            if latex.wait():
+                os.remove(filename + suffix)
+            else:
+                os.rename(filename + suffix, filename)
+        
+
+    if usage is not None:
+        if options.usage_report == '-':
+            usage.write(sys.stdout, options.usage_report, options.unused)
+        else:
+            with open(options.usage_report, 'w') as stream:
+                usage.write(stream, options.usage_report, options.unused)
         
-    for reference, page in not_found:
-        logging.warn('On page %s, reference to "%s" was not found '
-                     'in the index.', page, reference)
+    if not_found:
+        # Built only when needed, from the references of the index
+        # that the keys were looked up in.
+        suggestions = SuggestionIndex.from_indices(indices[-1:])
+        
+    for reference, pages in group_misses(not_found):
+        candidates = suggestions.suggest(reference)
+        if candidates:
+            hint = '  Did you mean %s?' \
+                   % (' or '.join('"%s"' % (candidate)
+                                  for candidate in candidates))
+        else:
+            hint = ''
+            
+        logging.warn('Reference to "%s" (on page%s %s) was not found in the '
+                     'index.%s', reference, 's'[:(len(pages) > 1)],
+                     ', '.join(pages), hint)
+
+    log_string_statistics(indices)
+    log_inflection_statistics()
+
+    if (options.follow is not None) and latex.returncode:
+        logging.error('"%s" exited with status %d.', options.follow,
+                      latex.returncode)
+        sys.exit(1)
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,607 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# $Id$
+"""
+Copyright (C) 2007, 2008 by Martin Thorsen Ranang
+
+This file is part of InTeX.
+
+InTeX is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free
+Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+InTeX is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with InTeX.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__author__ = "Martin Thorsen Ranang <mtr@ranang.org>"
+__revision__ = "$Rev$"
+__version__ = "@VERSION@"
+
+# The benchmarks are not installed with the intex package.  Run them
+# with the library on the path, as in
+#
+#   PYTHONPATH=lib tools/benchmark.py -n 50000 chapters
+
+import cPickle
+from cStringIO import StringIO
+import multiprocessing
+import optparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from intex.auxiliary import INPUT_MARKER, follow_auxiliary, \
+     resolve_auxiliary, scan_auxiliary
+from intex.cache import IndexCache
+from intex.index import Index
+from intex.lexer import Lexer
+from intex.parallel import load_indices
+from intex.paren_parser import ParenParser
+from intex.test_support import generate_glossary, get_auxiliary_entries, \
+     OriginalParenParser, RegexCascade, WORDS
+from intex.suggestions import SuggestionIndex
+
+def report(label, seconds, count, size):
+    print '%-28s %8.3f s %10.0f lines/s %8.2f MB/s' \
+          % (label, seconds, (count / seconds), (size / seconds / 2 ** 20))
+
+def benchmark_lexer(size):
+    """Compare the lexer with the regular expression cascade it
+    replaced.
+    """
+    text = generate_glossary(size)
+
+    lines = text.split('\n')
+    lexer = Lexer(RegexCascade.context_re)
+    cascade = RegexCascade()
+
+    start = time.time()
+    context = None
+    for line in lines:
+        if line.isspace() or not line:
+            continue
+        kind, alias, groups = cascade.classify(line, context or 'CONCEPTS')
+        if groups and groups.get('context'):
+            context = groups['context'][1:-1]
+    report('regex cascade', (time.time() - start), len(lines), len(text))
+
+    start = time.time()
+    for token in lexer.tokenize(text):
+        pass
+    report('lexer', (time.time() - start), len(lines), len(text))
+
+    # A few lines that make the cascade backtrack heavily.
+    lines = ['% *ACRONYMS*', 'ab cd ' * 50 + '\t%', 'a' * 300 + '\tx',
+             'ab\\\t' * 75 + '\tx']
+    text = '\n'.join(lines)
+
+    start = time.time()
+    for line in lines[1:]:
+        cascade.classify(line, 'ACRONYMS')
+    report('regex cascade (pathological)', (time.time() - start),
+           len(lines), len(text))
+
+    start = time.time()
+    for token in lexer.tokenize(text):
+        pass
+    report('lexer (pathological)', (time.time() - start), len(lines),
+           len(text))
+
+def benchmark_paren(size):
+    """Compare the paren parser with the stateful one it replaced, on
+    the concepts of a synthetic glossary.
+    """
+    text = generate_glossary(size, counts={'CONCEPTS': size})
+    strings = [line.split('\t')[0].strip()
+               for line in text.split('\n')[4:] if line]
+    length = sum(len(string) for string in strings)
+
+    def escape_aware_split(parser, string, separator, maxsplit=None):
+        # The way Entry rejoined escaped separators before the parser
+        # learned to skip them itself.
+        parts = parser.split(string, separator, maxsplit)
+        for i, part in reversed(list(enumerate(parts))):
+            if part[-1:] == '\\':
+                parts[i] = separator.join((parts[i], parts[i + 1]))
+                del parts[i + 1]
+        return parts[:2]
+    
+    for label, parser in [('original', OriginalParenParser()),
+                          ('new', ParenParser())]:
+        if label == 'original':
+            typeset_as = lambda string: escape_aware_split(parser, string,
+                                                           '@')
+        else:
+            typeset_as = lambda string: parser.split(string, '@', 1, True)
+
+        for task, function in [
+            ('split', parser.split),
+            ('split at @', typeset_as),
+            ('strip', parser.strip),
+            ]:
+            start = time.time()
+            for string in strings:
+                function(string)
+            report('%s (%s)' % (label, task), (time.time() - start),
+                   len(strings), length)
+            
+def generate_tree(size, fanout=4, depth=3, seed=1):
+    """Return the text of a synthetic .itx file with SIZE concepts, each
+    with FANOUT sub-entries on each of DEPTH levels below it.
+    """
+    generator = random.Random(seed)
+    lines = ['% default_inflection=singular', '% *CONCEPTS*']
+
+    def add_children(level, k):
+        for i in xrange(fanout):
+            word = generator.choice(WORDS)
+            template = generator.choice(['%s%d%d -', '(-) %s%d%d',
+                                         '%s%d%d (-) \\-x'])
+            lines.append('  ' * level + template % (word, k, i))
+            if level < depth:
+                add_children((level + 1), k)
+            
+    for k in xrange(size):
+        lines.append('%s c%d' % (generator.choice(WORDS), k))
+        add_children(1, k)
+        
+    return '\n'.join(lines) + '\n'
+
+def benchmark_subentries(size):
+    """Report the time used to parse a glossary of deeply nested
+    sub-entries, and to set up all their generated fields.
+    """
+    text = generate_tree(max(1, size // 85))
+    lines = text.count('\n')
+
+    start = time.time()
+    index = Index.from_string(text)
+    report('parse (%d entries)' % (len(index)), (time.time() - start),
+           lines, len(text))
+    
+    start = time.time()
+    for entry in index:
+        entry.materialize()
+    report('materialize', (time.time() - start), lines, len(text))
+
+def benchmark_suggestions(size, queries=1000):
+    """Report the time used to index SIZE reference phrases for
+    suggestions, and to suggest phrases for QUERIES misspelled ones.
+    """
+    generator = random.Random(1)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    
+    vocabulary = [''.join(generator.choice(letters)
+                          for i in xrange(generator.randint(3, 10)))
+                  for k in xrange(max(100, size // 25))]
+    phrases = set()
+    while len(phrases) < size:
+        phrases.add(' '.join(generator.choice(vocabulary)
+                             for i in xrange(generator.randint(1, 3))))
+    phrases = list(phrases)
+
+    misspelled = []
+    for k in xrange(queries):
+        phrase = list(generator.choice(phrases))
+        for edit in xrange(generator.randint(1, 2)):
+            i = generator.randrange(len(phrase))
+            phrase[i] = generator.choice(letters)
+        misspelled.append(''.join(phrase))
+    length = sum(len(phrase) for phrase in misspelled)
+        
+    start = time.time()
+    suggestions = SuggestionIndex((phrase, phrase) for phrase in phrases)
+    report('index (%d phrases)' % (len(suggestions)), (time.time() - start),
+           len(phrases), sum(len(phrase) for phrase in phrases))
+    
+    start = time.time()
+    found = sum(bool(suggestions.suggest(phrase)) for phrase in misspelled)
+    seconds = time.time() - start
+    report('suggest (%d found)' % (found), seconds, queries, length)
+    print '%-28s %8.3f ms' % ('per query', (1000 * seconds / queries))
+    
+def benchmark_jobs(size, files=8):
+    """Compare loading FILES glossaries (of SIZE concepts in total) with
+    1, 2, 4, and 8 worker processes.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = []
+        for i in xrange(files):
+            filename = os.path.join(directory, 'glossary%d.itx' % (i))
+            stream = open(filename, 'w')
+            stream.write(generate_glossary((size // files), seed=i))
+            stream.close()
+            filenames.append(filename)
+
+        expected = None
+        for jobs in [1, 2, 4, 8]:
+            start = time.time()
+            indices = load_indices(filenames, jobs)
+            seconds = time.time() - start
+
+            # The output must not depend on the number of workers.
+            result = [(str(index), sorted(index.references))
+                      for index in indices]
+            if expected is None:
+                expected, serial = result, seconds
+            assert result == expected
+
+            print '%d job(s) %8.3f s  (speedup %.2f)' \
+                  % (jobs, seconds, (serial / seconds))
+    finally:
+        shutil.rmtree(directory)
+
+def benchmark_incremental(size):
+    """Compare re-parsing a glossary after a one-line edit from scratch
+    with re-parsing it incrementally.
+    """
+    text = generate_glossary(size)
+    lines = text.split('\n')
+    
+    previous = Index.from_string(text)
+    previous.generate_reference_index()
+    data = cPickle.dumps(previous, cPickle.HIGHEST_PROTOCOL)
+
+    # Edit a concept in the middle of the glossary.
+    i = len(lines) // 2
+    while lines[i][:1].isspace() or ('-->' in lines[i]):
+        i += 1
+    lines[i] = lines[i].replace(' c', ' edited c', 1)
+    text = '\n'.join(lines)
+    
+    start = time.time()
+    index = Index.from_string(text)
+    index.generate_reference_index()
+    report('full parse', (time.time() - start), len(lines), len(text))
+    expected = sorted(index.references)
+
+    previous = cPickle.loads(data)
+    start = time.time()
+    index = Index.from_string(text, previous=previous)
+    index.update_reference_index(previous)
+    report('incremental parse (%d new)' % (len(index._added)),
+           (time.time() - start), len(lines), len(text))
+    assert sorted(index.references) == expected
+
+def get_deep_size(entry, seen):
+    """Return the number of bytes used by ENTRY and the objects it
+    refers to, except other entries, indices, and the objects already
+    in SEEN.
+    """
+    size = 0
+    pending = [entry]
+
+    # ENTRY itself is in SEEN, along with the other entries.
+    seen.discard(id(entry))
+    
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, basestring):
+            continue
+        elif isinstance(obj, dict):
+            pending.extend(obj.iterkeys())
+            pending.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple)):
+            pending.extend(obj)
+
+        if hasattr(obj, '__dict__'):
+            pending.append(obj.__dict__)
+            
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(obj, name):
+                    pending.append(getattr(obj, name))
+
+    return size
+
+def benchmark_memory(size):
+    """Report the memory used per entry by glossaries of SIZE concepts
+    and SIZE acronyms, both right after parsing and after all the
+    generated fields have been set up.
+    """
+    for context in ['CONCEPTS', 'ACRONYMS']:
+        text = generate_glossary(size, counts={context: size})
+        
+        index = Index.from_string(text)
+        index.generate_reference_index()
+        
+        for label in ['parsed', 'materialized']:
+            if label == 'materialized':
+                str(index)
+                
+            # Objects shared by several entries are only counted once.
+            seen = set([id(index), id(index._parents), id(index._depths),
+                        id(index._child_offsets), id(index._children)])
+            seen.update(id(entry) for entry in index)
+            deep = sum(get_deep_size(entry, seen) for entry in index)
+            
+            print '%-8s %-12s %7d entries %7.0f bytes/entry' \
+                  % (context.lower(), label, len(index),
+                     (float(deep) / len(index)))
+
+        del index
+
+def generate_auxiliary(size, seed=1):
+    """Return the text of a synthetic .aux file with SIZE InTeX records,
+    interleaved with the other kinds of lines LaTeX writes.
+    """
+    generator = random.Random(seed)
+    lines = ['\\relax']
+
+    for k in xrange(size):
+        key = '%s %s c%d' % (generator.choice(WORDS),
+                             generator.choice(WORDS), (k % 5000))
+        if (k % 10) == 0:
+            key = '{\\em %s}|textbf' % (key)
+        lines.append('\\@writefile{raw}{\\indexentry{%s}{%d}}'
+                     % (key, (k // 20 + 1)))
+        
+        if (k % 4) == 0:
+            lines.append('\\newlabel{sec:%d}{{%d.%d}{%d}}'
+                         % (k, (k // 400), (k % 400), (k // 20 + 1)))
+            lines.append('\\@writefile{toc}{\\contentsline {section}'
+                         '{\\numberline {%d.%d}%s}{%d}}'
+                         % ((k // 400), (k % 400), key, (k // 20 + 1)))
+
+    return '\n'.join(lines) + '\n'
+
+def benchmark_auxiliary(size):
+    """Compare the throughput of the .aux scanner with that of the
+    line-by-line scanner it replaced, on a synthetic .aux file with 20
+    times SIZE records.
+    """
+    text = generate_auxiliary(20 * size)
+    
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'document.aux')
+        stream = open(filename, 'wb')
+        stream.write(text)
+        stream.close()
+
+        for label, scan in [('line-by-line', get_auxiliary_entries),
+                            ('memory-mapped', scan_auxiliary)]:
+            start = time.time()
+            for result in scan(filename):
+                pass
+            report(label, (time.time() - start), text.count('\n'),
+                   len(text))
+    finally:
+        shutil.rmtree(directory)
+
+def generate_book(directory, index, size, chapters=50, seed=1):
+    """Write the .aux files of a synthetic book of CHAPTERS chapters,
+    with SIZE references in total to the entries of INDEX (and a few
+    unknown keys), to DIRECTORY.  Return the name of the main file.
+    """
+    generator = random.Random(seed)
+    phrases = sorted(phrase.encode('utf-8') for phrase in index.references
+                     if '{' not in phrase and '\\' not in phrase)
+    
+    main = ['\\relax']
+    
+    for chapter in xrange(chapters):
+        filename = os.path.join(directory, 'chapter%d.aux' % (chapter))
+        main.append('\\@input{%s}' % (filename))
+        
+        lines = ['\\relax']
+        for k in xrange(size // chapters):
+            page = chapter * 20 + k * 20 // (size // chapters) + 1
+            if (k % 100) == 0:
+                key = 'unknown key %d' % (k)
+            else:
+                key = generator.choice(phrases)
+            lines.append('\\@writefile{raw}{\\indexentry{%s}{%d}}'
+                         % (key, page))
+            if (k % 4) == 0:
+                lines.append('\\newlabel{sec:%d.%d}{{%d.%d}{%d}}'
+                             % (chapter, k, chapter, k, page))
+
+        stream = open(filename, 'w')
+        stream.write('\n'.join(lines) + '\n')
+        stream.close()
+
+    filename = os.path.join(directory, 'book.aux')
+    stream = open(filename, 'w')
+    stream.write('\n'.join(main) + '\n')
+    stream.close()
+
+    return filename
+
+def benchmark_chapters(size, chapters=50):
+    """Compare interpreting the .aux files of a book of CHAPTERS
+    chapters, with 2 * SIZE references to a glossary of SIZE / 10
+    concepts, with 1, 2, and 4 worker processes.
+    """
+    index = Index.from_string(generate_glossary(size // 10))
+    index.generate_reference_index()
+    
+    directory = tempfile.mkdtemp()
+    try:
+        filename = generate_book(directory, index, (2 * size), chapters)
+
+        # Set up the lookup of unknown keys, and the (lazily computed)
+        # output of the entries, before the timing.
+        index.interpret_auxiliary(filename, StringIO(), StringIO())
+
+        expected = None
+        for jobs in [1, 2, 4]:
+            internal_file, index_file = StringIO(), StringIO()
+            
+            start = time.time()
+            index.interpret_auxiliary(filename, internal_file, index_file,
+                                      jobs=jobs)
+            seconds = time.time() - start
+
+            # The output must not depend on the number of workers.
+            result = (internal_file.getvalue(), index_file.getvalue())
+            if expected is None:
+                expected, serial = result, seconds
+            assert result == expected
+
+            print '%d job(s) %8.3f s  (speedup %.2f)' \
+                  % (jobs, seconds, (serial / seconds))
+    finally:
+        shutil.rmtree(directory)
+
+def benchmark_chapter_cache(size, chapters=50):
+    """Compare resolving the references of a book of CHAPTERS chapters
+    (see benchmark_chapters()) without a cache, with a cold cache, with
+    all the chapters cached, and after one of the chapters was edited.
+    """
+    index = Index.from_string(generate_glossary(size // 10))
+    index.generate_reference_index()
+    
+    directory = tempfile.mkdtemp()
+    try:
+        filename = generate_book(directory, index, (2 * size), chapters)
+        cache = IndexCache(os.path.join(directory, 'cache'))
+
+        # Set up the lookup of unknown keys before the timing.
+        index.resolve_reference('unknown key')
+
+        for label, cache, edit in [('no cache', None, False),
+                                   ('cold cache', cache, False),
+                                   ('all chapters cached', cache, False),
+                                   ('one chapter edited', cache, True)]:
+            if edit:
+                stream = open(os.path.join(directory, 'chapter0.aux'), 'a')
+                stream.write('\\@writefile{raw}{\\indexentry{edit}{1}}\n')
+                stream.close()
+                
+            start = time.time()
+            records = list(resolve_auxiliary(index, filename, 1, cache))
+            seconds = time.time() - start
+
+            assert records == list(resolve_auxiliary(index, filename))
+
+            print '%-28s %8.3f s' % (label, seconds)
+    finally:
+        shutil.rmtree(directory)
+
+def write_book(source, target, delay):
+    """Copy the .aux files of the book in the directory SOURCE (see
+    generate_book()) to TARGET as LaTeX writes them, a chapter at a
+    time, pausing for DELAY seconds after every 100 lines.
+    """
+    main = open(os.path.join(target, 'book.aux'), 'w')
+    
+    for line in open(os.path.join(source, 'book.aux')):
+        line = line.replace(source, target)
+        main.write(line)
+        main.flush()
+        
+        if line.startswith(INPUT_MARKER):
+            filename = line[len(INPUT_MARKER):].rstrip()[:-1]
+            chapter = open(filename.replace(target, source))
+            stream = open(filename, 'w')
+            for i, line in enumerate(chapter):
+                stream.write(line)
+                if (i % 100) == 99:
+                    stream.flush()
+                    time.sleep(delay)
+            stream.close()
+
+    main.close()
+    
+def benchmark_follow(size, chapters=50, delay=0.005):
+    """Compare how long it takes to interpret the .aux files of a book
+    of CHAPTERS chapters (see benchmark_chapters()) after LaTeX is done
+    writing them (simulated by write_book()), when they are read
+    afterwards and when they are followed as they are written.
+    """
+    index = Index.from_string(generate_glossary(size // 10))
+    index.generate_reference_index()
+    
+    directory = tempfile.mkdtemp()
+    try:
+        source = os.path.join(directory, 'source')
+        os.mkdir(source)
+        generate_book(source, index, (2 * size), chapters)
+
+        # Set up the lookup of unknown keys, and the output of the
+        # entries, before the timing.
+        index.interpret_auxiliary(os.path.join(source, 'book.aux'),
+                                  StringIO(), StringIO())
+
+        outputs = []
+        for follow in [False, True]:
+            target = os.path.join(directory, 'target%d' % (follow))
+            os.mkdir(target)
+            filename = os.path.join(target, 'book.aux')
+            internal_file, index_file = StringIO(), StringIO()
+
+            start = time.time()
+            latex = multiprocessing.Process(target=write_book,
+                                            args=(source, target, delay))
+            latex.start()
+            
+            if follow:
+                records = follow_auxiliary(filename,
+                                           lambda: not latex.is_alive(),
+                                           start)
+            else:
+                latex.join()
+                records = None
+
+            index.interpret_auxiliary(filename, internal_file, index_file,
+                                      records=records)
+            seconds = time.time() - start
+            latex.join()
+
+            # The time LaTeX was done is when it last wrote the file.
+            print '%-28s %8.3f s  (%.3f s after LaTeX)' \
+                  % (['afterwards', 'following'][follow], seconds,
+                     (start + seconds - os.path.getmtime(filename)))
+            
+            outputs.append((internal_file.getvalue(), index_file.getvalue()))
+
+        assert outputs[0] == outputs[1]
+    finally:
+        shutil.rmtree(directory)
+
+_benchmarks = {
+    'auxiliary': benchmark_auxiliary,
+    'chapter-cache': benchmark_chapter_cache,
+    'chapters': benchmark_chapters,
+    'follow': benchmark_follow,
+    'incremental': benchmark_incremental,
+    'jobs': benchmark_jobs,
+    'memory': benchmark_memory,
+    'paren': benchmark_paren,
+    'subentries': benchmark_subentries,
+    'suggestions': benchmark_suggestions,
+    'lexer': benchmark_lexer,
+    }
+
+def main():
+    """Module mainline (for standalone execution).
+    """
+    parser = optparse.OptionParser(usage='%prog [options] <benchmark> ...')
+    parser.add_option('-n', '--size', dest='size', type='int', default=50000,
+                      help='the number of concepts in the synthetic ' \
+                      'glossary (default: %default)')
+    options, args = parser.parse_args()
+
+    for name in (args or sorted(_benchmarks)):
+        print '%s:' % (name)
+        _benchmarks[name](options.size)
+
+if __name__ == "__main__":
+    main()